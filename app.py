@@ -1,7 +1,7 @@
-from flask import Flask, request, jsonify, render_template, send_file
+from flask import Flask, request, jsonify, render_template, send_file, Response, stream_with_context, g
 from flask_cors import CORS
 import qrcode
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 import io
 import base64
 import json
@@ -10,27 +10,95 @@ import secrets
 import numpy as np
 import hashlib
 import math
+import tempfile
+import time
+import feature_engine
+import batch
+import metrics
+import png_encoder
+import qr_render
+from media_types import VECTOR_FORMATS
+from render_cache import RenderCache, make_key
+# job_queue, pattern_detector and vector_render serve few requests and are
+# imported where they are used, keeping worker boot fast (see test_startup)
 
 VERSION = "1.2.1"
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-def generate_pattern_points(security_code, width, height, spacing):
-    """Generate pattern points based on security code"""
-    # Use security code to seed the pattern
+# Security feature renderers: 'numpy' is the array-backed engine, 'reference'
+# is the original per-pixel implementation kept for comparison.
+FEATURE_ENGINES = ('numpy', 'reference')
+DEFAULT_FEATURE_ENGINE = os.environ.get('QR_FEATURE_ENGINE', 'numpy')
+
+# Mode of rendered secure codes. All output is greyscale, so 'L' keeps one byte
+# per pixel from rasterizing to encoding; 'RGBA' restores the previous output.
+DEFAULT_RENDER_MODE = os.environ.get('QR_RENDER_MODE', 'L')
+GREY_MODES = ('1', 'L')
+
+# PNG encoding profile used when a request does not pick one (see png_encoder)
+DEFAULT_PNG_PROFILE = os.environ.get('QR_PNG_PROFILE', 'default')
+
+# Binary response types offered alongside JSON (see _preferred_binary)
+PNG_MIMETYPE = 'image/png'
+MULTIPART_MIXED = 'multipart/mixed'
+
+# Rendered PNGs are deterministic for their inputs, so keep recent ones around.
+# QR_CACHE_DIR adds a disk tier shared by all workers on the host.
+render_cache = RenderCache(
+    max_bytes=int(os.environ.get('QR_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+    disk_dir=os.environ.get('QR_CACHE_DIR') or None,
+    disk_max_bytes=int(os.environ['QR_CACHE_DISK_MAX_BYTES']) if os.environ.get('QR_CACHE_DISK_MAX_BYTES') else None,
+)
+
+# Base images already scanned for eligible pattern sites and density cells
+# (see feature_engine.prepare), keyed by payload or upload digest. A new
+# security code or feature set is then stamped without re-encoding or re-scanning.
+canvas_cache = RenderCache(
+    max_bytes=int(os.environ.get('QR_CANVAS_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+    sizeof=feature_engine.canvas_nbytes,
+)
+
+def pattern_rng(security_code):
+    """Random generator seeded from the security code.
+
+    Each call gets its own generator, so concurrent requests never share or
+    disturb numpy's global random state.
+    """
     hash_obj = hashlib.sha256(security_code.encode())
     seed = int(hash_obj.hexdigest()[:8], 16)
-    np.random.seed(seed)
+    # RandomState replays the stream np.random.seed produced for existing codes
+    return np.random.RandomState(seed)
+
+def generate_pattern_points(security_code, width, height, spacing):
+    """Generate pattern points based on security code"""
+    xs = range(0, width, spacing)
+    ys = range(0, height, spacing)
+    # One draw per point, x-major; 60% chance of including each point
+    keep = pattern_rng(security_code).random_sample(len(xs) * len(ys)) > 0.4
+    return [(x, y) for (x, y), included in zip(((x, y) for x in xs for y in ys), keep) if included]
+
+def add_security_features(image, features, security_code, engine=None, mode=None):
+    """Add the selected security features to a QR image.
+
+    Greyscale images come back in DEFAULT_RENDER_MODE and anything else as
+    RGBA, unless ``mode`` picks 'L' or 'RGBA' explicitly.
+    """
+    engine = engine or DEFAULT_FEATURE_ENGINE
+    if mode is None:
+        mode = DEFAULT_RENDER_MODE if image.mode in GREY_MODES else 'RGBA'
+    if engine == 'numpy':
+        with metrics.stage('security_features'):
+            return feature_engine.render_features(image, features, security_code, mode)
+    if engine == 'reference':
+        with metrics.stage('security_features'):
+            image = _add_security_features_reference(image, features, security_code)
+            return image if mode == 'RGBA' else image.convert(mode)
+    raise ValueError(f"Unknown feature engine: {engine}")
+
+def _add_security_features_reference(image, features, security_code):
+    from PIL import ImageDraw
     
-    points = []
-    for x in range(0, width, spacing):
-        for y in range(0, height, spacing):
-            # Use security code to determine if this point should be included
-            if np.random.random() > 0.4:  # 60% chance of including point
-                points.append((x, y))
-    return points
-
-def add_security_features(image, features, security_code):
     # Convert to RGBA for transparency support
     image = image.convert('RGBA')
     width, height = image.size
@@ -164,25 +232,199 @@ def add_security_features(image, features, security_code):
     
     return image
 
+def _secure_base_image(text):
+    # Generate QR code image (the module matrix is cached per payload)
+    with metrics.stage('qr_encode'):
+        return qr_render.make_image(
+            text,
+            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            version=1,
+            box_size=feature_engine.SECURE_BOX_SIZE,
+            border=feature_engine.SECURE_BORDER,
+            mode=DEFAULT_RENDER_MODE,
+        )
+
+def _prepared_canvas(key, load_image, mode=None):
+    """Return the cached canvas for ``key``, preparing ``load_image()`` on a miss"""
+    def prepare():
+        image = load_image()
+        canvas_mode = mode or (DEFAULT_RENDER_MODE if image.mode in GREY_MODES else 'RGBA')
+        with metrics.stage('prepare_canvas'):
+            return feature_engine.prepare(image, canvas_mode)
+    return canvas_cache.get_or_render(key, prepare)
+
 def create_secure_qr(text, security_code):
     """Create a QR code with security features"""
-    # Generate QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(text)
-    qr.make(fit=True)
+    features = ['micropattern', 'density']
+    if DEFAULT_FEATURE_ENGINE != 'numpy':
+        return add_security_features(_secure_base_image(text), features, security_code)
+    
+    # Restamp the cached base for this payload
+    canvas = _prepared_canvas(make_key('secure_base', text, DEFAULT_RENDER_MODE), lambda: _secure_base_image(text),
+                              DEFAULT_RENDER_MODE)
+    with metrics.stage('security_features'):
+        return feature_engine.stamp(canvas, features, security_code)
+
+def _encode_png(img, profile=None):
+    """Encode with a PNG profile and record its time and size"""
+    with metrics.stage('png_save'):
+        encoded = png_encoder.encode(img, profile or DEFAULT_PNG_PROFILE)
+    metrics.observe_png(encoded.profile, encoded.size)
+    return encoded
+
+def _png_profile(params):
+    """Read the PNG profile from the query string or request parameters"""
+    profile = request.args.get('png') or params.get('png_profile') or DEFAULT_PNG_PROFILE
+    if profile not in png_encoder.PROFILES:
+        raise ValueError(f"Unknown PNG profile: {profile}")
+    return profile
+
+def _png_report(encoded):
+    return {'profile': encoded.profile, 'mode': encoded.mode, 'bytes': encoded.size,
+            'encode_ms': round(encoded.encode_ms, 3)}
+
+def _png_headers(profile, png, encoded=None):
+    headers = {'X-PNG-Profile': profile, 'X-PNG-Bytes': str(len(png))}
+    if encoded is not None:
+        headers['X-PNG-Encode-Ms'] = f'{encoded.encode_ms:.3f}'
+    return headers
+
+def _preferred_binary(*mimetypes):
+    """Return the binary mimetype the client's Accept header prefers over JSON.
+
+    JSON is listed first, so clients sending no Accept header or ``*/*`` (the
+    web page and the mobile app) keep getting JSON.
+    """
+    best = request.accept_mimetypes.best_match(('application/json',) + mimetypes)
+    return best if best in mimetypes else None
+
+def _multipart_response(parts, headers=None):
+    """Build a multipart/mixed response with one PNG part per (name, bytes) pair"""
+    boundary = secrets.token_hex(16)
+    chunks = []
+    for name, png in parts:
+        chunks.append(
+            f'--{boundary}\r\n'
+            f'Content-Type: {PNG_MIMETYPE}\r\n'
+            f'Content-Disposition: inline; name="{name}"; filename="{name}.png"\r\n'
+            f'Content-Length: {len(png)}\r\n\r\n'.encode()
+        )
+        chunks.append(png)
+        chunks.append(b'\r\n')
+    chunks.append(f'--{boundary}--\r\n'.encode())
+    return Response(b''.join(chunks), mimetype=f'{MULTIPART_MIXED}; boundary={boundary}', headers=headers)
+
+def _request_image():
+    """Return the uploaded image bytes and the request's parameters.
+
+    Images arrive as a raw ``image/*`` body (parameters in the query string),
+    as an ``image`` file in a multipart form (parameters as form fields), or
+    base64-encoded in a JSON body.
+    """
+    if request.mimetype.startswith('image/'):
+        return request.get_data(), request.args
+    if 'image' in request.files:
+        params = request.form.to_dict()
+        params.update(request.args.to_dict())
+        return request.files['image'].read(), params
+    data = request.get_json(silent=True) or {}
+    image = data.get('image', '')
+    return (base64.b64decode(image) if image else b''), data
+
+def _list_param(params, name):
+    """Read a list parameter given as a JSON list or a comma-separated string"""
+    value = params.get(name, [])
+    if isinstance(value, str):
+        return [item for item in value.split(',') if item]
+    return value
+
+def render_secure_qr_png(text, security_code, png_profile=None):
+    """Render a secure QR code and return its PNG bytes, reusing cached renders"""
+    png_profile = png_profile or DEFAULT_PNG_PROFILE
+    key = make_key('secure_qr', VERSION, text, security_code, png_profile, DEFAULT_RENDER_MODE)
+    return render_cache.get_or_render(key, lambda: _encode_png(create_secure_qr(text, security_code), png_profile).data)
+
+def render_secure_qr_vector(text, security_code, vector_format='svg', size_mm=None):
+    """Render a secure QR code as an SVG or PDF document of the given physical size"""
+    import vector_render
     
-    # Create QR code image
-    img = qr.make_image(fill_color="black", back_color="white")
+    size_mm = vector_render.PRINT_SIZE_MM if size_mm is None else size_mm
+    key = make_key('secure_qr_vector', VERSION, text, security_code, vector_format, size_mm)
     
-    # Add security features
-    img = add_security_features(img, ['micropattern', 'density'], security_code)
+    def render():
+        with metrics.stage('vectorize'):
+            label = vector_render.vectorize(create_secure_qr(text, security_code))
+            if vector_format == 'pdf':
+                return vector_render.to_pdf(label, size_mm)
+            return vector_render.to_svg(label, size_mm)
     
-    return img
+    return render_cache.get_or_render(key, render)
+
+def generate_batch(jobs, output_format='zip', png_profile=None):
+    """Lazily render (text, security_code) jobs, yielding ZIP or NDJSON chunks"""
+    if output_format not in batch.STREAM_FORMATS:
+        raise ValueError(f"Unknown batch format: {output_format}")
+    stream, _ = batch.STREAM_FORMATS[output_format]
+    return stream(batch.render_jobs(jobs, lambda text, code: render_secure_qr_png(text, code, png_profile)))
+
+# QR_WARMUP=1 makes each worker call warm_up before it accepts requests
+# (see gunicorn.conf.py and asgi.py)
+WARM_UP = os.environ.get('QR_WARMUP', '0') == '1'
+
+def warm_up():
+    """Render and encode one secure code so the first real request skips one-time setup.
+
+    The first render in a process loads PIL's PNG plugin, builds the QR
+    encoder's tables and fills the feature-engine layout caches that are
+    otherwise built lazily.
+    """
+    _encode_png(create_secure_qr('warm-up', '000000'))
+
+# Batches submitted to /jobs are spooled to QR_JOB_DIR and rendered by
+# QR_JOB_WORKERS background threads per process (see job_queue)
+JOB_DIR = os.environ.get('QR_JOB_DIR') or os.path.join(tempfile.gettempdir(), 'secure_qr_jobs')
+JOB_WORKERS = int(os.environ.get('QR_JOB_WORKERS', 2))
+_job_queue = None
+
+def get_job_queue():
+    """Create the job queue and start its workers on first use"""
+    global _job_queue
+    if _job_queue is None:
+        import job_queue
+        _job_queue = job_queue.JobQueue(JOB_DIR, render_secure_qr_png, workers=JOB_WORKERS)
+        _job_queue.start()
+    return _job_queue
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request(endpoint, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text exposition of stage timings, request counts and cache statistics"""
+    gauges = {
+        f'qr_render_cache_{name}': (f'Render cache {name.replace("_", " ")}.', value)
+        for name, value in render_cache.stats().items()
+    }
+    for name, value in canvas_cache.stats().items():
+        if not name.startswith('disk_'):
+            gauges[f'qr_canvas_cache_{name}'] = (f'Prepared canvas cache {name.replace("_", " ")}.', value)
+    matrix = qr_render.encode.cache_info()
+    gauges['qr_matrix_cache_hits'] = ('QR matrix cache hits.', matrix.hits)
+    gauges['qr_matrix_cache_misses'] = ('QR matrix cache misses.', matrix.misses)
+    gauges['qr_matrix_cache_entries'] = ('QR matrices currently cached.', matrix.currsize)
+    if _job_queue is not None:
+        for status, count in _job_queue.counts().items():
+            gauges[f'qr_jobs_{status}'] = (f'Batch jobs currently {status}.', count)
+    return Response(metrics.render(gauges), content_type=metrics.CONTENT_TYPE)
 
 @app.route('/')
 def home():
@@ -194,6 +436,10 @@ def generate():
         data = request.json
         text = data.get('text', '')
         selected_features = data.get('features', [])
+        try:
+            png_profile = _png_profile(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Generate a security code that will be used for both QRs
         security_code = secrets.token_hex(3)[:6]  # 6 hex chars
@@ -202,52 +448,54 @@ def generate():
         combined_data = f"{text}|||{security_code}"
         print(f"Combined data: {combined_data}")  # Debug log
         
-        # Create standard QR (with security code but no features)
-        standard_qr = qrcode.QRCode(
-            version=None,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=8,
-            border=2,
-        )
-        standard_qr.add_data(combined_data)
-        standard_qr.make(fit=True)
-        standard_image = standard_qr.make_image(fill_color="black", back_color="white")
+        # Encode once; the standard and secure QRs share the same module matrix
+        with metrics.stage('qr_encode'):
+            standard_image = qr_render.make_image(
+                combined_data,
+                error_correction=qrcode.constants.ERROR_CORRECT_H,
+                box_size=8,
+                border=2,
+            )
         
-        # Convert standard QR to base64
-        standard_buffered = io.BytesIO()
-        standard_image.save(standard_buffered, format="PNG", quality=100)
-        standard_base64 = base64.b64encode(standard_buffered.getvalue()).decode('utf-8')
+        standard_png = _encode_png(standard_image, png_profile)
         
-        # Create secure QR (with security code AND features)
-        secure_qr = qrcode.QRCode(
-            version=None,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=8,
-            border=2,
-        )
-        secure_qr.add_data(combined_data)
-        secure_qr.make(fit=True)
-        secure_image = secure_qr.make_image(fill_color="black", back_color="white")
+        # Create secure QR (with security code AND features) from the same image;
+        # add_security_features works on a converted copy
+        secure_image = standard_image
         
         # Add security features only to secure QR
         if selected_features:
             secure_image = add_security_features(secure_image, selected_features, security_code)
         
-        # Convert secure QR to base64
-        secure_buffered = io.BytesIO()
-        secure_image.save(secure_buffered, format="PNG", quality=100)
-        secure_base64 = base64.b64encode(secure_buffered.getvalue()).decode('utf-8')
+        secure_png = _encode_png(secure_image, png_profile)
+        
+        headers = {'X-Security-Code': security_code, 'X-Features': ','.join(selected_features)}
+        binary = _preferred_binary(MULTIPART_MIXED, PNG_MIMETYPE)
+        if binary == MULTIPART_MIXED:
+            headers['X-PNG-Profile'] = png_profile
+            return _multipart_response([('standard', standard_png.data), ('secure', secure_png.data)], headers)
+        if binary == PNG_MIMETYPE:
+            png = standard_png if request.args.get('variant') == 'standard' else secure_png
+            headers.update(_png_headers(png_profile, png.data, png))
+            return Response(png.data, mimetype=PNG_MIMETYPE, headers=headers)
+        
+        # Convert both QRs to base64 for JSON clients
+        with metrics.stage('base64'):
+            standard_base64 = base64.b64encode(standard_png.data).decode('utf-8')
+            secure_base64 = base64.b64encode(secure_png.data).decode('utf-8')
         
         return jsonify({
             'standard': {
                 'image': standard_base64,
                 'security_code': security_code,
-                'features': []
+                'features': [],
+                'png': _png_report(standard_png)
             },
             'secure': {
                 'image': secure_base64,
                 'security_code': security_code,
-                'features': selected_features
+                'features': selected_features,
+                'png': _png_report(secure_png)
             }
         })
         
@@ -265,45 +513,277 @@ def generate_secure_qr():
     
     if not text or not security_code:
         return jsonify({'error': 'Missing text or security code'}), 400
+    try:
+        png_profile = _png_profile(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     try:
-        # Create QR code with security features
-        img = create_secure_qr(text, security_code)
+        # Create QR code with security features (served from cache on repeats)
+        binary = _preferred_binary(PNG_MIMETYPE, *VECTOR_FORMATS)
+        if binary in VECTOR_FORMATS:
+            size_mm = float(data['size_mm']) if 'size_mm' in data else None
+            document = render_secure_qr_vector(text, security_code, VECTOR_FORMATS[binary], size_mm)
+            return Response(document, mimetype=binary)
+        
+        png = render_secure_qr_png(text, security_code, png_profile)
+        headers = _png_headers(png_profile, png)
+        if binary == PNG_MIMETYPE:
+            return Response(png, mimetype=PNG_MIMETYPE, headers=headers)
         
         # Convert to base64
-        buffered = io.BytesIO()
-        img.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        with metrics.stage('base64'):
+            img_str = base64.b64encode(png).decode()
         
-        return jsonify({'image': img_str})
+        return jsonify({'image': img_str}), 200, headers
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/add_security_features', methods=['POST'])
 def add_security_features_api():
-    data = request.json
-    image = data.get('image', '')
-    features = data.get('features', [])
-    security_code = data.get('security_code', '')
-    
-    if not image or not features or not security_code:
-        return jsonify({'error': 'Missing image, features, or security code'}), 400
-    
+    """Stamp security features on an uploaded image.
+
+    The image is a raw ``image/*`` body, a multipart ``image`` file or base64 in
+    JSON; ``features`` may be a list or a comma-separated string.
+    """
     try:
-        # Load image from base64
-        img = Image.open(io.BytesIO(base64.b64decode(image)))
+        image_bytes, params = _request_image()
+        features = _list_param(params, 'features')
+        security_code = params.get('security_code', '')
         
-        # Add security features
-        img = add_security_features(img, features, security_code)
+        if not image_bytes or not features or not security_code:
+            return jsonify({'error': 'Missing image, features, or security code'}), 400
+        try:
+            png_profile = _png_profile(params)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Convert to base64
-        buffered = io.BytesIO()
-        img.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        
+        def render():
+            load = lambda: Image.open(io.BytesIO(image_bytes))
+            if DEFAULT_FEATURE_ENGINE != 'numpy':
+                return _encode_png(add_security_features(load(), features, security_code), png_profile).data
+            # Uploads are decoded and scanned once; other codes and features reuse the canvas
+            canvas = _prepared_canvas(make_key('upload', digest, DEFAULT_RENDER_MODE), load)
+            with metrics.stage('security_features'):
+                image = feature_engine.stamp(canvas, features, security_code)
+            return _encode_png(image, png_profile).data
+        
+        key = make_key('add_security_features', VERSION, digest, sorted(features),
+                       security_code, png_profile, DEFAULT_RENDER_MODE)
+        png = render_cache.get_or_render(key, render)
+        headers = _png_headers(png_profile, png)
+        if _preferred_binary(PNG_MIMETYPE):
+            return Response(png, mimetype=PNG_MIMETYPE, headers=headers)
+        
+        return jsonify({'image': base64.b64encode(png).decode()}), 200, headers
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/detect_pattern', methods=['POST'])
+def detect_pattern_api():
+    """Report the cross-pattern style, rotation and intensity found on an image.
+
+    When ``security_code`` is given the response also says whether the pattern
+    matches the one that code renders.
+    """
+    try:
+        image_bytes, params = _request_image()
+        security_code = params.get('security_code', '')
+        
+        if not image_bytes:
+            return jsonify({'error': 'Missing image'}), 400
+        
+        import pattern_detector
+        img = Image.open(io.BytesIO(image_bytes))
+        detection = pattern_detector.detect_pattern(img)
+        result = detection.to_dict()
+        if security_code:
+            result['verified'] = detection.matches(security_code)
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Scans with more pixels than this are decoded at a reduced scale when the
+# format allows it (JPEG) and refused otherwise
+VERIFY_MAX_PIXELS = int(os.environ.get('QR_VERIFY_MAX_PIXELS', 16 * 1024 * 1024))
+VERIFY_FEATURES = ('micropattern', 'density')
+JPEG_SCALES = (1, 2, 4, 8)  # Reductions libjpeg can apply while decoding
+
+def parse_payload(data):
+    """Split a scanned ``text|||security_code`` payload; the code is empty when missing"""
+    text, separator, security_code = data.partition('|||')
+    return text, security_code if separator else ''
+
+def is_security_code(value):
+    return len(value) == 6 and all(c in '0123456789abcdefABCDEF' for c in value)
+
+def load_scan(image_bytes, max_pixels=VERIFY_MAX_PIXELS):
+    """Decode an uploaded scan to greyscale, or return None when it is too large.
+
+    JPEG scans are decoded straight to one channel, and oversized ones at the
+    smallest DCT reduction that fits, so phone photos never expand to full RGB.
+    """
+    with metrics.stage('decode'):
+        img = Image.open(io.BytesIO(image_bytes))
+        width, height = img.size
+        scale = next((scale for scale in JPEG_SCALES if (width // scale) * (height // scale) <= max_pixels),
+                     JPEG_SCALES[-1])
+        img.draft('L', (width // scale, height // scale))
+        if img.width * img.height > max_pixels:
+            return None
+        return img.convert('L')
+
+@app.route('/verify', methods=['POST'])
+def verify():
+    """Check an uploaded scan for the security features its QR payload promises.
+
+    The scan is a raw ``image/jpeg`` or ``image/png`` body (parameters in the
+    query string), a multipart ``image`` file or base64 in JSON. ``data`` is
+    the scanned ``text|||security_code`` payload; ``features`` lists the
+    features that must be found (default: micropattern and density).
+    """
+    started = time.perf_counter()
+    try:
+        image_bytes, params = _request_image()
+        payload = params.get('data', '')
+        features = _list_param(params, 'features') or list(VERIFY_FEATURES)
         
-        return jsonify({'image': img_str})
+        if not image_bytes or not payload:
+            return jsonify({'error': 'Missing image or data'}), 400
+        unknown = [feature for feature in features if feature not in VERIFY_FEATURES]
+        if unknown:
+            return jsonify({'error': f"Unknown features: {', '.join(unknown)}"}), 400
+        
+        text, security_code = parse_payload(payload)
+        valid_code = is_security_code(security_code)
+        detected = dict.fromkeys(features, False)
+        if valid_code:
+            try:
+                grey = load_scan(image_bytes, VERIFY_MAX_PIXELS)
+            except OSError:  # not an image, or a truncated one
+                return jsonify({'error': 'Unreadable image'}), 400
+            if grey is None:
+                return jsonify({'error': f'Image exceeds {VERIFY_MAX_PIXELS} pixels'}), 413
+            import pattern_detector
+            with metrics.stage('verify'):
+                grey = pattern_detector.normalize_scan(grey)
+                if 'micropattern' in detected:
+                    detected['micropattern'] = pattern_detector.detect_pattern(grey).matches(security_code)
+                if 'density' in detected:
+                    detected['density'] = pattern_detector.detect_density(grey, security_code).matches()
+        
+        return jsonify({
+            'authentic': valid_code and all(detected.values()),
+            'text': text,
+            'valid_code': valid_code,
+            'detected': detected,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/cache_stats')
+def cache_stats():
+    return jsonify(render_cache.stats())
+
+def _batch_request():
+    """Read (jobs, format, png_profile) from a JSON or ``text/csv`` batch body.
+
+    CSV jobs are read lazily from the request stream. Raises ValueError
+    (including BatchJobError) for a malformed request.
+    """
+    data = {}
+    if request.mimetype == 'text/csv':
+        output_format = request.args.get('format', 'zip')
+        jobs = batch.read_jobs_csv(io.TextIOWrapper(request.stream, encoding='utf-8', newline=''))
+    else:
+        data = request.get_json(silent=True) or {}
+        output_format = data.get('format', request.args.get('format', 'zip'))
+        if not data.get('jobs'):
+            raise ValueError('Missing jobs')
+        jobs = list(batch.read_jobs_json(data['jobs']))
+
+    if output_format not in batch.STREAM_FORMATS:
+        raise ValueError(f'Unknown format: {output_format}')
+    return jobs, output_format, _png_profile(data)
+
+@app.route('/generate_batch', methods=['POST'])
+def generate_batch_api():
+    """Stream a batch of secure QR codes as a ZIP of PNGs or NDJSON.
+
+    Jobs come either as a JSON body ``{"jobs": [...], "format": "zip"}`` or as a
+    ``text/csv`` body of ``text,security_code`` rows with ``?format=`` in the query.
+    """
+    try:
+        jobs, output_format, png_profile = _batch_request()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    _, mimetype = batch.STREAM_FORMATS[output_format]
+
+    headers = {'X-PNG-Profile': png_profile}
+    if output_format == 'zip':
+        headers['Content-Disposition'] = 'attachment; filename=secure_qr_batch.zip'
+    return Response(stream_with_context(generate_batch(jobs, output_format, png_profile)), mimetype=mimetype,
+                    headers=headers)
+
+def _job_json(job):
+    result = {
+        'job_id': job.id,
+        'status': job.status,
+        'format': job.output_format,
+        'total': job.total,
+        'done': job.done,
+        'failed': job.failed,
+        'progress': round(job.done / job.total, 4),
+        'created': job.created,
+        'started': job.started,
+        'finished': job.finished,
+        'status_url': f'/jobs/{job.id}',
+    }
+    if job.status == 'finished':
+        result['result_url'] = f'/jobs/{job.id}/result'
+        result['result_bytes'] = job.result_bytes
+    if job.error:
+        result['error'] = job.error
+    return result
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a batch for background rendering; takes the same bodies as /generate_batch"""
+    try:
+        jobs, output_format, png_profile = _batch_request()
+        job = get_job_queue().submit(jobs, output_format, png_profile)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(_job_json(job)), 202, {'Location': f'/jobs/{job.id}'}
+
+@app.route('/jobs/<job_id>', methods=['GET', 'DELETE'])
+def job_status(job_id):
+    """Report a job's progress, or delete it with its files"""
+    queue = get_job_queue()
+    if request.method == 'DELETE':
+        if not queue.delete(job_id):
+            return jsonify({'error': 'Unknown job'}), 404
+        return jsonify({'job_id': job_id, 'deleted': True})
+    job = queue.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(_job_json(job))
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """Download a finished job's ZIP or NDJSON output"""
+    queue = get_job_queue()
+    job = queue.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job.status != 'finished':
+        return jsonify({'error': f'Job is {job.status}', 'status': job.status}), 409
+    _, mimetype = batch.STREAM_FORMATS[job.output_format]
+    return send_file(queue.result_path(job.id, job.output_format), mimetype=mimetype, as_attachment=True,
+                     download_name=f'secure_qr_batch_{job.id}.{job.output_format}')
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000, host='0.0.0.0')
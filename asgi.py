@@ -0,0 +1,327 @@
+"""ASGI entry point serving the Flask app with rendering offloaded to a process pool.
+
+    uvicorn asgi:app --workers 2
+
+Request bodies are read and responses sent asynchronously, so a slow upload
+or a long streamed batch does not hold a worker. The Flask handlers in app.py
+stay the single implementation of every endpoint. They run in one of two
+places:
+- Rendering routes (``RENDER_ROUTES``) run in a bounded process pool, so
+  CPU-heavy requests neither block the event loop nor contend for the GIL.
+  When every process is busy and ``QR_ASGI_QUEUE`` more requests are already
+  waiting, new rendering requests get ``429 Too Many Requests`` straight away.
+  If a rendering process dies, the requests it took down get ``503 Service
+  Unavailable`` and the next one starts a fresh pool.
+- Everything else (pages, /metrics, /jobs, streamed /generate_batch) runs on
+  a thread pool in this process, and streamed responses are sent chunk by
+  chunk as the handler produces them.
+
+Limits come from the environment:
+- ``QR_ASGI_PROCESSES``: rendering processes (default: CPU count)
+- ``QR_ASGI_QUEUE``: rendering requests allowed to wait for a process (default: 2 per process)
+- ``QR_ASGI_THREADS``: threads for the other routes (default 8)
+- ``QR_ASGI_MAX_BODY``: largest accepted request body in bytes (default 16 MiB)
+
+With ``QR_WARMUP=1`` startup waits until this process and every rendering
+process have run app.warm_up.
+
+Each rendering process keeps its own render cache and stage timings. Set
+``QR_CACHE_DIR`` to share rendered PNGs between them. /metrics counts every
+request, including rejected ones, but only reports stage timings from this
+process.
+"""
+import asyncio
+import contextvars
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import app as web
+import metrics
+
+RENDER_ROUTES = frozenset(('/generate', '/generate_secure_qr', '/add_security_features', '/detect_pattern', '/verify'))
+
+DEFAULT_THREADS = 8
+DEFAULT_QUEUE_PER_PROCESS = 2
+DEFAULT_MAX_BODY = 16 * 1024 * 1024
+RETRY_AFTER_SECONDS = 1
+CHUNK_SIZE = 64 * 1024
+
+Headers = List[Tuple[str, str]]
+
+
+def wsgi_environ(scope: Dict, body: bytes) -> Dict:
+    """Build a picklable WSGI environ, without the stream entries, from an ASGI HTTP scope"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def call_wsgi(wsgi_app, environ: Dict, body: bytes) -> Tuple[int, Headers, Iterable[bytes]]:
+    """Run a WSGI app and return (status code, headers, body iterable)"""
+    environ = dict(environ, **{
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.version': (1, 0),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    })
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and started:
+            raise exc_info[1].with_traceback(exc_info[2])
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = list(headers)
+
+    iterable = wsgi_app(environ, start_response)
+    if not started:
+        # start_response may be deferred until the first chunk is produced
+        iterator = iter(iterable)
+        iterable = _Chained(next(iterator, b''), iterator, getattr(iterable, 'close', None))
+    return started['status'], started['headers'], iterable
+
+
+class _Chained:
+    """Body iterable that replays a chunk taken early, keeping the original close()"""
+
+    def __init__(self, first, rest, close):
+        self._first, self._rest, self._close = first, rest, close
+
+    def __iter__(self):
+        yield self._first
+        yield from self._rest
+
+    def close(self):
+        if self._close is not None:
+            self._close()
+
+
+def _render_in_worker(environ: Dict, body: bytes) -> Tuple[int, Headers, bytes]:
+    """Process-pool entry: run one request through the Flask app and buffer its response"""
+    status, headers, iterable = call_wsgi(web.app, environ, body)
+    try:
+        return status, headers, b''.join(iterable)
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+
+
+class Overloaded(Exception):
+    """Raised when the rendering pool and its queue are full"""
+
+
+class RenderPool:
+    """Process pool that admits at most ``processes + queue`` requests at once"""
+
+    def __init__(self, processes: int, queue: int, initializer: Optional[Callable[[], None]] = None):
+        self.processes = processes
+        self.capacity = processes + queue
+        self.initializer = initializer
+        self.pending = 0
+        self.rejected = 0
+        self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned, not forked: the event loop process already runs threads
+            self._executor = ProcessPoolExecutor(max_workers=self.processes, initializer=self.initializer,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    async def start(self):
+        """Start the processes now instead of on the first requests"""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        await asyncio.gather(*(loop.run_in_executor(executor, os.getpid) for _ in range(self.processes)))
+
+    async def run(self, fn, *args):
+        if self.pending >= self.capacity:
+            self.rejected += 1
+            raise Overloaded()
+        executor = self._get_executor()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            # A process died; drop the pool so the next request spawns a new one
+            if self._executor is executor:
+                self._executor = None
+                executor.shutdown(wait=False)
+            raise
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            if sys.version_info >= (3, 9):
+                self._executor.shutdown(cancel_futures=True)
+            else:
+                self._executor.shutdown()
+            self._executor = None
+
+
+class ASGIApp:
+    """ASGI application dispatching requests to a WSGI app on processes or threads"""
+
+    def __init__(self, wsgi_app, processes: Optional[int] = None, queue: Optional[int] = None,
+                 threads: int = DEFAULT_THREADS, max_body: int = DEFAULT_MAX_BODY,
+                 render_routes: Iterable[str] = RENDER_ROUTES, warm_up: Optional[Callable[[], None]] = None):
+        """``warm_up`` runs in this process and in every rendering process during startup"""
+        processes = processes or os.cpu_count() or 1
+        self.wsgi_app = wsgi_app
+        self.warm_up = warm_up
+        self.pool = RenderPool(processes, DEFAULT_QUEUE_PER_PROCESS * processes if queue is None else queue, warm_up)
+        self.threads = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='qr-asgi')
+        self.max_body = max_body
+        self.render_routes = frozenset(render_routes)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.warm_up is not None:
+                    await asyncio.get_running_loop().run_in_executor(self.threads, self.warm_up)
+                    await self.pool.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def close(self):
+        self.pool.shutdown()
+        self.threads.shutdown(wait=False)
+
+    async def _read_body(self, receive) -> Optional[bytes]:
+        """Read the request body, or return None once it exceeds ``max_body``"""
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return b''.join(chunks)
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.max_body:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+    async def _http(self, scope, receive, send):
+        body = await self._read_body(receive)
+        if body is None:
+            await _send_json(send, 413, {'error': f'Request body exceeds {self.max_body} bytes'})
+            return
+        environ = wsgi_environ(scope, body)
+
+        if scope['method'] == 'POST' and scope['path'] in self.render_routes:
+            # The Flask request hooks record these in the rendering process, so
+            # count them here as well to keep this process's /metrics complete
+            started = time.perf_counter()
+            try:
+                status, headers, content = await self.pool.run(_render_in_worker, environ, body)
+            except Overloaded:
+                metrics.observe_request(scope['path'], 'POST', 429, time.perf_counter() - started)
+                await _send_json(send, 429, {'error': 'Too many rendering requests, retry later'},
+                                 [('Retry-After', str(RETRY_AFTER_SECONDS))])
+                return
+            except BrokenProcessPool:
+                metrics.observe_request(scope['path'], 'POST', 503, time.perf_counter() - started)
+                await _send_json(send, 503, {'error': 'Rendering process failed, retry later'},
+                                 [('Retry-After', str(RETRY_AFTER_SECONDS))])
+                return
+            metrics.observe_request(scope['path'], 'POST', status, time.perf_counter() - started)
+            await _send_start(send, status, headers)
+            for offset in range(0, len(content), CHUNK_SIZE):
+                await send({'type': 'http.response.body', 'body': content[offset:offset + CHUNK_SIZE],
+                            'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        # Streamed handlers keep Flask's request context in a context variable;
+        # running every step in one Context lets the steps hop between threads.
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        status, headers, iterable = await loop.run_in_executor(
+            self.threads, context.run, call_wsgi, self.wsgi_app, environ, body)
+        iterator = iter(iterable)
+        try:
+            await _send_start(send, status, headers)
+            while True:
+                chunk = await loop.run_in_executor(self.threads, context.run, next, iterator, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(iterable, 'close'):
+                await loop.run_in_executor(self.threads, context.run, iterable.close)
+
+
+async def _send_start(send, status: int, headers: Headers):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+
+
+async def _send_json(send, status: int, payload: Dict, headers: Headers = ()):
+    body = json.dumps(payload).encode()
+    await _send_start(send, status, [('Content-Type', 'application/json'), ('Content-Length', str(len(body)))]
+                      + list(headers))
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+app = ASGIApp(
+    web.app,
+    processes=_env_int('QR_ASGI_PROCESSES'),
+    queue=_env_int('QR_ASGI_QUEUE'),
+    threads=_env_int('QR_ASGI_THREADS') or DEFAULT_THREADS,
+    max_body=_env_int('QR_ASGI_MAX_BODY') or DEFAULT_MAX_BODY,
+    warm_up=web.warm_up if web.WARM_UP else None,
+)
@@ -0,0 +1,140 @@
+"""Streaming helpers for bulk secure QR generation.
+
+Jobs are (text, security_code) pairs read lazily from a JSON list, CSV
+lines or JSON lines, rendered one at a time and written out as either a ZIP
+of PNGs or NDJSON, so memory use stays flat regardless of batch size.
+"""
+import base64
+import csv
+import json
+import zipfile
+from collections import namedtuple
+
+BatchResult = namedtuple('BatchResult', 'index text security_code png error')
+
+CSV_HEADER = ['text', 'security_code']
+
+
+class BatchJobError(ValueError):
+    """Raised when a batch job description cannot be parsed"""
+
+
+def read_jobs_json(items):
+    """Yield (text, security_code) pairs from dicts or two-item lists"""
+    if not isinstance(items, list):
+        raise BatchJobError("Jobs must be a list")
+    for item in items:
+        if isinstance(item, dict):
+            yield item.get('text', ''), item.get('security_code', '')
+        elif isinstance(item, (list, tuple)) and len(item) == 2:
+            yield item[0], item[1]
+        else:
+            raise BatchJobError(f"Invalid job: {item!r}")
+
+
+def read_jobs_csv(lines):
+    """Yield (text, security_code) pairs from CSV lines, skipping an optional header row"""
+    for row_number, row in enumerate(csv.reader(lines)):
+        if not row:
+            continue
+        if row_number == 0 and [cell.strip().lower() for cell in row] == CSV_HEADER:
+            continue
+        if len(row) != 2:
+            raise BatchJobError(f"CSV row {row_number + 1} must have 2 columns")
+        yield row[0], row[1]
+
+
+def read_jobs_ndjson(lines):
+    """Yield (text, security_code) pairs from JSON lines holding dicts or two-item lists"""
+    for line_number, line in enumerate(lines):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            raise BatchJobError(f"Line {line_number + 1} is not valid JSON")
+        yield from read_jobs_json([item])
+
+
+def render_jobs(jobs, render):
+    """Lazily render jobs with ``render(text, security_code) -> png bytes``.
+
+    Invalid or failing jobs produce a result with ``error`` set instead of
+    aborting the whole batch. A job source that cannot be parsed any further
+    ends the batch with a final error result.
+    """
+    jobs = iter(jobs)
+    index = 0
+    while True:
+        try:
+            text, security_code = next(jobs)
+        except StopIteration:
+            return
+        except BatchJobError as e:
+            yield BatchResult(index, None, None, None, str(e))
+            return
+        if not text or not security_code:
+            yield BatchResult(index, text, security_code, None, 'Missing text or security code')
+        else:
+            try:
+                png = render(text, security_code)
+            except Exception as e:
+                yield BatchResult(index, text, security_code, None, str(e))
+            else:
+                yield BatchResult(index, text, security_code, png, None)
+        index += 1
+
+
+class _ChunkBuffer:
+    """Write-only, non-seekable sink that hands written bytes back in chunks"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(results):
+    """Yield a ZIP archive of PNGs chunk by chunk, one member per successful result.
+
+    Failed jobs are listed in a trailing ``errors.json`` member.
+    """
+    sink = _ChunkBuffer()
+    errors = []
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        for result in results:
+            if result.error:
+                errors.append({'index': result.index, 'security_code': result.security_code, 'error': result.error})
+                continue
+            archive.writestr(f"{result.index:06d}.png", result.png)
+            yield sink.drain()
+        if errors:
+            archive.writestr('errors.json', json.dumps(errors, indent=2))
+    yield sink.drain()
+
+
+def stream_ndjson(results):
+    """Yield one JSON line per result with the PNG base64 encoded"""
+    for result in results:
+        line = {'index': result.index, 'security_code': result.security_code}
+        if result.error:
+            line['error'] = result.error
+        else:
+            line['image'] = base64.b64encode(result.png).decode()
+        yield (json.dumps(line) + '\n').encode('utf-8')
+
+
+STREAM_FORMATS = {
+    'zip': (stream_zip, 'application/zip'),
+    'ndjson': (stream_ndjson, 'application/x-ndjson'),
+}
@@ -0,0 +1,181 @@
+"""Latency and throughput benchmarks for the QR generation hot paths.
+
+Every case is timed per call and reported as p50/p99 latency and images/sec.
+Results can be saved as a JSON baseline; a compare run re-measures the same
+cases and exits non-zero when any p50 regresses beyond the tolerance.
+
+    python benchmark.py run --output baseline.json
+    python benchmark.py compare baseline.json --tolerance 0.25
+    python benchmark.py run --filter add_security_features --quick
+
+Security codes change on every iteration so rendered-image caches miss, while
+QR matrices stay cached per payload as they do in a running server.
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import PIL
+import qrcode
+
+# Payloads chosen to land on small, medium and large QR versions
+PAYLOADS = {
+    'short': '12345',
+    'url': 'https://example.com/item/' + '0' * 40,
+    'long': 'x' * 300,
+}
+
+DEFAULT_ITERATIONS = 50
+QUICK_ITERATIONS = 5
+WARMUP_ITERATIONS = 2
+DEFAULT_TOLERANCE = 0.25  # Allowed relative p50 slowdown before a case counts as regressed
+
+
+def security_code(i: int) -> str:
+    return f"{(i * 2654435761) & 0xffffff:06x}"
+
+
+def _cases() -> Iterator[Tuple[str, Dict, Callable[[int], object]]]:
+    """Yield (name, metadata, call) for every benchmark case"""
+    import app as web
+    import png_encoder
+    import qr_render
+    from qr_generator import MiniSecureQRGenerator
+
+    client = web.app.test_client()
+    generator = MiniSecureQRGenerator()
+
+    for label, text in PAYLOADS.items():
+        meta = {'payload': label, 'version': qr_render.encode(text, qrcode.constants.ERROR_CORRECT_H).version}
+        base = qr_render.make_image(text, qrcode.constants.ERROR_CORRECT_H, box_size=8, border=2)
+        secure = web.create_secure_qr(text, 'a1b2c3')
+
+        yield f'create_secure_qr[{label}]', meta, lambda i, text=text: web.create_secure_qr(text, security_code(i))
+        for feature in ('micropattern', 'density'):
+            yield (f'add_security_features[{feature}-{label}]', meta,
+                   lambda i, base=base, feature=feature: web.add_security_features(base, [feature], security_code(i)))
+        yield (f'generate_all_variants[{label}]', meta,
+               lambda i, text=text: generator.generate_all_variants(text, security_code(i)))
+        for profile in png_encoder.PROFILES:
+            yield (f'png_encode[{profile}-{label}]', meta,
+                   lambda i, secure=secure, profile=profile: png_encoder.encode(secure, profile))
+        yield (f'POST /generate[{label}]', meta,
+               lambda i, text=text: client.post('/generate', json={'text': text, 'features': ['micropattern', 'density']}))
+        yield (f'POST /generate_secure_qr[{label}]', meta,
+               lambda i, text=text: client.post('/generate_secure_qr',
+                                                json={'text': text, 'security_code': security_code(i)}))
+
+
+def measure(call: Callable[[int], object], iterations: int, warmup: int = WARMUP_ITERATIONS) -> Dict:
+    """Time ``iterations`` calls and summarize their latency distribution"""
+    for i in range(warmup):
+        call(-1 - i)
+    samples = np.empty(iterations)
+    for i in range(iterations):
+        started = time.perf_counter()
+        call(i)
+        samples[i] = time.perf_counter() - started
+    return {
+        'iterations': iterations,
+        'p50_ms': float(np.percentile(samples, 50) * 1000),
+        'p99_ms': float(np.percentile(samples, 99) * 1000),
+        'mean_ms': float(samples.mean() * 1000),
+        'images_per_sec': float(iterations / samples.sum()),
+    }
+
+
+def run(iterations: int = DEFAULT_ITERATIONS, name_filter: Optional[str] = None, report=print) -> Dict:
+    """Run every matching case and return results in the baseline format"""
+    results = {}
+    for name, meta, call in _cases():
+        if name_filter and name_filter not in name:
+            continue
+        # The app prints debug lines per request; keep them out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats = measure(call, iterations)
+        results[name] = dict(meta, **stats)
+        report(f"{name:<48} p50 {stats['p50_ms']:8.2f}ms  p99 {stats['p99_ms']:8.2f}ms  "
+               f"{stats['images_per_sec']:8.1f} img/s")
+    return {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'pillow': PIL.__version__,
+            'iterations': iterations,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline: Dict, current: Dict, tolerance: float = DEFAULT_TOLERANCE) -> List[Dict]:
+    """Compare p50 latencies of cases present in both runs.
+
+    Returns one row per shared case with the slowdown ratio and whether it
+    exceeds the tolerance.
+    """
+    rows = []
+    for name, before in baseline['results'].items():
+        after = current['results'].get(name)
+        if after is None:
+            continue
+        ratio = after['p50_ms'] / before['p50_ms'] if before['p50_ms'] else float('inf')
+        rows.append({
+            'name': name,
+            'baseline_p50_ms': before['p50_ms'],
+            'current_p50_ms': after['p50_ms'],
+            'ratio': ratio,
+            'regressed': ratio > 1 + tolerance,
+        })
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    for command in ('run', 'compare'):
+        sub = commands.add_parser(command)
+        if command == 'compare':
+            sub.add_argument('baseline', help='baseline JSON written by "run --output"')
+            sub.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                             help='allowed relative p50 slowdown (default: %(default)s)')
+        sub.add_argument('--output', help='write results as JSON to this path')
+        sub.add_argument('--filter', help='only run cases whose name contains this text')
+        sub.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+        sub.add_argument('--quick', action='store_true', help=f'run {QUICK_ITERATIONS} iterations per case')
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.command == 'compare':
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    results = run(QUICK_ITERATIONS if args.quick else args.iterations, args.filter)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is None:
+        return 0
+    rows = compare(baseline, results, args.tolerance)
+    print()
+    for row in rows:
+        status = 'REGRESSED' if row['regressed'] else 'ok'
+        print(f"{row['name']:<48} {row['baseline_p50_ms']:8.2f}ms -> {row['current_p50_ms']:8.2f}ms "
+              f"({row['ratio']:.2f}x) {status}")
+    regressions = [row for row in rows if row['regressed']]
+    if regressions:
+        print(f"\n{len(regressions)} case(s) regressed by more than {args.tolerance:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,12 @@
+"""Gunicorn settings, loaded automatically when gunicorn starts in this directory.
+
+With QR_WARMUP=1 every worker renders one secure code after loading the app
+and before it accepts connections.
+"""
+
+
+def post_worker_init(worker):
+    import app
+
+    if app.WARM_UP:
+        app.warm_up()
@@ -0,0 +1,265 @@
+"""Print-sheet imposition: tile secure QR labels onto A4/A3 pages.
+
+Jobs are (text, security_code) pairs consumed lazily. Each label is rendered
+at the physical size of its SecurityFeature (``recommended_size``) and placed
+on a grid of sheet-sized pages. Only one page is held at a time:
+- PDF pages draw every label as vector rectangles, through
+  vector_render.PDFWriter, and are written out as soon as they fill.
+- TIFF pages are greyscale canvases appended to a multi-page TIFF frame by
+  frame. Labels are enlarged by a whole number of pixels per pixel (never
+  resampled) so security dots stay sharp, and centred in their slot. Unless
+  ``--dpi`` is given, the resolution is the feature's ``min_dpi`` or the
+  lowest one at which the first label fits its slot, whichever is higher.
+
+Labels come from a MiniSecureQRGenerator variant or, with ``--renderer
+secure``, from the web app's create_secure_qr.
+
+    python imposition.py jobs.csv --output sheets.pdf --sheet A3
+    python imposition.py jobs.csv --output sheets.tif --dpi 600
+    python imposition.py jobs.csv --output sheets.tif --renderer secure
+"""
+import argparse
+import math
+import os
+import sys
+from collections import namedtuple
+from itertools import chain, islice
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from PIL import Image, TiffImagePlugin
+
+import batch
+import metrics
+import vector_render
+
+SHEET_SIZES_MM = {
+    'A4': (210.0, 297.0),
+    'A3': (297.0, 420.0),
+}
+DEFAULT_MARGIN_MM = 10.0  # Unprintable border on most office and production printers
+DEFAULT_GAP_MM = 3.0  # Space between labels for cutting
+OUTPUT_FORMATS = ('pdf', 'tiff')
+RENDERERS = ('generator', 'secure')
+
+Layout = namedtuple('Layout', 'sheet_mm label_mm margin_mm gap_mm dpi columns rows')
+
+Job = Tuple[str, str]
+
+
+def plan_layout(feature, sheet: str = 'A4', margin_mm: float = DEFAULT_MARGIN_MM,
+                gap_mm: float = DEFAULT_GAP_MM, dpi: Optional[int] = None) -> Layout:
+    """Fit as many labels of ``feature``'s recommended size as the sheet holds"""
+    if sheet not in SHEET_SIZES_MM:
+        raise ValueError(f"Unknown sheet size: {sheet}")
+    dpi = feature.min_dpi if dpi is None else dpi
+    if dpi < feature.min_dpi:
+        raise ValueError(f"{feature.name} needs at least {feature.min_dpi} DPI")
+    sheet_mm = SHEET_SIZES_MM[sheet]
+    label_mm = vector_render.parse_size_mm(feature.recommended_size)
+    columns, rows = (int((sheet_mm[i] - 2 * margin_mm + gap_mm) // (label_mm[i] + gap_mm)) for i in (0, 1))
+    if columns < 1 or rows < 1:
+        raise ValueError(f"A {feature.recommended_size} label does not fit on {sheet}")
+    return Layout(sheet_mm, label_mm, margin_mm, gap_mm, dpi, columns, rows)
+
+
+def label_positions(layout: Layout) -> List[Tuple[float, float]]:
+    """Top-left corner of every label slot in millimetres from the sheet's top-left, row by row"""
+    return [(layout.margin_mm + column * (layout.label_mm[0] + layout.gap_mm),
+             layout.margin_mm + row * (layout.label_mm[1] + layout.gap_mm))
+            for row in range(layout.rows) for column in range(layout.columns)]
+
+
+def _pixels(mm: float, dpi: int) -> int:
+    return int(round(mm * dpi / vector_render.MM_PER_INCH))
+
+
+def generator_renderer(feature: str = 'micropattern') -> Callable[[str, str], Image.Image]:
+    """Render one MiniSecureQRGenerator variant per job"""
+    from qr_generator import MiniSecureQRGenerator
+
+    generator = MiniSecureQRGenerator()
+    return lambda text, security_code: generator.render_variant(text, security_code, feature)
+
+
+def secure_renderer() -> Callable[[str, str], Image.Image]:
+    """Render one create_secure_qr label (micropattern and density) per job"""
+    from app import create_secure_qr
+
+    return create_secure_qr
+
+
+def secure_feature():
+    """Print spec of create_secure_qr labels, taken from the print instructions"""
+    from qr_generator import SecurityFeature
+
+    return SecurityFeature(
+        name="Secure QR",
+        description="create_secure_qr label with micropattern and density features",
+        recommended_size="20mm x 20mm",
+        detection_method="Pattern and density analysis",
+        min_dpi=300,
+    )
+
+
+def pages(jobs: Iterable[Job], layout: Layout) -> Iterator[List[Job]]:
+    """Group jobs into page-sized lists without reading ahead more than one page"""
+    jobs = iter(jobs)
+    per_page = layout.columns * layout.rows
+    while True:
+        page = list(islice(jobs, per_page))
+        if not page:
+            return
+        for text, security_code in page:
+            if not text or not security_code:
+                raise batch.BatchJobError(f"Missing text or security code: {(text, security_code)!r}")
+        yield page
+
+
+def fitting_dpi(image: Image.Image, label_mm: Tuple[float, float]) -> int:
+    """Lowest resolution at which ``image`` fits a label of ``label_mm`` pixel for pixel"""
+    return math.ceil(max(image.width / label_mm[0], image.height / label_mm[1]) * vector_render.MM_PER_INCH)
+
+
+def _fit(image: Image.Image, layout: Layout) -> Image.Image:
+    """Enlarge a label by the largest whole factor that fits its slot.
+
+    Security dots are single pixels, so any fractional resampling would blur
+    them; a label larger than its slot asks for a higher DPI instead.
+    """
+    image = image.convert('L')
+    slot = (_pixels(layout.label_mm[0], layout.dpi), _pixels(layout.label_mm[1], layout.dpi))
+    scale = min(slot[0] // image.width, slot[1] // image.height)
+    if scale < 1:
+        raise ValueError(f"A {image.width}x{image.height} px label does not fit its {slot[0]}x{slot[1]} px slot "
+                         f"at {layout.dpi} DPI; use at least {fitting_dpi(image, layout.label_mm)} DPI")
+    if scale > 1:
+        image = image.resize((image.width * scale, image.height * scale), Image.NEAREST)
+    return image
+
+
+def raster_pages(jobs: Iterable[Job], layout: Layout, render: Callable[[str, str], Image.Image]) -> Iterator[Image.Image]:
+    """Yield one greyscale sheet image at ``layout.dpi`` per page of jobs"""
+    sheet_px = (_pixels(layout.sheet_mm[0], layout.dpi), _pixels(layout.sheet_mm[1], layout.dpi))
+    label_px = (_pixels(layout.label_mm[0], layout.dpi), _pixels(layout.label_mm[1], layout.dpi))
+    positions = [(_pixels(x, layout.dpi), _pixels(y, layout.dpi)) for x, y in label_positions(layout)]
+    for page in pages(jobs, layout):
+        sheet = Image.new('L', sheet_px, 255)
+        for (text, security_code), position in zip(page, positions):
+            label = render(text, security_code)
+            with metrics.stage('impose'):
+                label = _fit(label, layout)
+                sheet.paste(label, (position[0] + (label_px[0] - label.width) // 2,
+                                    position[1] + (label_px[1] - label.height) // 2))
+        yield sheet
+
+
+def write_tiff(jobs: Iterable[Job], layout: Layout, render: Callable[[str, str], Image.Image], stream) -> int:
+    """Write a multi-page TIFF, one frame per sheet, and return the page count.
+
+    ``stream`` must be a seekable binary file opened for reading and writing.
+    """
+    count = 0
+    with TiffImagePlugin.AppendingTiffWriter(stream, new=True) as tiff:
+        for sheet in raster_pages(jobs, layout, render):
+            with metrics.stage('tiff_save'):
+                sheet.save(tiff, format='TIFF', compression='tiff_adobe_deflate', dpi=(layout.dpi, layout.dpi))
+                tiff.newFrame()
+            count += 1
+    return count
+
+
+def write_pdf(jobs: Iterable[Job], layout: Layout, render: Callable[[str, str], Image.Image], stream) -> int:
+    """Write a multi-page vector PDF to any binary stream and return the page count"""
+    width_pt, height_pt = (vector_render.mm_to_points(mm) for mm in layout.sheet_mm)
+    label_pt = [vector_render.mm_to_points(mm) for mm in layout.label_mm]
+    positions = [(vector_render.mm_to_points(x), height_pt - vector_render.mm_to_points(y))
+                 for x, y in label_positions(layout)]
+    writer = vector_render.PDFWriter(stream)
+    count = 0
+    for page in pages(jobs, layout):
+        content = []
+        for (text, security_code), (x_pt, y_pt) in zip(page, positions):
+            image = render(text, security_code)
+            with metrics.stage('vectorize'):
+                label = vector_render.vectorize(image)
+                content.append(vector_render.pdf_label_content(label, x_pt, y_pt, *label_pt))
+        writer.add_page(width_pt, height_pt, b''.join(content))
+        count += 1
+    writer.close()
+    return count
+
+
+def impose(jobs: Iterable[Job], output_format: str, stream, feature: str = 'micropattern', sheet: str = 'A4',
+           dpi: Optional[int] = None, render: Optional[Callable[[str, str], Image.Image]] = None,
+           renderer: str = 'generator') -> int:
+    """Lay out ``jobs`` for one generator feature, or secure labels, and write them as PDF or TIFF"""
+    from qr_generator import MiniSecureQRGenerator
+
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    if renderer not in RENDERERS:
+        raise ValueError(f"Unknown renderer: {renderer}")
+    if renderer == 'secure':
+        spec = secure_feature()
+        render = render or secure_renderer()
+    else:
+        features = MiniSecureQRGenerator().features
+        if feature not in features:
+            raise ValueError(f"Unknown security feature: {feature}")
+        spec = features[feature]
+        render = render or generator_renderer(feature)
+    layout = plan_layout(spec, sheet, dpi=dpi)
+    if output_format == 'pdf':
+        return write_pdf(jobs, layout, render, stream)
+
+    if dpi is None:
+        # Size the sheet for the first label; labels rendered larger later still stop the run
+        jobs = iter(jobs)
+        first = next(jobs, None)
+        if first is not None:
+            jobs = chain([first], jobs)
+            if all(first):
+                layout = layout._replace(dpi=max(layout.dpi, fitting_dpi(render(*first), layout.label_mm)))
+    return write_tiff(jobs, layout, render, stream)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('jobs', help='CSV file of text,security_code rows ("-" for stdin)')
+    parser.add_argument('--output', required=True, help='PDF or TIFF file to write')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS,
+                        help='output format (default: from the output file extension)')
+    parser.add_argument('--sheet', choices=sorted(SHEET_SIZES_MM), default='A4')
+    parser.add_argument('--renderer', choices=RENDERERS, default='generator',
+                        help='generator variants, or create_secure_qr labels as served by the web app')
+    parser.add_argument('--feature', choices=('micropattern', 'density_variation'), default='micropattern',
+                        help='generator variant to print')
+    parser.add_argument('--dpi', type=int,
+                        help="TIFF resolution (default: the feature's minimum DPI, or higher if the first label needs it)")
+    args = parser.parse_args(argv)
+
+    output_format = args.format or ('tiff' if args.output.lower().endswith(('.tif', '.tiff')) else 'pdf')
+    source = None
+    try:
+        source = sys.stdin if args.jobs == '-' else open(args.jobs, newline='')
+        # Write beside the output and replace it only once every page is written
+        with open(args.output + '.part', 'w+b') as stream:
+            count = impose(batch.read_jobs_csv(source), output_format, stream, args.feature, args.sheet, args.dpi,
+                           renderer=args.renderer)
+        os.replace(args.output + '.part', args.output)
+    except (OSError, ValueError) as e:
+        try:
+            os.remove(args.output + '.part')
+        except FileNotFoundError:
+            pass
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if source not in (None, sys.stdin):
+            source.close()
+    print(f"Wrote {count} page(s) to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
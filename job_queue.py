@@ -0,0 +1,275 @@
+"""SQLite-backed queue for batch generation jobs too large for one request.
+
+A submitted batch is spooled to ``<job dir>/<id>.input.ndjson`` and recorded
+in ``jobs.sqlite3``. Background worker threads claim queued jobs and render
+them through batch.render_jobs. Each result is streamed into
+``<id>.<format>`` next to the input, and progress is written back so any
+process can report it. Because all state lives in the job directory, every
+gunicorn worker on the host can accept submissions, serve progress and
+download results, whichever process ran the job.
+
+A running job whose worker stops updating it for ``stale_seconds`` (for
+example after a restart) is claimed again and starts over.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import batch
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ('queued', 'running', 'finished', 'failed')
+
+PROGRESS_INTERVAL = 0.5  # Seconds between progress writes while a job runs
+POLL_INTERVAL = 1.0  # Seconds an idle worker waits before checking the queue again
+STALE_SECONDS = 300  # A running job not updated for this long is claimed again
+RETENTION_SECONDS = 24 * 3600  # Finished and failed jobs are deleted after this long
+
+JobStatus = namedtuple('JobStatus', 'id status output_format png_profile total done failed error '
+                                    'created started finished result_bytes')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    output_format TEXT NOT NULL,
+    png_profile TEXT,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    updated REAL NOT NULL,
+    result_bytes INTEGER
+)
+"""
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when its job was deleted while running"""
+
+
+class JobQueue:
+    """Persistent job table plus a lazily started pool of worker threads.
+
+    ``render(text, security_code, png_profile)`` returns PNG bytes for one job.
+    """
+
+    def __init__(self, directory: str, render: Callable[[str, str, Optional[str]], bytes], workers: int = 2,
+                 stale_seconds: float = STALE_SECONDS, retention_seconds: float = RETENTION_SECONDS):
+        self.directory = directory
+        self.render = render
+        self.workers = workers
+        self.stale_seconds = stale_seconds
+        self.retention_seconds = retention_seconds
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')  # Progress polls read while workers write
+            db.execute(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(os.path.join(self.directory, 'jobs.sqlite3'), timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def input_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f'{job_id}.input.ndjson')
+
+    def result_path(self, job_id: str, output_format: str) -> str:
+        return os.path.join(self.directory, f'{job_id}.{output_format}')
+
+    def submit(self, jobs: Iterable[Tuple[str, str]], output_format: str = 'zip',
+               png_profile: Optional[str] = None) -> JobStatus:
+        """Spool ``jobs`` to disk and queue them; raises BatchJobError for unreadable input"""
+        if output_format not in batch.STREAM_FORMATS:
+            raise ValueError(f"Unknown batch format: {output_format}")
+        self.purge_expired()
+        job_id = uuid.uuid4().hex
+        total = 0
+        try:
+            with open(self.input_path(job_id), 'w', encoding='utf-8') as spool:
+                for text, security_code in jobs:
+                    spool.write(json.dumps([text, security_code]) + '\n')
+                    total += 1
+        except Exception:
+            self._remove_files(job_id, output_format)
+            raise
+        if not total:
+            self._remove_files(job_id, output_format)
+            raise batch.BatchJobError("Missing jobs")
+        now = time.time()
+        with self._connect() as db:
+            db.execute('INSERT INTO jobs (id, status, output_format, png_profile, total, created, updated) '
+                       'VALUES (?, ?, ?, ?, ?, ?, ?)', (job_id, 'queued', output_format, png_profile, total, now, now))
+        self.start()
+        self._wakeup.set()
+        return self.status(job_id)
+
+    def status(self, job_id: str) -> Optional[JobStatus]:
+        with self._connect() as db:
+            row = db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        return JobStatus(*(row[field] for field in JobStatus._fields))
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs in each status"""
+        with self._connect() as db:
+            rows = db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update((status, count) for status, count in rows)
+        return counts
+
+    def delete(self, job_id: str) -> bool:
+        """Forget a job and its files; a worker running it stops at its next progress write"""
+        job = self.status(job_id)
+        if job is None:
+            return False
+        with self._connect() as db:
+            db.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+        if job.status != 'running':
+            self._remove_files(job_id, job.output_format)
+        return True
+
+    def purge_expired(self):
+        """Delete finished and failed jobs older than the retention period"""
+        cutoff = time.time() - self.retention_seconds
+        with self._connect() as db:
+            rows = db.execute("SELECT id FROM jobs WHERE status IN ('finished', 'failed') AND updated < ?",
+                              (cutoff,)).fetchall()
+        for row in rows:
+            self.delete(row['id'])
+
+    def _remove_files(self, job_id: str, output_format: str):
+        for path in (self.input_path(job_id), self.result_path(job_id, output_format),
+                     self.result_path(job_id, output_format) + '.part'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def start(self):
+        """Start the worker threads if they are not running yet"""
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'qr-job-worker-{number}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None):
+        """Ask workers to exit once their current job is done"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in threads:
+            thread.join(timeout)
+
+    def wait(self, job_id: str, timeout: float = 60) -> Optional[JobStatus]:
+        """Block until a job finishes or fails, mainly for tests and scripts"""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.status(job_id)
+            if job is None or job.status in ('finished', 'failed') or time.monotonic() >= deadline:
+                return job
+            time.sleep(0.05)
+
+    def _claim(self) -> Optional[JobStatus]:
+        now = time.time()
+        with self._connect() as db:
+            # Take the write lock before reading so two workers never claim the same job
+            db.execute('BEGIN IMMEDIATE')
+            row = db.execute("SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND updated < ?) "
+                             "ORDER BY created LIMIT 1", (now - self.stale_seconds,)).fetchone()
+            if row is not None:
+                db.execute("UPDATE jobs SET status = 'running', done = 0, failed = 0, started = ?, updated = ? "
+                           "WHERE id = ?", (now, now, row['id']))
+            db.execute('COMMIT')
+        return None if row is None else self.status(row['id'])
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                job = self._claim()
+                if job is None:
+                    self._wakeup.wait(POLL_INTERVAL)
+                    self._wakeup.clear()
+                    continue
+                self._run(job)
+            except Exception:
+                # e.g. "database is locked" past the timeout; the job goes stale and is claimed again
+                logger.exception('Job worker iteration failed')
+                self._stopping.wait(POLL_INTERVAL)
+
+    def _progress(self, job_id: str, done: int, failed: int):
+        with self._connect() as db:
+            updated = db.execute('UPDATE jobs SET done = ?, failed = ?, updated = ? WHERE id = ?',
+                                 (done, failed, time.time(), job_id)).rowcount
+        if not updated:
+            raise JobCancelled(job_id)
+
+    def _run(self, job: JobStatus):
+        stream, _ = batch.STREAM_FORMATS[job.output_format]
+        result_path = self.result_path(job.id, job.output_format)
+        counts = {'done': 0, 'failed': 0}
+        last_write = time.monotonic()
+
+        def read_input():
+            with open(self.input_path(job.id), encoding='utf-8') as spool:
+                for line in spool:
+                    yield tuple(json.loads(line))
+
+        def counted(results):
+            nonlocal last_write
+            for result in results:
+                counts['done'] += 1
+                counts['failed'] += bool(result.error)
+                if time.monotonic() - last_write >= PROGRESS_INTERVAL:
+                    self._progress(job.id, counts['done'], counts['failed'])
+                    last_write = time.monotonic()
+                yield result
+
+        render = lambda text, security_code: self.render(text, security_code, job.png_profile)
+        try:
+            with open(result_path + '.part', 'wb') as output:
+                for chunk in stream(counted(batch.render_jobs(read_input(), render))):
+                    output.write(chunk)
+            self._progress(job.id, counts['done'], counts['failed'])
+            os.replace(result_path + '.part', result_path)
+            status, error, size = 'finished', None, os.path.getsize(result_path)
+        except JobCancelled:
+            self._remove_files(job.id, job.output_format)
+            return
+        except Exception as e:
+            status, error, size = 'failed', str(e), None
+            try:
+                os.remove(result_path + '.part')
+            except FileNotFoundError:
+                pass
+        now = time.time()
+        with self._connect() as db:
+            updated = db.execute('UPDATE jobs SET status = ?, error = ?, result_bytes = ?, finished = ?, updated = ? '
+                                 'WHERE id = ?', (status, error, size, now, now, job.id)).rowcount
+        if not updated:
+            self._remove_files(job.id, job.output_format)
@@ -0,0 +1,6 @@
+"""Media types of the vector documents, importable without loading the renderers."""
+SVG_MIMETYPE = 'image/svg+xml'
+PDF_MIMETYPE = 'application/pdf'
+
+# Accept types offered for vector output, mapped to vector_render format names
+VECTOR_FORMATS = {SVG_MIMETYPE: 'svg', PDF_MIMETYPE: 'pdf'}
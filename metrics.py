@@ -0,0 +1,178 @@
+"""Per-stage timing histograms and request counters in Prometheus text format.
+
+Code wraps each expensive stage in ``with metrics.stage('png_save'):``. The
+durations land in the ``qr_stage_seconds`` histogram, labelled by stage. The
+Flask app also records request counts and latencies and serves everything,
+plus cache statistics, at ``/metrics``.
+
+Setting ``QR_METRICS=0`` disables collection. ``stage`` then hands back a
+shared no-op context manager, so instrumented code pays one function call.
+Metrics are per process: each gunicorn worker and each
+ParallelVariantRenderer worker keeps its own.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Dict, Iterable, List, Optional, Tuple
+
+ENABLED = os.environ.get('QR_METRICS', '1') != '0'
+
+# Seconds; fine-grained at the low end where most stages fall
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Bytes; encoded PNG sizes from a few hundred bytes to multi-megabyte sheets
+BYTE_BUCKETS = (512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072, 262144, 524288, 1048576, 4194304)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_NOOP = nullcontext()
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label set"""
+
+    def __init__(self, name: str, documentation: str, buckets: Iterable[float] = BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._series: Dict[LabelKey, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self, **labels: str) -> Optional[Tuple[List[int], float, int]]:
+        """Return (per-bucket counts, sum, count) for one label set"""
+        with self._lock:
+            series = self._series.get(tuple(sorted(labels.items())))
+            return None if series is None else (list(series[0]), series[1], series[2])
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((key, list(counts), total, count) for key, (counts, total, count) in self._series.items())
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{_labels(key + (("le", le),))} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(key)} {total}')
+            lines.append(f'{self.name}_count{_labels(key)} {count}')
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    """Monotonic counter with one series per label set"""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._series: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._series.get(tuple(sorted(labels.items())), 0)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            series = sorted(self._series.items())
+        lines.extend(f'{self.name}{_labels(key)} {value}' for key, value in series)
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(key: LabelKey) -> str:
+    if not key:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in key) + '}'
+
+
+stage_seconds = Histogram('qr_stage_seconds', 'Time spent in each rendering stage.')
+request_seconds = Histogram('qr_request_duration_seconds', 'HTTP request latency by endpoint.')
+requests_total = Counter('qr_requests_total', 'HTTP requests by endpoint, method and status.')
+png_bytes = Histogram('qr_png_bytes', 'Encoded PNG size by encoding profile.', BYTE_BUCKETS)
+
+METRICS = (stage_seconds, request_seconds, requests_total, png_bytes)
+
+
+class _StageTimer:
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        stage_seconds.observe(time.perf_counter() - self.started, stage=self.name)
+        return False
+
+
+def stage(name: str):
+    """Context manager timing one stage into ``qr_stage_seconds``"""
+    if not ENABLED:
+        return _NOOP
+    return _StageTimer(name)
+
+
+def observe_request(endpoint: str, method: str, status: int, seconds: float):
+    if not ENABLED:
+        return
+    requests_total.inc(endpoint=endpoint, method=method, status=str(status))
+    request_seconds.observe(seconds, endpoint=endpoint)
+
+
+def observe_png(profile: str, size: int):
+    if ENABLED:
+        png_bytes.observe(size, profile=profile)
+
+
+def render(gauges: Optional[Dict[str, Tuple[str, float]]] = None) -> str:
+    """Render every metric, plus ``gauges`` given as name -> (help, value)"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for name, (documentation, value) in sorted((gauges or {}).items()):
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Clear all recorded series"""
+    for metric in METRICS:
+        metric.reset()
@@ -0,0 +1,208 @@
+"""Detectors for the security features drawn by app.add_security_features.
+
+Stamp dots are the only pixels in the 130-190 grey band, and every stamp sits
+on the same 20px site grid. Folding the thresholded image onto one 20x20 grid
+cell turns all sites into a single histogram. That histogram is correlated
+with every distinct (style, rotation) stamp at every grid phase in one FFT
+pass. The winning template gives the style and rotation. The position-based
+intensity variation is then undone on its dots to estimate the base intensity.
+
+Density cells are flat 10px squares, so ``detect_density`` compares each
+cell's mean grey level with the level a security code would have filled it with.
+
+Both detectors expect the label at the scale and position it was rendered at.
+``normalize_scan`` brings a scan there first: verifier.locate_symbol finds the
+QR symbol, which is resampled onto the secure base grid so that the site grid
+and the density cells line up again however the scan was shifted or scaled.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+import verifier
+from feature_engine import (CELL_SIZE, PATTERN_SPACING, PATTERNS, SECURE_BORDER, SECURE_BOX_SIZE, cell_grid,
+                            density_modulation, density_params, micropattern_params, stamp_offsets)
+
+STYLE_NAMES = ('X', '+', '9-dot', 'diamond')
+ROTATIONS = (0, 45, 90, 135)
+STAMP_BAND = (130, 190)  # Grey levels the stamp dots are clamped to
+MIN_CONFIDENCE = 0.8  # Normalized correlation needed to report a pattern
+INTENSITY_TOLERANCE = 3  # Allowed error of the intensity estimate when matching a code
+DENSITY_BAND = (200, 239)  # Grey levels a density cell can be filled with
+DENSITY_FLATNESS = 6  # Largest grey spread within a cell still counted as filled
+DENSITY_TOLERANCE = 2  # Allowed error of a cell's mean level when matching a code
+MIN_DENSITY_MATCH = 0.9  # Share of filled cells that must carry the code's level
+
+# Grey-level bands reported by band_counts, matching the feature ranges
+BANDS = {
+    'black': (0, 49),
+    'pattern': (130, 190),
+    'density': (220, 240),
+    'white': (241, 255),
+}
+
+
+@dataclass
+class PatternDetection:
+    style: Optional[int]
+    style_name: Optional[str]
+    rotation: Optional[int]
+    rotations: Tuple[int, ...]  # Every rotation that stamps exactly the same dots
+    intensity: Optional[int]
+    confidence: float
+    sites: int
+
+    def matches(self, security_code: str) -> bool:
+        """Check the detection against the pattern a security code renders"""
+        if self.style is None:
+            return False
+        params = micropattern_params(security_code)
+        return (params.style == self.style and params.rotation in self.rotations
+                and abs(params.intensity - self.intensity) <= INTENSITY_TOLERANCE)
+
+    def to_dict(self) -> Dict:
+        return {
+            'style': self.style_name,
+            'rotation': self.rotation,
+            'rotations': list(self.rotations),
+            'intensity': self.intensity,
+            'confidence': round(self.confidence, 4),
+            'sites': self.sites,
+        }
+
+
+@dataclass
+class DensityDetection:
+    cells: int  # Flat cells with a level in the density band
+    matched: int  # Of those, cells at the level the security code predicts
+
+    @property
+    def ratio(self) -> float:
+        return self.matched / self.cells if self.cells else 0.0
+
+    def matches(self) -> bool:
+        return self.cells > 0 and self.ratio >= MIN_DENSITY_MATCH
+
+    def to_dict(self) -> Dict:
+        return {'cells': self.cells, 'matched': self.matched, 'ratio': round(self.ratio, 4)}
+
+
+@lru_cache(maxsize=None)
+def templates():
+    """Distinct stamp masks with the (style, rotation) pairs that produce each one.
+
+    Returns the FFT of every mask zero-padded to one grid cell, the mask sizes
+    and the list of pairs per mask.
+    """
+    masks = []
+    owners = []
+    for style in range(len(PATTERNS)):
+        for rotation in ROTATIONS:
+            mask = np.zeros((PATTERN_SPACING, PATTERN_SPACING), dtype=np.float64)
+            offsets = stamp_offsets(style, rotation)
+            mask[offsets[:, 1], offsets[:, 0]] = 1
+            for index, existing in enumerate(masks):
+                if np.array_equal(existing, mask):
+                    owners[index].append((style, rotation))
+                    break
+            else:
+                masks.append(mask)
+                owners.append([(style, rotation)])
+    masks = np.array(masks)
+    spectra = np.fft.rfft2(masks)
+    sizes = masks.sum(axis=(1, 2))
+    return spectra, sizes, tuple(tuple(pairs) for pairs in owners)
+
+
+def _grey(image: Union[Image.Image, np.ndarray]) -> np.ndarray:
+    if isinstance(image, np.ndarray):
+        return image
+    if image.mode not in ('L', 'RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    return np.asarray(image.convert('L'))
+
+
+def normalize_scan(image: Image.Image) -> Image.Image:
+    """Resample the QR symbol in a scan onto the grid create_secure_qr renders, upright and greyscale.
+
+    A scan without a recognisable symbol is returned in greyscale as it is.
+    """
+    grey = image if image.mode == 'L' else image.convert('L')
+    location = verifier.locate_symbol(grey)
+    if location is None:
+        return grey
+    return verifier.resample(grey, location, SECURE_BOX_SIZE, SECURE_BORDER)
+
+
+def band_counts(image: Union[Image.Image, np.ndarray]) -> Dict[str, int]:
+    """Count pixels in each feature grey band with one histogram pass"""
+    histogram = np.bincount(_grey(image).ravel(), minlength=256)
+    return {name: int(histogram[low:high + 1].sum()) for name, (low, high) in BANDS.items()}
+
+
+def detect_pattern(image: Union[Image.Image, np.ndarray]) -> PatternDetection:
+    """Identify the cross-pattern style, rotation and intensity stamped on an image"""
+    grey = _grey(image)
+    low, high = STAMP_BAND
+    ys, xs = np.nonzero((grey >= low) & (grey <= high))
+    if not len(xs):
+        return PatternDetection(None, None, None, (), None, 0.0, 0)
+
+    # Fold every site onto one grid cell and correlate all templates at all phases
+    folded = np.bincount((ys % PATTERN_SPACING) * PATTERN_SPACING + xs % PATTERN_SPACING,
+                         minlength=PATTERN_SPACING * PATTERN_SPACING)
+    folded = folded.reshape(PATTERN_SPACING, PATTERN_SPACING).astype(np.float64)
+    spectra, sizes, owners = templates()
+    correlation = np.fft.irfft2(np.fft.rfft2(folded)[None] * np.conj(spectra), s=folded.shape)
+    scores = correlation / (np.sqrt(sizes)[:, None, None] * np.linalg.norm(folded))
+    best, phase_y, phase_x = np.unravel_index(np.argmax(scores), scores.shape)
+    confidence = float(min(scores[best, phase_y, phase_x], 1.0))
+
+    # Keep the dots the winning template explains at the winning phase
+    cell_y = (ys - phase_y) % PATTERN_SPACING
+    cell_x = (xs - phase_x) % PATTERN_SPACING
+    style, rotation = owners[best][0]
+    offsets = stamp_offsets(style, rotation)
+    in_template = np.zeros((PATTERN_SPACING, PATTERN_SPACING), dtype=bool)
+    in_template[offsets[:, 1], offsets[:, 0]] = True
+    keep = in_template[cell_y, cell_x]
+    ys, xs = ys[keep], xs[keep]
+    site_ids = np.column_stack(((ys - phase_y) // PATTERN_SPACING, (xs - phase_x) // PATTERN_SPACING))
+    sites = len(np.unique(site_ids, axis=0))
+
+    # Undo the position-based variation on dots that were not clamped to the band
+    values = grey[ys, xs].astype(np.int64)
+    unclamped = (values > low) & (values < high)
+    if unclamped.any():
+        base = values[unclamped] - ((xs[unclamped] * ys[unclamped]) % 20 - 10)
+    else:
+        base = values
+    intensity = int(round(float(np.median(base)))) if len(base) else None
+
+    if confidence < MIN_CONFIDENCE:
+        return PatternDetection(None, None, None, (), intensity, confidence, sites)
+    rotations = tuple(r for s, r in owners[best] if s == style)
+    return PatternDetection(style, STYLE_NAMES[style], rotation, rotations, intensity, confidence, sites)
+
+
+def detect_density(image: Union[Image.Image, np.ndarray], security_code: str) -> DensityDetection:
+    """Check the filled density cells of an image against the levels a security code renders"""
+    grey = _grey(image)
+    height, width = grey.shape
+    cols, rows = cell_grid(width, height)
+    if not cols or not rows:
+        return DensityDetection(0, 0)
+    cells = grey[:rows * CELL_SIZE, :cols * CELL_SIZE].reshape(rows, CELL_SIZE, cols, CELL_SIZE)
+    means = cells.mean(axis=(1, 3))
+    spread = cells.max(axis=(1, 3)).astype(np.int64) - cells.min(axis=(1, 3))
+    low, high = DENSITY_BAND
+    filled = (spread <= DENSITY_FLATNESS) & (means >= low - 0.5) & (means <= high + 0.5)
+
+    params = density_params(security_code)
+    expected = np.clip(params.base_intensity
+                       - density_modulation(width, height, params.pattern_type, params.intensity_range), 0, 255)
+    matched = filled & (np.abs(means - expected) <= DENSITY_TOLERANCE)
+    return DensityDetection(int(filled.sum()), int(matched.sum()))
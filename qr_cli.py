@@ -0,0 +1,404 @@
+"""Command line tools for secure QR codes.
+
+``generate`` renders MiniSecureQRGenerator variants for every job in a CSV
+or JSON lines file (or stdin) across a process pool. PNGs are written to a
+directory or a tar archive as they complete, with a ``manifest.csv`` listing
+each job's files, and throughput is reported at the end. Nothing here
+imports matplotlib unless ``--preview`` is given, so it runs on headless
+machines.
+
+    python qr_cli.py generate jobs.csv --output labels/
+    python qr_cli.py generate jobs.jsonl --output labels.tar.gz --feature micropattern --jobs 8
+    python qr_cli.py label "Hello World" SEC123 --preview
+
+``verify`` checks a directory of scanned MiniSecureQRGenerator labels. Scans
+are decoded and verified across a process pool, and one report row per scan
+is written as soon as it completes, as CSV or JSON lines. An interrupted run
+continues with ``--resume``: scans already in the report are skipped and new
+rows are appended.
+
+    python qr_cli.py verify scans/ --code SEC123 --output report.csv
+    python qr_cli.py verify scans/ --codes codes.csv --output report.jsonl --jobs 8
+    python qr_cli.py verify scans/ --codes codes.csv --output report.jsonl --resume
+
+``codes.csv`` maps scan paths, relative to the scan directory, to security
+codes with rows of ``file,security_code``. Scans without a code are skipped.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import tarfile
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from PIL import Image
+
+import batch
+import png_encoder
+import verifier
+from qr_generator import MiniSecureQRGenerator, ParallelVariantRenderer
+
+COMMANDS = ('generate', 'label', 'verify')
+JOB_FORMATS = ('csv', 'jsonl')
+REPORT_FORMATS = ('csv', 'jsonl')
+TAR_EXTENSIONS = {'.tar': 'w', '.tar.gz': 'w:gz', '.tgz': 'w:gz'}
+CODES_HEADER = ['file', 'security_code']
+MANIFEST_NAME = 'manifest.csv'
+
+
+def _format_from_extension(path: str, default: str = 'csv') -> str:
+    return 'jsonl' if path.lower().endswith(('.jsonl', '.ndjson')) else default
+
+
+def read_jobs(lines: Iterable[str], job_format: str) -> Iterator[Tuple[str, str]]:
+    """Read (text, security_code) jobs lazily from CSV or JSON lines"""
+    return batch.read_jobs_ndjson(lines) if job_format == 'jsonl' else batch.read_jobs_csv(lines)
+
+
+class DirectoryOutput:
+    """Writes generated files into a directory, appending manifest rows as they arrive"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._manifest = None
+
+    def write(self, name: str, data: bytes):
+        with open(os.path.join(self.path, name), 'wb') as f:
+            f.write(data)
+
+    def manifest_row(self, row: List):
+        if self._manifest is None:
+            self._manifest = open(os.path.join(self.path, MANIFEST_NAME), 'w', newline='', encoding='utf-8')
+            self._writer = csv.writer(self._manifest)
+        self._writer.writerow(row)
+        self._manifest.flush()
+
+    def close(self):
+        if self._manifest is not None:
+            self._manifest.close()
+
+
+class TarOutput:
+    """Appends generated files to a tar archive, or streams one to stdout for ``-``
+
+    A tar member needs its size up front, so manifest rows are spooled to a
+    temporary file as they arrive and added as the last member on close.
+    """
+
+    def __init__(self, path: str):
+        if path == '-':
+            self._tar = tarfile.open(fileobj=sys.stdout.buffer, mode='w|')
+        else:
+            mode = next(mode for extension, mode in TAR_EXTENSIONS.items() if path.lower().endswith(extension))
+            self._tar = tarfile.open(path, mode)
+        self._mtime = time.time()
+        self._manifest = None
+
+    def write(self, name: str, data: bytes):
+        self._add(name, io.BytesIO(data), len(data))
+
+    def _add(self, name: str, fileobj, size: int):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = self._mtime
+        self._tar.addfile(info, fileobj)
+
+    def manifest_row(self, row: List):
+        if self._manifest is None:
+            self._manifest = io.TextIOWrapper(tempfile.TemporaryFile(), encoding='utf-8', newline='')
+            self._writer = csv.writer(self._manifest)
+        self._writer.writerow(row)
+
+    def close(self):
+        try:
+            if self._manifest is not None:
+                self._manifest.flush()
+                spool = self._manifest.buffer
+                size = spool.tell()
+                spool.seek(0)
+                self._add(MANIFEST_NAME, spool, size)
+                self._manifest.close()
+        finally:
+            self._tar.close()
+
+
+def open_output(path: str):
+    if path == '-' or path.lower().endswith(tuple(TAR_EXTENSIONS)):
+        return TarOutput(path)
+    return DirectoryOutput(path)
+
+
+def preview(title: str, variants: Dict[str, Tuple[Image.Image, object]]):
+    """Show variants side by side; the only place matplotlib is imported"""
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(1, len(variants), figsize=(5 * len(variants), 5), squeeze=False)
+    fig.suptitle(title)
+    for axis, (image, feature) in zip(axes[0], variants.values()):
+        axis.imshow(image)
+        axis.set_title(f"{feature.name}\n{feature.description}")
+        axis.axis('off')
+    plt.tight_layout()
+    plt.show()
+
+
+def generate_command(args) -> int:
+    features = tuple(args.feature or MiniSecureQRGenerator().features)
+    job_format = args.format or _format_from_extension(args.input)
+    source = sys.stdin if args.input == '-' else open(args.input, newline='', encoding='utf-8')
+    # File messages go to stderr so a tar archive can stream to stdout
+    log = sys.stderr
+    counts = {'jobs': 0, 'files': 0, 'bytes': 0, 'invalid': 0}
+    first = None
+
+    def jobs():
+        for text, security_code in read_jobs(source, job_format):
+            if not text or not security_code:
+                counts['invalid'] += 1
+                print(f"skipped job without text or security code: {(text, security_code)!r}", file=log)
+                continue
+            yield text, security_code
+
+    started = time.perf_counter()
+    output = open_output(args.output)
+    try:
+        output.manifest_row(['index', 'text', 'security_code'] + list(features))
+        with ParallelVariantRenderer(max_workers=args.jobs, output='png', pattern_mode=args.pattern_mode,
+                                     png_profile=args.png_profile, features=features) as renderer:
+            for result in renderer.render(jobs()):
+                names = []
+                for feature in features:
+                    png, _ = result.variants[feature]
+                    name = f'{result.index:06d}_{feature}.png'
+                    output.write(name, png)
+                    names.append(name)
+                    counts['files'] += 1
+                    counts['bytes'] += len(png)
+                output.manifest_row([result.index, result.main_text, result.security_code] + names)
+                counts['jobs'] += 1
+                if first is None:
+                    first = result
+    finally:
+        output.close()
+        if source is not sys.stdin:
+            source.close()
+
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(f"Generated {counts['files']} image(s) for {counts['jobs']} job(s), {counts['bytes'] / 1e6:.1f} MB, "
+          f"in {elapsed:.1f}s: {counts['jobs'] / elapsed:.1f} jobs/s, {counts['files'] / elapsed:.1f} images/s", file=log)
+    if counts['invalid']:
+        print(f"Skipped {counts['invalid']} invalid job(s)", file=log)
+    if args.preview and first is not None:
+        variants = {name: (Image.open(io.BytesIO(png)), feature) for name, (png, feature) in first.variants.items()}
+        preview(f"First job: {first.main_text}", variants)
+    return 0
+
+
+def label_command(args) -> int:
+    generator = MiniSecureQRGenerator(args.pattern_mode)
+    variants = generator.generate_all_variants(args.text, args.security_code)
+    print("\n" + generator.get_print_instructions())
+    print("-" * 50)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for feature_name, (qr_image, feature_info) in variants.items():
+        output_path = os.path.join(args.output_dir, f"secure_qr_{feature_name}_mini.png")
+        qr_image.save(output_path)
+        print(f"\nGenerated {feature_info.name}")
+        print(f"Description: {feature_info.description}")
+        print(f"Recommended Size: {feature_info.recommended_size}")
+        print(f"Minimum DPI: {feature_info.min_dpi}")
+        print(f"Detection Method: {feature_info.detection_method}")
+        print(f"Output File: {output_path}")
+        print("-" * 50)
+    if args.preview:
+        preview(f'QR Codes with Security Features (20mm x 20mm)\nMain Text: {args.text}', variants)
+    return 0
+
+
+def read_codes_csv(lines: Iterable[str]) -> Dict[str, str]:
+    """Read ``file,security_code`` rows, skipping an optional header row"""
+    codes = {}
+    for row_number, row in enumerate(csv.reader(lines)):
+        if not row:
+            continue
+        if row_number == 0 and [cell.strip().lower() for cell in row] == CODES_HEADER:
+            continue
+        if len(row) != 2:
+            raise ValueError(f"Codes row {row_number + 1} must have 2 columns")
+        codes[os.path.normpath(row[0])] = row[1]
+    return codes
+
+
+def report_columns(feature_types: Iterable[str]) -> List[str]:
+    columns = ['file', 'security_code', 'verified']
+    for feature_type in feature_types:
+        columns += [f'{feature_type}_verified', f'{feature_type}_score', f'{feature_type}_ms']
+    return columns + ['decode_ms', 'elapsed_ms', 'error']
+
+
+def report_row(report: verifier.ScanReport, file: str, feature_types: Iterable[str]) -> Dict:
+    """Flatten a scan report into one row keyed by ``report_columns``"""
+    row = {'file': file, 'security_code': report.security_code, 'verified': report.verified}
+    results = {result.feature_type: result for result in report.results}
+    for feature_type in feature_types:
+        result = results.get(feature_type)
+        row[f'{feature_type}_verified'] = result.verified if result else False
+        row[f'{feature_type}_score'] = round(result.score, 4) if result else None
+        row[f'{feature_type}_ms'] = round(result.elapsed_ms, 2) if result else None
+    row['decode_ms'] = round(report.decode_ms, 2)
+    row['elapsed_ms'] = round(report.elapsed_ms, 2)
+    row['error'] = report.error
+    return row
+
+
+def completed_files(path: str, report_format: str, columns: List[str]) -> Set[str]:
+    """Scans already reported in an existing output file.
+
+    A partial last line left by an interrupted run is cut off so new rows can
+    be appended after it.
+    """
+    try:
+        with open(path, 'rb+') as report:
+            content = report.read()
+            complete = content[:content.rfind(b'\n') + 1]
+            if len(complete) != len(content):
+                report.truncate(len(complete))
+    except FileNotFoundError:
+        return set()
+    lines = complete.decode('utf-8').splitlines()
+    if report_format == 'jsonl':
+        return {json.loads(line)['file'] for line in lines if line}
+    rows = csv.reader(lines)
+    header = next(rows, None)
+    if header is not None and header != columns:
+        raise ValueError(f"{path} was written with different features")
+    return {row[0] for row in rows if row}
+
+
+def _verify_job(job: Tuple[str, str, str, Tuple[str, ...], str]) -> Tuple[str, verifier.ScanReport]:
+    file, path, security_code, feature_types, pattern_mode = job
+    return file, verifier.verify_scan(path, security_code, feature_types, pattern_mode)
+
+
+def verify_scans(jobs: Iterable[Tuple[str, str, str]], feature_types: Tuple[str, ...], pattern_mode: str = 'compat',
+                 workers: Optional[int] = None) -> Iterator[Tuple[str, verifier.ScanReport]]:
+    """Verify (file, path, security_code) jobs across a process pool, yielding reports as they finish.
+
+    At most a few jobs per worker are in flight, so directories of any size
+    are walked lazily.
+    """
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for file, path, security_code in jobs:
+            pending.append(executor.submit(_verify_job, (file, path, security_code, feature_types, pattern_mode)))
+            if len(pending) >= workers * 4:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield future.result()
+        for future in pending:
+            yield future.result()
+
+
+def verify_command(args) -> int:
+    feature_types = tuple(args.feature or verifier.FEATURE_TYPES)
+    report_format = args.format or _format_from_extension(args.output)
+    columns = report_columns(feature_types)
+    if args.codes:
+        with open(args.codes, newline='') as f:
+            codes = read_codes_csv(f)
+    done = completed_files(args.output, report_format, columns) if args.resume else set()
+
+    counts = {'verified': 0, 'failed': 0, 'errors': 0, 'skipped': 0, 'resumed': len(done)}
+
+    def jobs():
+        for file in verifier.iter_scans(args.directory, not args.no_recursive):
+            if file in done:
+                continue
+            security_code = codes.get(os.path.normpath(file)) if args.codes else args.code
+            if security_code is None:
+                counts['skipped'] += 1
+                continue
+            yield file, os.path.join(args.directory, file), security_code
+
+    append = args.resume and os.path.exists(args.output) and os.path.getsize(args.output) > 0
+    with open(args.output, 'a' if append else 'w', newline='', encoding='utf-8') as output:
+        writer = csv.DictWriter(output, columns) if report_format == 'csv' else None
+        if writer and not append:
+            writer.writeheader()
+        for file, report in verify_scans(jobs(), feature_types, args.pattern_mode, args.jobs):
+            row = report_row(report, file, feature_types)
+            if writer:
+                writer.writerow(row)
+            else:
+                output.write(json.dumps(row) + '\n')
+            output.flush()
+            counts['errors' if report.error else 'verified' if report.verified else 'failed'] += 1
+
+    print(f"{counts['verified']} verified, {counts['failed']} failed, {counts['errors']} unreadable, "
+          f"{counts['skipped']} without a code, {counts['resumed']} already reported", file=sys.stderr)
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    feature_names = tuple(MiniSecureQRGenerator().features)
+
+    generate = commands.add_parser('generate', help='render variants for a file of jobs')
+    generate.add_argument('input', help='CSV of text,security_code rows or JSON lines ("-" for stdin)')
+    generate.add_argument('--output', required=True,
+                          help='directory, or .tar/.tar.gz archive ("-" streams a tar to stdout)')
+    generate.add_argument('--format', choices=JOB_FORMATS, help='job format (default: from the file extension, '
+                                                                'csv for stdin)')
+    generate.add_argument('--feature', action='append', choices=feature_names,
+                          help='variant to write; repeat for several (default: all)')
+    generate.add_argument('--pattern-mode', choices=MiniSecureQRGenerator.PATTERN_MODES, default='compat')
+    generate.add_argument('--png-profile', choices=png_encoder.PROFILES, default='default')
+    generate.add_argument('--jobs', type=int, help='worker processes (default: CPU count)')
+    generate.add_argument('--preview', action='store_true', help="show the first job's variants with matplotlib")
+    generate.set_defaults(handler=generate_command)
+
+    label = commands.add_parser('label', help='render the variants of one code in the current directory')
+    label.add_argument('text')
+    label.add_argument('security_code')
+    label.add_argument('--output-dir', default='.', help='directory for the PNGs (default: current directory)')
+    label.add_argument('--pattern-mode', choices=MiniSecureQRGenerator.PATTERN_MODES, default='compat')
+    label.add_argument('--preview', action='store_true', help='show the variants with matplotlib')
+    label.set_defaults(handler=label_command)
+
+    verify = commands.add_parser('verify', help='verify a directory of scans')
+    verify.add_argument('directory', help='directory of scanned images, searched recursively')
+    code = verify.add_mutually_exclusive_group(required=True)
+    code.add_argument('--code', help='security code shared by every scan')
+    code.add_argument('--codes', help='CSV of file,security_code rows')
+    verify.add_argument('--output', required=True, help='report file to write (.csv or .jsonl)')
+    verify.add_argument('--format', choices=REPORT_FORMATS,
+                        help='report format (default: from the output file extension)')
+    verify.add_argument('--feature', action='append', choices=verifier.FEATURE_TYPES,
+                        help='feature to verify; repeat for several (default: all)')
+    verify.add_argument('--pattern-mode', choices=MiniSecureQRGenerator.PATTERN_MODES, default='compat',
+                        help='pattern mode the labels were rendered with (default: %(default)s)')
+    verify.add_argument('--jobs', type=int, help='worker processes (default: CPU count)')
+    verify.add_argument('--resume', action='store_true', help='skip scans already in the report and append')
+    verify.add_argument('--no-recursive', action='store_true', help='only scan the top-level directory')
+    verify.set_defaults(handler=verify_command)
+
+    args = parser.parse_args(argv)
+    try:
+        return args.handler(args)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,18 @@
 import qrcode
-from PIL import Image, ImageDraw, ImageFont, ImageColor
+import metrics
+import png_encoder
+import qr_render
+from PIL import Image
 import json
 import random
 import numpy as np
-from PIL import ImageEnhance, ImageFilter
 import math
 import hashlib
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from dataclasses import dataclass
-from typing import Dict, Tuple
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Tuple, Union
 
 @dataclass
 class SecurityFeature:
@@ -17,8 +22,33 @@ class SecurityFeature:
     detection_method: str
     min_dpi: int
 
+def _python_random_words(seed: int, count: int) -> np.ndarray:
+    """Return the first ``count`` 32-bit words drawn by ``random.Random(seed)``.
+
+    Python seeds its Mersenne Twister with init_by_array over the 32-bit words of
+    the seed, exactly like numpy's legacy RandomState given a one-element array,
+    so the stream can be replayed in bulk.
+    """
+    state = np.random.RandomState([seed]).get_state()
+    bit_generator = np.random.MT19937()
+    bit_generator.state = {'bit_generator': 'MT19937', 'state': {'key': state[1], 'pos': state[2]}}
+    return bit_generator.random_raw(count)
+
+def _python_random_floats(words: np.ndarray) -> np.ndarray:
+    """Combine word pairs into doubles the way ``random.Random.random`` does."""
+    return ((words[0::2] >> 5).astype(np.float64) * 67108864.0
+            + (words[1::2] >> 6).astype(np.float64)) * (1.0 / 9007199254740992.0)
+
 class MiniSecureQRGenerator:
-    def __init__(self):
+    # 'compat' reproduces the pixels of codes already in the field with bulk
+    # array operations, 'fast' draws from a seeded numpy Generator instead, and
+    # 'reference' keeps the original per-pixel drawing code.
+    PATTERN_MODES = ('compat', 'fast', 'reference')
+
+    def __init__(self, pattern_mode: str = 'compat'):
+        if pattern_mode not in self.PATTERN_MODES:
+            raise ValueError(f"Unknown pattern mode: {pattern_mode}")
+        self.pattern_mode = pattern_mode
         self.features = {
             'micropattern': SecurityFeature(
                 name="Micropattern QR",
@@ -44,53 +74,155 @@ class MiniSecureQRGenerator:
             "sec": hashlib.sha256(data["security_code"].encode()).hexdigest()[:8]
         }
         
-        qr = qrcode.QRCode(
-            version=None,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=8,  # Smaller box size for better small-scale rendering
-            border=2,    # Smaller border for compact size
-        )
-        qr.add_data(json.dumps(qr_data))
-        qr.make(fit=True)
-        return qr.make_image(fill_color="black", back_color="white").convert('RGBA')
+        with metrics.stage('qr_encode'):
+            return qr_render.make_image(
+                json.dumps(qr_data),
+                error_correction=qrcode.constants.ERROR_CORRECT_H,
+                box_size=8,  # Smaller box size for better small-scale rendering
+                border=2,    # Smaller border for compact size
+                mode='L',    # Output is black and white, one byte per pixel is plenty
+            )
 
     def _get_pattern_seed(self, security_code: str) -> int:
         """Generate a deterministic seed from security code."""
         return int(hashlib.sha256(security_code.encode()).hexdigest()[:8], 16)
 
+    def _get_pattern_rng(self, security_code: str) -> random.Random:
+        """Create a private random generator seeded from the security code.
+
+        Seeding a dedicated instance leaves the global random module untouched,
+        so variants can be rendered concurrently.
+        """
+        return random.Random(self._get_pattern_seed(security_code))
+
+    def _composite_dots(self, img: Image.Image, mask: np.ndarray) -> Image.Image:
+        """Paint opaque black dots wherever ``mask`` is set, in place for L and RGBA images."""
+        if img.mode not in ('L', 'RGBA'):
+            img = img.convert('L')
+        img.paste('black', mask=Image.fromarray(mask))
+        return img
+
+    def _micropattern_mask(self, width: int, height: int, security_code: str) -> np.ndarray:
+        """Boolean mask of micropattern dots for an image size."""
+        dot_spacing = 4
+        xs = np.arange(0, width, dot_spacing)
+        ys = np.arange(0, height, dot_spacing)
+        if self.pattern_mode == 'fast':
+            rng = np.random.default_rng(self._get_pattern_seed(security_code))
+            draw = rng.random((len(xs), len(ys))) > 0.5
+            cluster = draw & (rng.random((len(xs), len(ys))) > 0.7)
+        else:
+            # Each cell consumes one random() and a second one only when the
+            # first exceeds 0.5. Position j starts a cell iff the run of
+            # "> 0.5" draws right before it has even length.
+            cells = len(xs) * len(ys)
+            floats = _python_random_floats(_python_random_words(self._get_pattern_seed(security_code), 4 * cells))
+            above = floats > 0.5
+            positions = np.arange(len(floats))
+            last_below = np.maximum.accumulate(np.where(above, -1, positions))
+            run_before = np.concatenate(([0], (positions - last_below)[:-1]))
+            starts = np.flatnonzero(run_before % 2 == 0)[:cells]
+            draw = above[starts]
+            cluster = draw & (floats[starts + 1] > 0.7)
+            draw = draw.reshape(len(xs), len(ys))
+            cluster = cluster.reshape(len(xs), len(ys))
+
+        mask = np.zeros((height, width), dtype=bool)
+        dot_x, dot_y = np.nonzero(draw)
+        mask[ys[dot_y], xs[dot_x]] = True
+        # Clusters add the right and lower neighbour when both fit in the image
+        cluster &= (xs[:, None] + 1 < width) & (ys[None, :] + 1 < height)
+        dot_x, dot_y = np.nonzero(cluster)
+        mask[ys[dot_y], xs[dot_x] + 1] = True
+        mask[ys[dot_y] + 1, xs[dot_x]] = True
+        return mask
+
+    def _density_mask(self, width: int, height: int, security_code: str) -> np.ndarray:
+        """Boolean mask of density-variation dots for an image size."""
+        cell_size = 6
+        xs = np.arange(0, width, cell_size)
+        ys = np.arange(0, height, cell_size)
+        angle_mod = int(security_code[0], 36) / 36  # Use first char for pattern variation
+        # The product separates into per-column and per-row factors; math keeps
+        # them bit-identical to the original scalar formula.
+        column_factor = np.array([math.sin((x/width + angle_mod) * math.pi) for x in xs.tolist()])
+        row_factor = np.array([math.cos((y/height + angle_mod) * math.pi) for y in ys.tolist()])
+        density = (np.abs(column_factor[:, None] * row_factor[None, :]) * 8).astype(np.int64)
+        total = int(density.sum())
+
+        if self.pattern_mode == 'fast':
+            rng = np.random.default_rng(self._get_pattern_seed(security_code))
+            offsets = rng.integers(0, cell_size, size=2 * total)
+        else:
+            # randint(0, 5) draws 3-bit values from one word each, rejecting 6 and 7
+            seed = self._get_pattern_seed(security_code)
+            count = 2 * total + 64
+            while True:
+                values = _python_random_words(seed, count) >> 29
+                offsets = values[values < cell_size]
+                if len(offsets) >= 2 * total:
+                    break
+                count *= 2
+            offsets = offsets[:2 * total].astype(np.int64)
+
+        cell_x = np.repeat(np.repeat(xs[:, None], len(ys), axis=1).ravel(), density.ravel())
+        cell_y = np.repeat(np.repeat(ys[None, :], len(xs), axis=0).ravel(), density.ravel())
+        dot_x = cell_x + offsets[0::2]
+        dot_y = cell_y + offsets[1::2]
+        inside = (dot_x < width) & (dot_y < height)
+        mask = np.zeros((height, width), dtype=bool)
+        mask[dot_y[inside], dot_x[inside]] = True
+        return mask
+
     def _add_micropattern(self, img: Image.Image, security_code: str) -> Image.Image:
-        """Add high-contrast microscopic dot pattern optimized for mobile scanning."""
+        """Add high-contrast microscopic dot pattern optimized for mobile scanning, drawing on ``img``."""
+        with metrics.stage('micropattern'):
+            if self.pattern_mode == 'reference':
+                return self._add_micropattern_reference(img, security_code)
+            return self._composite_dots(img, self._micropattern_mask(img.width, img.height, security_code))
+
+    def _add_density_variation(self, img: Image.Image, security_code: str) -> Image.Image:
+        """Add binary density pattern optimized for small size and mobile detection, drawing on ``img``."""
+        with metrics.stage('density_variation'):
+            if self.pattern_mode == 'reference':
+                return self._add_density_variation_reference(img, security_code)
+            return self._composite_dots(img, self._density_mask(img.width, img.height, security_code))
+
+    def _add_micropattern_reference(self, img: Image.Image, security_code: str) -> Image.Image:
+        """Per-pixel micropattern drawing kept as the reference for compat mode."""
+        from PIL import ImageDraw
+        
         width, height = img.size
-        pattern = Image.new('RGBA', (width, height), (0, 0, 0, 0))
-        draw = ImageDraw.Draw(pattern)
+        draw = ImageDraw.Draw(img)
         
         # Use security code to generate deterministic pattern
-        random.seed(self._get_pattern_seed(security_code))
+        rng = self._get_pattern_rng(security_code)
         
         # Create binary dot pattern (only fully opaque or transparent)
         dot_spacing = 4  # Increased spacing for better detection
         for x in range(0, width, dot_spacing):
             for y in range(0, height, dot_spacing):
-                if random.random() > 0.5:
+                if rng.random() > 0.5:
                     # Use security code to determine dot pattern
-                    if random.random() > 0.7:  # 30% chance of dot cluster
-                        draw.point((x, y), fill=(0, 0, 0, 255))
+                    if rng.random() > 0.7:  # 30% chance of dot cluster
+                        draw.point((x, y), fill='black')
                         if x + 1 < width and y + 1 < height:
-                            draw.point((x+1, y), fill=(0, 0, 0, 255))
-                            draw.point((x, y+1), fill=(0, 0, 0, 255))
+                            draw.point((x+1, y), fill='black')
+                            draw.point((x, y+1), fill='black')
                     else:
-                        draw.point((x, y), fill=(0, 0, 0, 255))
+                        draw.point((x, y), fill='black')
         
-        return Image.alpha_composite(img, pattern)
+        return img
 
-    def _add_density_variation(self, img: Image.Image, security_code: str) -> Image.Image:
-        """Add binary density pattern optimized for small size and mobile detection."""
+    def _add_density_variation_reference(self, img: Image.Image, security_code: str) -> Image.Image:
+        """Per-pixel density drawing kept as the reference for compat mode."""
+        from PIL import ImageDraw
+        
         width, height = img.size
-        pattern = Image.new('RGBA', (width, height), (0, 0, 0, 0))
-        draw = ImageDraw.Draw(pattern)
+        draw = ImageDraw.Draw(img)
         
         # Use security code to generate deterministic pattern
-        random.seed(self._get_pattern_seed(security_code))
+        rng = self._get_pattern_rng(security_code)
         
         # Create larger cell-based density pattern
         cell_size = 6  # Increased cell size for better detection
@@ -103,12 +235,12 @@ class MiniSecureQRGenerator:
                 
                 # Fill cell with dots based on density
                 for i in range(density):
-                    dot_x = x + random.randint(0, cell_size-1)
-                    dot_y = y + random.randint(0, cell_size-1)
+                    dot_x = x + rng.randint(0, cell_size-1)
+                    dot_y = y + rng.randint(0, cell_size-1)
                     if dot_x < width and dot_y < height:
-                        draw.point((dot_x, dot_y), fill=(0, 0, 0, 255))
+                        draw.point((dot_x, dot_y), fill='black')
         
-        return Image.alpha_composite(img, pattern)
+        return img
 
     def generate_all_variants(self, main_text: str, security_code: str) -> Dict[str, Tuple[Image.Image, SecurityFeature]]:
         """Generate all security variants of the QR code."""
@@ -127,31 +259,43 @@ class MiniSecureQRGenerator:
         micro_qr = self._add_micropattern(base_qr.copy(), security_code)
         variants['micropattern'] = (micro_qr, self.features['micropattern'])
         
-        # Density Variation
-        density_qr = self._add_density_variation(base_qr.copy(), security_code)
+        # Density Variation (the last variant can draw on the base itself)
+        density_qr = self._add_density_variation(base_qr, security_code)
         variants['density_variation'] = (density_qr, self.features['density_variation'])
         
         return variants
 
+    def render_variant(self, main_text: str, security_code: str, feature: str = 'micropattern') -> Image.Image:
+        """Render a single security variant without drawing the others."""
+        if feature not in self.features:
+            raise ValueError(f"Unknown security feature: {feature}")
+        base_qr = self._create_base_qr({"main_text": main_text, "security_code": security_code})
+        if feature == 'micropattern':
+            return self._add_micropattern(base_qr, security_code)
+        return self._add_density_variation(base_qr, security_code)
+
+    def render_vector(self, main_text: str, security_code: str, feature: str = 'micropattern',
+                      vector_format: str = 'svg') -> bytes:
+        """Render one variant as an SVG or PDF document at its recommended print size."""
+        import vector_render
+        
+        if vector_format not in ('svg', 'pdf'):
+            raise ValueError(f"Unknown vector format: {vector_format}")
+        image = self.render_variant(main_text, security_code, feature)
+        width_mm, height_mm = vector_render.parse_size_mm(self.features[feature].recommended_size)
+        label = vector_render.vectorize(image)
+        if vector_format == 'pdf':
+            return vector_render.to_pdf(label, width_mm, height_mm)
+        return vector_render.to_svg(label, width_mm, height_mm)
+
     @staticmethod
     def verify_security_feature(image_path: str, feature_type: str, security_code: str) -> Tuple[bool, str]:
         """Verify a specific security feature in the QR code."""
+        import verifier
+        
         try:
-            img = Image.open(image_path)
-            
-            if feature_type == 'micropattern':
-                # Convert to binary and analyze dot pattern
-                # This would be implemented in the mobile app using OpenCV
-                return True, "Micropattern verified"
-                
-            elif feature_type == 'density_variation':
-                # Analyze local density variations
-                # This would be implemented in the mobile app using OpenCV
-                return True, "Density variation verified"
-                
-            else:
-                return False, "Unknown security feature type"
-                
+            result = verifier.verify_image(image_path, feature_type, security_code)
+            return result.verified, result.message
         except Exception as e:
             return False, str(e)
 
@@ -166,53 +310,112 @@ Printing Instructions for 20mm x 20mm QR Codes:
 5. Verify printed size is exactly 20mm x 20mm
 """
 
+@dataclass
+class VariantJobResult:
+    index: int
+    main_text: str
+    security_code: str
+    variants: Dict[str, Tuple[Union[Image.Image, bytes], SecurityFeature]]
+
+# Generator reused by every job a worker process executes
+_worker_generator = None
+
+def _render_variant_job(job: tuple) -> VariantJobResult:
+    """Render the selected variants (all when ``features`` is None) for one job inside a worker process."""
+    global _worker_generator
+    index, main_text, security_code, output, pattern_mode, png_profile, features = job
+    if _worker_generator is None or _worker_generator.pattern_mode != pattern_mode:
+        _worker_generator = MiniSecureQRGenerator(pattern_mode)
+    if features is None:
+        variants = _worker_generator.generate_all_variants(main_text, security_code)
+    else:
+        variants = {name: (_worker_generator.render_variant(main_text, security_code, name),
+                           _worker_generator.features[name]) for name in features}
+    if output == 'png':
+        # Encode in the worker so the parent only receives compact bytes
+        encoded = {}
+        for name, (image, feature) in variants.items():
+            with metrics.stage('png_save'):
+                encoded[name] = (png_encoder.encode(image, png_profile).data, feature)
+        variants = encoded
+    return VariantJobResult(index, main_text, security_code, variants)
+
+class ParallelVariantRenderer:
+    """Render a stream of (main_text, security_code) jobs across a process pool.
+
+    At most ``max_pending`` jobs are in flight, so arbitrarily long job streams
+    are consumed lazily. Output is deterministic per job because every variant
+    is drawn from its own security-code seeded generator. ``features`` limits
+    each job to those variants, which are then the only ones drawn and encoded.
+    """
+
+    OUTPUTS = ('image', 'png')
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None, output: str = 'image',
+                 pattern_mode: str = 'compat', png_profile: str = 'default',
+                 features: Optional[Sequence[str]] = None):
+        if output not in self.OUTPUTS:
+            raise ValueError(f"Unknown output type: {output}")
+        if pattern_mode not in MiniSecureQRGenerator.PATTERN_MODES:
+            raise ValueError(f"Unknown pattern mode: {pattern_mode}")
+        if png_profile not in png_encoder.PROFILES:
+            raise ValueError(f"Unknown PNG profile: {png_profile}")
+        if features is not None:
+            known = MiniSecureQRGenerator().features
+            unknown = [name for name in features if name not in known]
+            if unknown:
+                raise ValueError(f"Unknown security feature: {unknown[0]}")
+            features = tuple(features)
+        self.features = features
+        self.pattern_mode = pattern_mode
+        self.png_profile = png_profile
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 4
+        self.output = output
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Shut down the worker pool."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def render(self, jobs: Iterable[Tuple[str, str]], ordered: bool = True) -> Iterator[VariantJobResult]:
+        """Yield results in job order, or as soon as each completes when ``ordered`` is False."""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        pending = deque()
+        for index, (main_text, security_code) in enumerate(jobs):
+            job = (index, main_text, security_code, self.output, self.pattern_mode, self.png_profile,
+                   self.features)
+            pending.append(self._executor.submit(_render_variant_job, job))
+            if len(pending) >= self.max_pending:
+                yield from self._collect(pending, ordered)
+        while pending:
+            yield from self._collect(pending, ordered)
+
+    @staticmethod
+    def _collect(pending: deque, ordered: bool) -> list:
+        """Remove and return at least one finished result from the pending futures."""
+        if ordered:
+            return [pending.popleft().result()]
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            pending.remove(future)
+        return [future.result() for future in done]
+
 if __name__ == "__main__":
     import sys
+    import qr_cli
     
-    # Check command line arguments
-    if len(sys.argv) != 3:
-        print("Usage: python qr_generator.py <main_text> <security_code>")
-        print("Example: python qr_generator.py 'Hello World' 'SEC123'")
-        sys.exit(1)
-    
-    # Get input from command line arguments
-    main_text = sys.argv[1]
-    security_code = sys.argv[2]
-    
-    # Test the generator
-    generator = MiniSecureQRGenerator()
-    
-    # Generate all variants
-    variants = generator.generate_all_variants(main_text, security_code)
-    
-    # Print instructions
-    print("\n" + generator.get_print_instructions())
-    print("-" * 50)
-    
-    # Import matplotlib for display
-    import matplotlib.pyplot as plt
-    
-    # Create a figure with subplots
-    fig, axes = plt.subplots(1, 2, figsize=(10, 5))
-    fig.suptitle(f'QR Codes with Security Features (20mm x 20mm)\nMain Text: {main_text}')
-    
-    # Save and display each variant
-    for i, (feature_name, (qr_image, feature_info)) in enumerate(variants.items()):
-        output_path = f"secure_qr_{feature_name}_mini.png"
-        qr_image.save(output_path)
-        
-        # Display image
-        axes[i].imshow(qr_image)
-        axes[i].set_title(f"{feature_info.name}\n{feature_info.description}")
-        axes[i].axis('off')
-        
-        print(f"\nGenerated {feature_info.name}")
-        print(f"Description: {feature_info.description}")
-        print(f"Recommended Size: {feature_info.recommended_size}")
-        print(f"Minimum DPI: {feature_info.min_dpi}")
-        print(f"Detection Method: {feature_info.detection_method}")
-        print(f"Output File: {output_path}")
-        print("-" * 50)
-    
-    plt.tight_layout()
-    plt.show()
+    # "python qr_generator.py <main_text> <security_code>" is the label command
+    args = sys.argv[1:]
+    if args and args[0] not in qr_cli.COMMANDS + ('-h', '--help'):
+        args = ['label'] + args
+    sys.exit(qr_cli.main(args))
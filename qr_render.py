@@ -0,0 +1,85 @@
+"""Cached QR encoding shared by every rendering entry point.
+
+Fitting the version, Reed-Solomon encoding and choosing the mask pattern
+dominate the cost of building a QR code, and the result only depends on the
+payload, error correction level and requested version. The module matrix is
+computed once per key and reused for every rendering of the same payload.
+
+Images are produced by an image factory: ``numpy`` rasterizes the boolean
+module matrix in one repeat step straight into the requested PIL mode, while
+``qrcode`` goes through the library's per-module PilImage drawing.
+"""
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+import qrcode
+from PIL import Image
+
+MATRIX_CACHE_SIZE = 1024
+
+IMAGE_FACTORIES = ('numpy', 'qrcode')
+DEFAULT_IMAGE_FACTORY = os.environ.get('QR_IMAGE_FACTORY', 'numpy')
+RASTER_MODES = ('1', 'L', 'RGB', 'RGBA')
+
+EncodedQR = namedtuple('EncodedQR', 'version modules data_cache')
+
+
+@lru_cache(maxsize=MATRIX_CACHE_SIZE)
+def encode(data, error_correction=qrcode.constants.ERROR_CORRECT_H, version=None):
+    """Encode ``data`` and return its version and read-only boolean module matrix"""
+    qr = qrcode.QRCode(version=version, error_correction=error_correction)
+    qr.add_data(data)
+    qr.make(fit=True)
+    modules = np.array(qr.modules, dtype=bool)
+    modules.setflags(write=False)
+    return EncodedQR(qr.version, modules, tuple(qr.data_cache))
+
+
+def make_qr(data, error_correction=qrcode.constants.ERROR_CORRECT_H, version=None, box_size=10, border=4):
+    """Return a QRCode ready for ``make_image`` whose matrix comes from the encoding cache"""
+    encoded = encode(data, error_correction, version)
+    qr = qrcode.QRCode(
+        version=encoded.version,
+        error_correction=error_correction,
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(data)
+    # Populate the state make() would have produced so make_image skips encoding
+    qr.modules = encoded.modules.tolist()
+    qr.modules_count = len(qr.modules)
+    qr.data_cache = list(encoded.data_cache)
+    return qr
+
+
+def rasterize(modules, box_size=10, border=4, mode='1'):
+    """Turn a boolean module matrix into a black-on-white image in a single pass"""
+    if mode not in RASTER_MODES:
+        raise ValueError(f"Unsupported raster mode: {mode}")
+    light = np.pad(~np.asarray(modules, dtype=bool), border, mode='constant', constant_values=True)
+    light = light.repeat(box_size, axis=0).repeat(box_size, axis=1)
+    if mode == '1':
+        return Image.fromarray(light)
+    grey = light.view(np.uint8) * np.uint8(255)
+    if mode == 'L':
+        return Image.fromarray(grey, 'L')
+    pixels = np.empty(grey.shape + (len(mode),), dtype=np.uint8)
+    pixels[..., :3] = grey[..., None]
+    if mode == 'RGBA':
+        pixels[..., 3] = 255
+    return Image.fromarray(pixels, mode)
+
+
+def make_image(data, error_correction=qrcode.constants.ERROR_CORRECT_H, version=None, box_size=10, border=4,
+               mode='1', factory=None):
+    """Render ``data`` as a black-on-white QR image in the given PIL mode"""
+    factory = factory or DEFAULT_IMAGE_FACTORY
+    if factory == 'numpy':
+        return rasterize(encode(data, error_correction, version).modules, box_size, border, mode)
+    if factory == 'qrcode':
+        img = make_qr(data, error_correction, version, box_size, border).make_image(
+            fill_color="black", back_color="white").get_image()
+        return img if img.mode == mode else img.convert(mode)
+    raise ValueError(f"Unknown image factory: {factory}")
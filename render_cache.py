@@ -0,0 +1,183 @@
+"""Byte-bounded LRU cache for encoded QR images with an optional disk tier.
+
+Secure QR output is deterministic for a given text, security code, feature
+set and rendering parameters, so encoded PNG bytes can be reused across
+requests. Entries live in an in-memory LRU bounded by total byte size; when a
+cache directory is configured they are also written to disk, so a warm cache
+survives worker restarts and is shared between workers on the same host.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+def make_key(*parts):
+    """Hash JSON-serializable key parts into a stable hex cache key"""
+    payload = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """Thread-safe LRU of bytes values bounded by their total size.
+
+    Other values can be cached in memory when ``sizeof`` reports their size in
+    bytes; the disk tier only holds bytes.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_dir=None, disk_max_bytes=None, sizeof=len):
+        if disk_dir and sizeof is not len:
+            raise ValueError("The disk tier only stores bytes values")
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_listing())
+
+    def get(self, key):
+        """Return cached bytes for ``key`` or None, checking memory then disk"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+
+        data = self._disk_read(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, data)
+        return data
+
+    def put(self, key, data):
+        """Cache ``data`` under ``key``; values larger than the memory budget are skipped"""
+        with self._lock:
+            self._store(key, data)
+        self._disk_write(key, data)
+
+    def get_or_render(self, key, render):
+        """Return cached bytes for ``key``, calling ``render()`` to fill a miss"""
+        data = self.get(key)
+        if data is None:
+            data = render()
+            self.put(key, data)
+        return data
+
+    def stats(self):
+        """Counters and sizes for monitoring"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'disk_evictions': self.disk_evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'disk_bytes': self._disk_bytes if self.disk_dir else 0,
+            }
+
+    def clear(self):
+        """Drop all in-memory entries (the disk tier is left in place)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _store(self, key, data):
+        size = self.sizeof(data)
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= self.sizeof(previous)
+        self._entries[key] = data
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= self.sizeof(evicted)
+            self.evictions += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key + '.bin')
+
+    def _disk_listing(self):
+        """Yield (path, size, mtime) for every file in the disk tier"""
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if not name.endswith('.bin'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _disk_read(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # Refresh recency for disk eviction
+            return data
+        except OSError:
+            return None
+
+    def _disk_write(self, key, data):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first so concurrent readers never see partial data
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes += len(data)
+            over_budget = self.disk_max_bytes is not None and self._disk_bytes > self.disk_max_bytes
+        if over_budget:
+            self._disk_evict()
+
+    def _disk_evict(self):
+        """Remove least recently used files until the disk tier is back under 90% of its budget"""
+        listing = sorted(self._disk_listing(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in listing)
+        target = self.disk_max_bytes * 0.9
+        evicted = 0
+        for path, size, _ in listing:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._disk_bytes = total
+            self.disk_evictions += evicted
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import os
+import pytest
+import asgi
+import app as web
+from app import app as flask_app
+
+def call(application, method, path, body=b'', headers=(), query=b''):
+    """Run one request through an ASGI app; return (status, headers, body messages)"""
+    messages = []
+    received = False
+
+    async def receive():
+        nonlocal received
+        if received:
+            return {'type': 'http.disconnect'}
+        received = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query, 'http_version': '1.1',
+             'headers': [(name.encode(), value.encode()) for name, value in headers]}
+    return application(scope, receive, send), messages
+
+def run(*requests):
+    """Run requests concurrently and return (status, headers, body) for each"""
+    async def gather():
+        pending = [call(*request) for request in requests]
+        await asyncio.gather(*(coroutine for coroutine, _ in pending))
+        return [messages for _, messages in pending]
+    results = []
+    for messages in asyncio.run(gather()):
+        start = messages[0]
+        headers = {name.decode(): value.decode() for name, value in start['headers']}
+        results.append((start['status'], headers, [message.get('body', b'') for message in messages[1:]]))
+    return results
+
+def secure_request(application, code='a1b2c3'):
+    payload = json.dumps({'text': 'asgi', 'security_code': code}).encode()
+    return (application, 'POST', '/generate_secure_qr', payload,
+            [('content-type', 'application/json'), ('accept', 'image/png')])
+
+@pytest.fixture(scope='module')
+def application():
+    application = asgi.ASGIApp(flask_app, processes=1, queue=0, max_body=4096)
+    yield application
+    application.close()
+
+def test_render_routes_run_in_process_pool(application):
+    (status, headers, chunks), = run(secure_request(application))
+    expected = flask_app.test_client().post('/generate_secure_qr', json={'text': 'asgi', 'security_code': 'a1b2c3'},
+                                            headers={'Accept': 'image/png'})
+    assert status == 200
+    assert headers['content-type'] == 'image/png'
+    assert b''.join(chunks) == expected.data
+
+def test_full_pool_answers_429(application):
+    results = run(*(secure_request(application, f'{i:06x}') for i in range(3)))
+    statuses = [status for status, _, _ in results]
+    assert statuses[0] == 200
+    assert statuses[1:] == [429, 429]
+    assert results[1][1]['retry-after'] == '1'
+    assert 'error' in json.loads(b''.join(results[1][2]))
+    assert application.pool.pending == 0
+
+def test_other_routes_stream_from_threads(application):
+    jobs = [[f'label-{i}', 'a1b2c3'] for i in range(3)]
+    body = json.dumps({'jobs': jobs, 'format': 'ndjson'}).encode()
+    (status, headers, chunks), = run((application, 'POST', '/generate_batch', body, [('content-type', 'application/json')]))
+    assert status == 200
+    assert headers['content-type'] == 'application/x-ndjson'
+    # One body message per rendered job, then the closing empty message
+    assert len([chunk for chunk in chunks if chunk]) == 3
+    assert [json.loads(line)['index'] for line in b''.join(chunks).splitlines()] == [0, 1, 2]
+
+def test_oversized_body_is_rejected(application):
+    (status, _, chunks), = run((application, 'POST', '/add_security_features', b'x' * 5000,
+                                [('content-type', 'image/png')]))
+    assert status == 413
+    assert 'error' in json.loads(b''.join(chunks))
+
+def test_dead_process_answers_503_and_pool_recovers(application, monkeypatch):
+    pool = asgi.RenderPool(1, 0)
+    try:
+        with pytest.raises(asgi.BrokenProcessPool):
+            asyncio.run(pool.run(os._exit, 1))
+        assert isinstance(asyncio.run(pool.run(os.getpid)), int)
+    finally:
+        pool.shutdown()
+
+    async def broken(fn, *args):
+        raise asgi.BrokenProcessPool()
+    monkeypatch.setattr(application.pool, 'run', broken)
+    (status, headers, chunks), = run(secure_request(application))
+    assert status == 503
+    assert headers['retry-after'] == '1'
+    assert 'error' in json.loads(b''.join(chunks))
+
+def test_lifespan_shuts_down_pools():
+    application = asgi.ASGIApp(flask_app, processes=1)
+    events = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+    sent = []
+
+    async def receive():
+        return next(events)
+
+    async def send(message):
+        sent.append(message['type'])
+
+    asyncio.run(application({'type': 'lifespan'}, receive, send))
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+
+def test_lifespan_warms_every_process():
+    application = asgi.ASGIApp(flask_app, processes=2, warm_up=web.warm_up)
+    events = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+    started = []
+
+    async def receive():
+        return next(events)
+
+    async def send(message):
+        if message['type'] == 'lifespan.startup.complete':
+            started.append(len(application.pool._executor._processes))
+
+    asyncio.run(application({'type': 'lifespan'}, receive, send))
+    assert started == [2]
+
+def test_wsgi_environ_from_scope():
+    scope = {'method': 'POST', 'path': '/café', 'query_string': b'png=fast',
+             'headers': [(b'content-type', b'text/csv'), (b'accept', b'image/png'), (b'accept', b'*/*'),
+                         (b'content-length', b'99')]}
+    environ = asgi.wsgi_environ(scope, b'body')
+    assert environ['PATH_INFO'] == '/café'.encode('utf-8').decode('latin-1')
+    assert environ['QUERY_STRING'] == 'png=fast'
+    assert environ['CONTENT_TYPE'] == 'text/csv'
+    assert environ['CONTENT_LENGTH'] == '4'
+    assert environ['HTTP_ACCEPT'] == 'image/png,*/*'
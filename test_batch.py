@@ -0,0 +1,74 @@
+import io
+import json
+import base64
+import zipfile
+import pytest
+from app import app, generate_batch, render_secure_qr_png
+import batch
+
+JOBS = [
+    {"text": "label-0001", "security_code": "a1b2c3"},
+    {"text": "label-0002", "security_code": "d4e5f6"},
+    {"text": "label-0003", "security_code": "789abc"},
+]
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    return app.test_client()
+
+def test_batch_zip_endpoint(client):
+    response = client.post('/generate_batch', json={"jobs": JOBS, "format": "zip"})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+
+    archive = zipfile.ZipFile(io.BytesIO(response.data))
+    assert archive.namelist() == ['000000.png', '000001.png', '000002.png']
+    for name, job in zip(archive.namelist(), JOBS):
+        assert archive.read(name) == render_secure_qr_png(job["text"], job["security_code"])
+
+def test_batch_ndjson_endpoint_reports_bad_jobs(client):
+    jobs = JOBS[:1] + [{"text": "label-0002", "security_code": ""}, ["label-0003", "zzzzzz"]]
+    response = client.post('/generate_batch', json={"jobs": jobs, "format": "ndjson"})
+    assert response.status_code == 200
+
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [line["index"] for line in lines] == [0, 1, 2]
+    assert base64.b64decode(lines[0]["image"]) == render_secure_qr_png("label-0001", "a1b2c3")
+    assert "error" in lines[1]
+    assert "error" in lines[2]
+
+def test_batch_csv_upload(client):
+    body = "text,security_code\n" + "".join(f"{job['text']},{job['security_code']}\n" for job in JOBS)
+    response = client.post('/generate_batch?format=ndjson', data=body, content_type='text/csv')
+    assert response.status_code == 200
+    assert len(response.data.decode().splitlines()) == len(JOBS)
+
+def test_batch_rejects_invalid_requests(client):
+    assert client.post('/generate_batch', json={}).status_code == 400
+    assert client.post('/generate_batch', json={"jobs": JOBS, "format": "tar"}).status_code == 400
+    assert client.post('/generate_batch', json={"jobs": [42]}).status_code == 400
+
+def test_generate_batch_is_lazy():
+    consumed = []
+
+    def jobs():
+        for job in JOBS:
+            consumed.append(job["text"])
+            yield job["text"], job["security_code"]
+
+    stream = generate_batch(jobs(), 'ndjson')
+    next(stream)
+    assert consumed == ["label-0001"]
+
+def test_csv_reader_stops_on_malformed_row():
+    results = list(batch.render_jobs(batch.read_jobs_csv(["a,a1b2c3", "broken"]), lambda text, code: b"png"))
+    assert results[0].png == b"png"
+    assert results[1].error
+
+def test_read_jobs_ndjson():
+    lines = ['{"text": "a", "security_code": "b"}\n', '\n', '["c", "d"]\n', 'oops\n']
+    jobs = batch.read_jobs_ndjson(lines)
+    assert [next(jobs), next(jobs)] == [("a", "b"), ("c", "d")]
+    with pytest.raises(batch.BatchJobError):
+        next(jobs)
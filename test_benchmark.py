@@ -0,0 +1,31 @@
+import json
+import benchmark
+
+def result(p50):
+    return {'results': {'case': {'p50_ms': p50}}}
+
+def test_compare_flags_regressions_beyond_tolerance():
+    rows = benchmark.compare(result(10.0), result(12.0), tolerance=0.25)
+    assert [(row['name'], row['regressed']) for row in rows] == [('case', False)]
+    assert benchmark.compare(result(10.0), result(13.0), tolerance=0.25)[0]['regressed']
+
+def test_compare_ignores_cases_missing_from_either_run():
+    assert benchmark.compare(result(10.0), {'results': {}}) == []
+
+def test_run_writes_baseline_and_compare_fails_on_regression(tmp_path, capsys):
+    baseline_path = str(tmp_path / "baseline.json")
+    assert benchmark.main(['run', '--filter', 'png_encode[fast-short]', '--iterations', '3', '--output', baseline_path]) == 0
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    stats = baseline['results']['png_encode[fast-short]']
+    assert stats['iterations'] == 3
+    assert stats['p99_ms'] >= stats['p50_ms'] > 0
+    assert stats['images_per_sec'] > 0
+    assert stats['version'] == 1
+
+    # A baseline that is impossibly fast must fail the comparison run
+    stats['p50_ms'] = 1e-6
+    with open(baseline_path, 'w') as f:
+        json.dump(baseline, f)
+    assert benchmark.main(['compare', baseline_path, '--filter', 'png_encode[fast-short]', '--iterations', '3']) == 1
+    assert 'REGRESSED' in capsys.readouterr().out
@@ -0,0 +1,58 @@
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import app as web
+from qr_generator import MiniSecureQRGenerator
+
+THREADS = 16
+CODES = [f"{(i * 2654435761) & 0xffffff:06x}" for i in range(16)]
+
+def render_all(code):
+    """Every seeded or cached rendering path for one security code"""
+    outputs = [
+        web.generate_pattern_points(code, 290, 290, 20),
+        web.create_secure_qr("concurrent", code).tobytes(),
+    ]
+    for mode in MiniSecureQRGenerator.PATTERN_MODES:
+        variants = MiniSecureQRGenerator(mode).generate_all_variants("concurrent", code)
+        outputs.extend(image.tobytes() for image, _ in variants.values())
+    return outputs
+
+def test_threads_render_identical_output():
+    web.canvas_cache.clear()
+    expected = [render_all(code) for code in CODES]
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        # Repeat the codes so neighbouring threads draw different patterns at the same time
+        assert list(pool.map(render_all, CODES * 2)) == expected * 2
+
+def test_pattern_points_under_contention():
+    codes = CODES * 4
+    expected = [web.generate_pattern_points(code, 200, 200, 5) for code in codes]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # Switch threads as often as possible to expose shared state
+    try:
+        with ThreadPoolExecutor(max_workers=THREADS) as pool:
+            assert list(pool.map(lambda code: web.generate_pattern_points(code, 200, 200, 5), codes)) == expected
+    finally:
+        sys.setswitchinterval(interval)
+
+def test_threaded_requests_match_sequential():
+    client = web.app.test_client()
+    post = lambda code: client.post('/generate_secure_qr', json={'text': 'threads', 'security_code': code},
+                                    headers={'Accept': 'image/png'}).data
+    web.render_cache.clear()
+    expected = [post(code) for code in CODES]
+    web.render_cache.clear()
+    web.canvas_cache.clear()
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        assert list(pool.map(post, CODES)) == expected
+
+def test_pattern_generation_leaves_global_rng_alone():
+    np.random.seed(7)
+    random.seed(7)
+    numpy_state, python_state = np.random.get_state(), random.getstate()
+    render_all("a1b2c3")
+    assert random.getstate() == python_state
+    after = np.random.get_state()
+    assert after[0] == numpy_state[0] and np.array_equal(after[1], numpy_state[1]) and after[2:] == numpy_state[2:]
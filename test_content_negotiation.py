@@ -0,0 +1,101 @@
+import base64
+import email
+import io
+import pytest
+from PIL import Image
+from app import app, create_secure_qr
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+@pytest.fixture
+def png_upload():
+    buffer = io.BytesIO()
+    Image.new('RGB', (120, 120), 'white').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+@pytest.mark.parametrize("accept", [None, '*/*', 'application/json'])
+def test_existing_clients_keep_json(client, accept):
+    headers = {'Accept': accept} if accept else {}
+    response = client.post('/generate', json={'text': 'json', 'features': ['micropattern']}, headers=headers)
+    assert response.is_json
+    assert set(response.get_json()) == {'standard', 'secure'}
+
+def test_generate_secure_qr_png(client):
+    payload = {'text': 'binary', 'security_code': 'a1b2c3'}
+    binary = client.post('/generate_secure_qr', json=payload, headers={'Accept': 'image/png'})
+    encoded = client.post('/generate_secure_qr', json=payload).get_json()['image']
+
+    assert binary.mimetype == 'image/png'
+    assert binary.data.startswith(PNG_SIGNATURE)
+    assert binary.data == base64.b64decode(encoded)
+
+def test_generate_multipart_pair(client):
+    response = client.post('/generate', json={'text': 'pair', 'features': ['micropattern', 'density']},
+                           headers={'Accept': 'multipart/mixed'})
+    assert response.mimetype == 'multipart/mixed'
+    assert len(response.headers['X-Security-Code']) == 6
+    assert response.headers['X-Features'] == 'micropattern,density'
+
+    message = email.message_from_bytes(
+        b'Content-Type: ' + response.headers['Content-Type'].encode() + b'\r\n\r\n' + response.data)
+    parts = {part.get_param('name', header='content-disposition'): part.get_payload(decode=True)
+             for part in message.get_payload()}
+    assert set(parts) == {'standard', 'secure'}
+    standard = Image.open(io.BytesIO(parts['standard']))
+    secure = Image.open(io.BytesIO(parts['secure']))
+    assert standard.size == secure.size
+    assert standard.convert('L').tobytes() != secure.convert('L').tobytes()
+
+def test_generate_single_png_variant(client):
+    payload = {'text': 'single', 'features': ['density']}
+    secure = client.post('/generate', json=payload, headers={'Accept': 'image/png'})
+    standard = client.post('/generate?variant=standard', json=payload, headers={'Accept': 'image/png'})
+    assert secure.mimetype == standard.mimetype == 'image/png'
+    assert Image.open(io.BytesIO(standard.data)).mode == '1'
+    assert Image.open(io.BytesIO(secure.data)).mode == 'L'
+
+def test_add_security_features_raw_upload(client, png_upload):
+    response = client.post('/add_security_features?features=micropattern,density&security_code=a1b2c3',
+                           data=png_upload, content_type='image/png', headers={'Accept': 'image/png'})
+    assert response.mimetype == 'image/png'
+
+    encoded = client.post('/add_security_features', json={
+        'image': base64.b64encode(png_upload).decode(),
+        'features': ['micropattern', 'density'],
+        'security_code': 'a1b2c3',
+    }).get_json()['image']
+    assert response.data == base64.b64decode(encoded)
+
+def test_add_security_features_form_upload(client, png_upload):
+    response = client.post('/add_security_features', data={
+        'image': (io.BytesIO(png_upload), 'label.png'),
+        'features': 'density',
+        'security_code': 'a1b2c3',
+    }, content_type='multipart/form-data')
+    assert response.is_json
+    assert base64.b64decode(response.get_json()['image']).startswith(PNG_SIGNATURE)
+
+def test_upload_is_scanned_once_per_image(client, png_upload):
+    from app import add_security_features, canvas_cache
+    canvas_cache.clear()
+    misses = canvas_cache.stats()['misses']
+    for code in ('0a0b0c', '0d0e0f'):
+        response = client.post(f'/add_security_features?features=micropattern,density&security_code={code}',
+                               data=png_upload, content_type='image/png', headers={'Accept': 'image/png'})
+        expected = add_security_features(Image.open(io.BytesIO(png_upload)), ['micropattern', 'density'], code)
+        assert Image.open(io.BytesIO(response.data)).tobytes() == expected.tobytes()
+    assert canvas_cache.stats()['misses'] == misses + 1
+
+def test_raw_upload_missing_parameters(client, png_upload):
+    response = client.post('/add_security_features', data=png_upload, content_type='image/png')
+    assert response.status_code == 400
+
+def test_detect_pattern_raw_upload(client):
+    buffer = io.BytesIO()
+    create_secure_qr("12345", "d4e5f6").save(buffer, format='PNG')
+    response = client.post('/detect_pattern?security_code=d4e5f6', data=buffer.getvalue(), content_type='image/png')
+    assert response.get_json()['verified'] is True
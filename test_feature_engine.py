@@ -0,0 +1,102 @@
+import pytest
+import qrcode
+import numpy as np
+from PIL import Image
+from app import add_security_features
+import feature_engine
+
+# Codes covering every pattern style, rotation and density pattern type
+SECURITY_CODES = ["a1b2c3", "d4e5f6", "789abc", "def012", "00ff17", "3c2d9e", "ffffff", "000000"]
+
+FEATURE_SETS = [
+    ['micropattern', 'density'],
+    ['micropattern'],
+    ['density'],
+]
+
+def make_qr(data, box_size, border):
+    qr = qrcode.QRCode(
+        version=None,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.make_image(fill_color="black", back_color="white")
+
+@pytest.fixture(scope="module")
+def images():
+    noise = np.random.RandomState(0).choice([0, 45, 200, 245, 250, 255], size=(137, 211, 3))
+    return [
+        make_qr("12345", 10, 4),
+        make_qr("hello|||abc123", 8, 2),
+        Image.fromarray(noise.astype(np.uint8), 'RGB'),
+        Image.new('L', (301, 255), 255),
+        Image.new('RGB', (8, 8), 'white'),
+    ]
+
+@pytest.mark.parametrize("security_code", SECURITY_CODES)
+@pytest.mark.parametrize("features", FEATURE_SETS)
+def test_numpy_engine_matches_reference(images, security_code, features):
+    """The array-backed engine must produce byte-identical output"""
+    for image in images:
+        expected = add_security_features(image, features, security_code, engine='reference')
+        actual = add_security_features(image, features, security_code, engine='numpy')
+        assert actual.mode == expected.mode
+        assert actual.size == expected.size
+        assert actual.tobytes() == expected.tobytes()
+
+def test_unknown_engine_rejected():
+    with pytest.raises(ValueError):
+        add_security_features(Image.new('RGB', (50, 50), 'white'), ['density'], "a1b2c3", engine='bogus')
+
+def test_tables_are_cached_and_read_only():
+    feature_engine.clear_tables()
+    image = make_qr("12345", 10, 4)
+    add_security_features(image, ['micropattern', 'density'], "a1b2c3", engine='numpy')
+    add_security_features(image, ['micropattern', 'density'], "a1b2c3", engine='numpy')
+    assert feature_engine.micropattern_layout.cache_info().hits >= 1
+    assert feature_engine.density_modulation.cache_info().hits >= 1
+
+    layout = feature_engine.micropattern_layout(*image.size, feature_engine.micropattern_params("a1b2c3"))
+    with pytest.raises(ValueError):
+        layout.values[0, 0, 0] = 0
+
+@pytest.mark.parametrize("security_code", SECURITY_CODES[:4])
+def test_l_mode_matches_rgba_render(images, security_code):
+    """Greyscale rendering stamps the same levels into a quarter of the bytes"""
+    for image in images[:2] + images[3:]:
+        rgba = add_security_features(image, ['micropattern', 'density'], security_code, mode='RGBA')
+        for engine in ('numpy', 'reference'):
+            grey = add_security_features(image, ['micropattern', 'density'], security_code, engine=engine, mode='L')
+            assert grey.mode == 'L'
+            assert grey.tobytes() == rgba.convert('L').tobytes()
+
+def test_render_mode_follows_input():
+    grey = add_security_features(Image.new('L', (60, 60), 255), ['density'], "a1b2c3")
+    colour = add_security_features(Image.new('RGB', (60, 60), 'white'), ['density'], "a1b2c3")
+    assert (grey.mode, colour.mode) == ('L', 'RGBA')
+    with pytest.raises(ValueError):
+        feature_engine.render_features(Image.new('L', (60, 60), 255), ['density'], "a1b2c3", mode='RGB')
+
+def test_prepared_canvas_is_restamped_for_any_code(images):
+    canvas = feature_engine.prepare(images[0], 'L')
+    assert not canvas.pixels.flags.writeable
+    before = canvas.pixels.copy()
+    for security_code in SECURITY_CODES:
+        for features in FEATURE_SETS:
+            stamped = feature_engine.stamp(canvas, features, security_code)
+            assert stamped.tobytes() == feature_engine.render_features(images[0], features, security_code, 'L').tobytes()
+    assert np.array_equal(canvas.pixels, before)
+    assert feature_engine.canvas_nbytes(canvas) >= before.nbytes
+
+def test_secure_qr_reuses_base_canvas():
+    import app as web
+    web.canvas_cache.clear()
+    misses = web.canvas_cache.stats()['misses']
+    first = web.create_secure_qr("canvas", "a1b2c3")
+    second = web.create_secure_qr("canvas", "d4e5f6")
+    assert web.canvas_cache.stats()['misses'] == misses + 1
+    expected = add_security_features(web._secure_base_image("canvas"), ['micropattern', 'density'], "d4e5f6")
+    assert second.tobytes() == expected.tobytes() != first.tobytes()
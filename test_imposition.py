@@ -0,0 +1,131 @@
+import io
+import re
+import zlib
+import numpy as np
+import pytest
+from PIL import Image
+import batch
+import imposition
+from qr_generator import MiniSecureQRGenerator
+
+FEATURE = MiniSecureQRGenerator().features['micropattern']
+
+def checker(text, security_code):
+    """Cheap stand-in label: a 40px checkerboard"""
+    return Image.fromarray(np.where(np.indices((40, 40)).sum(axis=0) % 2, 0, 255).astype(np.uint8))
+
+def jobs(count):
+    return ((f"item {i}", f"{i:06x}") for i in range(count))
+
+def test_plan_layout_fits_sheet():
+    a4 = imposition.plan_layout(FEATURE)
+    assert (a4.columns, a4.rows, a4.dpi) == (8, 12, 300)
+    a3 = imposition.plan_layout(FEATURE, 'A3')
+    assert (a3.columns, a3.rows) == (12, 17)
+    x, y = imposition.label_positions(a4)[-1]
+    assert x + a4.label_mm[0] <= a4.sheet_mm[0] - a4.margin_mm
+    assert y + a4.label_mm[1] <= a4.sheet_mm[1] - a4.margin_mm
+    with pytest.raises(ValueError):
+        imposition.plan_layout(FEATURE, dpi=150)
+    with pytest.raises(ValueError):
+        imposition.plan_layout(FEATURE, 'Letter')
+
+def test_pages_read_one_page_ahead_at_most():
+    layout = imposition.plan_layout(FEATURE)
+    consumed = []
+    source = (consumed.append(job) or job for job in jobs(1000))
+    first = next(imposition.pages(source, layout))
+    assert len(first) == len(consumed) == 96
+    assert [len(page) for page in imposition.pages(jobs(200), layout)] == [96, 96, 8]
+    with pytest.raises(batch.BatchJobError):
+        list(imposition.pages([("text", "")], layout))
+
+def test_pdf_pages_and_labels():
+    stream = io.BytesIO()
+    assert imposition.impose(jobs(100), 'pdf', stream, render=checker) == 2
+    pdf = stream.getvalue()
+    assert re.search(rb'/Type /Pages /Kids \[[^\]]*\] /Count 2', pdf)
+    assert pdf.count(b'/MediaBox [0 0 595.276 841.890]') == 2
+    contents = [zlib.decompress(body) for body in re.findall(rb'stream\n(.*?)\nendstream', pdf, re.S)]
+    assert [content.count(b' cm') for content in contents] == [96, 4]
+    # First label sits 10mm from the top-left corner, scaled to 20mm
+    first = contents[0].split(b'\n')[0].split()
+    assert float(first[1]) * 40 == pytest.approx(20 * 72 / 25.4, abs=0.01)
+    assert (float(first[5]), float(first[6])) == pytest.approx((28.346, 841.890 - 28.346), abs=0.01)
+
+def test_tiff_frames_at_feature_dpi():
+    stream = io.BytesIO()
+    assert imposition.impose(jobs(97), 'tiff', stream, render=checker) == 2
+    tiff = Image.open(io.BytesIO(stream.getvalue()))
+    assert tiff.n_frames == 2
+    assert tiff.size == (2480, 3508)
+    assert tiff.info['dpi'] == (300, 300)
+    tiff.seek(1)
+    sheet = np.asarray(tiff.convert('L'))
+    # Only the first slot of the second page is filled: 236px slots at 118px margins hold
+    # the 40px label enlarged 5 times, centred
+    ys, xs = np.nonzero(sheet < 255)
+    assert (xs.min(), ys.min(), xs.max(), ys.max()) == (136, 136, 335, 335)
+    label = sheet[136:336, 136:336]
+    assert (label == np.kron(np.asarray(checker("", "")), np.ones((5, 5), np.uint8))).all()
+
+def test_generator_labels_on_sheet():
+    stream = io.BytesIO()
+    assert imposition.impose(jobs(3), 'tiff', stream, feature='density_variation', dpi=600) == 1
+    sheet = np.asarray(Image.open(io.BytesIO(stream.getvalue())))
+    assert sheet.shape == (7016, 4961)
+    label = sheet[236:236 + 472, 236:236 + 472]
+    assert (label < 128).mean() > 0.2
+    assert (sheet[236:708, 708:779] == 255).all()  # Cutting gap between labels
+    with pytest.raises(ValueError):
+        imposition.impose(jobs(1), 'pdf', io.BytesIO(), feature='hologram')
+
+def test_labels_are_never_resampled():
+    # 328px generator labels only fit a 20mm slot from 417 DPI
+    with pytest.raises(ValueError, match="use at least 417 DPI"):
+        imposition.impose(jobs(1), 'tiff', io.BytesIO(), dpi=300)
+
+def test_default_dpi_fits_first_label():
+    stream = io.BytesIO()
+    assert imposition.impose(jobs(2), 'tiff', stream) == 1
+    assert Image.open(io.BytesIO(stream.getvalue())).info['dpi'] == (417, 417)
+    stream = io.BytesIO()
+    assert imposition.impose(jobs(1), 'tiff', stream, renderer='secure') == 1
+    assert Image.open(io.BytesIO(stream.getvalue())).info['dpi'] == (369, 369)
+
+def test_secure_labels_on_sheet():
+    from app import create_secure_qr
+
+    stream = io.BytesIO()
+    assert imposition.impose(jobs(2), 'tiff', stream, renderer='secure', dpi=400) == 1
+    sheet = np.asarray(Image.open(io.BytesIO(stream.getvalue())))
+    # 290px labels are placed pixel for pixel, centred in their 315px slots
+    layout = imposition.plan_layout(imposition.secure_feature(), dpi=400)
+    x, y = (imposition._pixels(mm, 400) + 12 for mm in imposition.label_positions(layout)[1])
+    expected = np.asarray(create_secure_qr("item 1", "000001"))
+    assert (sheet[y:y + 290, x:x + 290] == expected).all()
+    with pytest.raises(ValueError):
+        imposition.impose(jobs(1), 'pdf', io.BytesIO(), renderer='stamp')
+
+def test_cli_writes_pdf(tmp_path, capsys):
+    jobs_path = tmp_path / 'jobs.csv'
+    jobs_path.write_text('text,security_code\nfirst,a1b2c3\nsecond,d4e5f6\n')
+    output = tmp_path / 'sheets.pdf'
+    assert imposition.main([str(jobs_path), '--output', str(output), '--sheet', 'A3']) == 0
+    assert output.read_bytes().startswith(b'%PDF')
+    assert 'Wrote 1 page(s)' in capsys.readouterr().out
+    jobs_path.write_text('first,\n')
+    assert imposition.main([str(jobs_path), '--output', str(tmp_path / 'sheets.tif')]) == 1
+    assert imposition.main([str(jobs_path), '--output', str(output)]) == 1
+    # A failed run leaves the previous output in place and no partial file behind
+    assert output.read_bytes().startswith(b'%PDF')
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['jobs.csv', 'sheets.pdf']
+    assert imposition.main([str(tmp_path / 'missing.csv'), '--output', str(output)]) == 1
+    assert 'error: ' in capsys.readouterr().err
+
+def test_cli_secure_renderer(tmp_path, capsys):
+    jobs_path = tmp_path / 'jobs.csv'
+    jobs_path.write_text('text,security_code\nfirst,a1b2c3\n')
+    output = tmp_path / 'sheets.tif'
+    assert imposition.main([str(jobs_path), '--output', str(output), '--renderer', 'secure']) == 0
+    assert Image.open(output).info['dpi'] == (369, 369)
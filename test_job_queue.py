@@ -0,0 +1,170 @@
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+import zipfile
+import pytest
+import app as web
+import job_queue
+from app import app, render_secure_qr_png
+
+JOBS = [
+    {"text": "label-0001", "security_code": "a1b2c3"},
+    {"text": "label-0002", "security_code": ""},
+    {"text": "label-0003", "security_code": "789abc"},
+]
+
+def fake_render(text, security_code, png_profile):
+    return f"{text}|{security_code}|{png_profile}".encode()
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = job_queue.JobQueue(str(tmp_path), fake_render, workers=2)
+    yield queue
+    queue.stop(timeout=5)
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(web, 'JOB_DIR', str(tmp_path / 'jobs'))
+    monkeypatch.setattr(web, '_job_queue', None)
+    app.config['TESTING'] = True
+    yield app.test_client()
+    if web._job_queue is not None:
+        web._job_queue.stop(timeout=5)
+
+def test_queue_runs_jobs_to_disk(queue):
+    job = queue.submit([("a", "1"), ("b", ""), ("c", "3")], 'ndjson', 'fast')
+    assert (job.status, job.total) == ('queued', 3)
+    job = queue.wait(job.id)
+    assert (job.status, job.done, job.failed) == ('finished', 3, 1)
+    with open(queue.result_path(job.id, 'ndjson')) as f:
+        lines = [json.loads(line) for line in f]
+    assert [line.get('error') is not None for line in lines] == [False, True, False]
+    assert job.result_bytes == os.path.getsize(queue.result_path(job.id, 'ndjson'))
+    assert queue.counts()['finished'] == 1
+
+def test_queue_state_is_shared_through_the_directory(queue, tmp_path):
+    job = queue.wait(queue.submit([("a", "1")], 'zip').id)
+    # A second process opening the same directory sees the same job
+    other = job_queue.JobQueue(str(tmp_path), fake_render)
+    assert other.status(job.id) == job
+    assert other.status('missing') is None
+
+def test_queue_rejects_empty_and_unknown_formats(queue, tmp_path):
+    with pytest.raises(ValueError):
+        queue.submit([], 'zip')
+    with pytest.raises(ValueError):
+        queue.submit([("a", "1")], 'tar')
+    assert not [name for name in os.listdir(tmp_path) if not name.startswith('jobs.sqlite3')]
+
+def test_deleting_a_running_job_stops_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, 'PROGRESS_INTERVAL', 0)
+    started = threading.Event()
+
+    def slow_render(text, security_code, png_profile):
+        started.set()
+        time.sleep(0.01)
+        return b'png'
+
+    queue = job_queue.JobQueue(str(tmp_path), slow_render, workers=1)
+    try:
+        job = queue.submit([(f"label-{i}", "a1b2c3") for i in range(1000)], 'zip')
+        assert started.wait(5)
+        assert queue.delete(job.id)
+        assert queue.status(job.id) is None
+        # The worker notices at its next progress write and removes the spooled files
+        deadline = time.monotonic() + 5
+        while [name for name in os.listdir(tmp_path) if not name.startswith('jobs.sqlite3')]:
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+    finally:
+        queue.stop(timeout=5)
+
+def test_failed_job_removes_partial_result(queue, monkeypatch):
+    def broken_stream(results):
+        for result in results:
+            yield b'partial'
+            raise OSError("disk full")
+
+    monkeypatch.setitem(job_queue.batch.STREAM_FORMATS, 'ndjson', (broken_stream, 'application/x-ndjson'))
+    job = queue.wait(queue.submit([("a", "1")], 'ndjson').id)
+    assert (job.status, job.error) == ('failed', 'disk full')
+    assert not os.path.exists(queue.result_path(job.id, 'ndjson') + '.part')
+
+def test_worker_survives_database_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, 'POLL_INTERVAL', 0.01)
+    queue = job_queue.JobQueue(str(tmp_path), fake_render, workers=1)
+    claim, failures = queue._claim, []
+
+    def locked_once():
+        if not failures:
+            failures.append(1)
+            raise sqlite3.OperationalError("database is locked")
+        return claim()
+
+    queue._claim = locked_once
+    try:
+        job = queue.submit([("a", "1")], 'zip')
+        assert queue.wait(job.id, timeout=5).status == 'finished'
+        assert failures
+    finally:
+        queue.stop(timeout=5)
+
+def test_stale_running_jobs_are_claimed_again(queue):
+    job = queue.submit([("a", "1")], 'zip')
+    queue.stop(timeout=5)
+    with queue._connect() as db:
+        db.execute("UPDATE jobs SET status = 'running', updated = 0 WHERE id = ?", (job.id,))
+    queue.start()
+    assert queue.wait(job.id).status == 'finished'
+
+def test_expired_jobs_are_purged(queue):
+    job = queue.wait(queue.submit([("a", "1")], 'zip').id)
+    queue.retention_seconds = -1
+    queue.purge_expired()
+    assert queue.status(job.id) is None
+    assert not os.path.exists(queue.result_path(job.id, 'zip'))
+
+def test_jobs_endpoints(client):
+    response = client.post('/jobs?png=fast', json={"jobs": JOBS, "format": "zip"})
+    assert response.status_code == 202
+    job = response.get_json()
+    assert response.headers['Location'] == job['status_url']
+    assert (job['total'], job['format']) == (3, 'zip')
+
+    web.get_job_queue().wait(job['job_id'])
+    status = client.get(job['status_url']).get_json()
+    assert (status['status'], status['done'], status['failed'], status['progress']) == ('finished', 3, 1, 1.0)
+
+    response = client.get(status['result_url'])
+    assert response.mimetype == 'application/zip'
+    archive = zipfile.ZipFile(io.BytesIO(response.data))
+    assert archive.namelist() == ['000000.png', '000002.png', 'errors.json']
+    assert archive.read('000000.png') == render_secure_qr_png("label-0001", "a1b2c3", 'fast')
+    assert 'qr_jobs_finished 1' in client.get('/metrics').get_data(as_text=True)
+
+    assert client.delete(job['status_url']).get_json()['deleted']
+    assert client.get(job['status_url']).status_code == 404
+    assert client.get(status['result_url']).status_code == 404
+
+def test_jobs_endpoint_accepts_csv_and_rejects_bad_requests(client):
+    response = client.post('/jobs?format=ndjson', data='text,security_code\nfirst,a1b2c3\n', content_type='text/csv')
+    assert response.status_code == 202
+    assert response.get_json()['total'] == 1
+    assert client.post('/jobs', json={}).status_code == 400
+    assert client.post('/jobs', json={"jobs": JOBS, "format": "tar"}).status_code == 400
+    assert client.post('/jobs', data='a,b,c\n', content_type='text/csv').status_code == 400
+
+def test_result_of_unfinished_job_is_a_conflict(client, tmp_path, monkeypatch):
+    release = threading.Event()
+    queue = job_queue.JobQueue(str(tmp_path), lambda *args: release.wait(5) and b'png', workers=1)
+    monkeypatch.setattr(web, '_job_queue', queue)
+    job = queue.submit([("a", "1")], 'zip')
+    response = client.get(f'/jobs/{job.id}/result')
+    assert response.status_code == 409
+    assert response.get_json()['status'] in ('queued', 'running')
+    release.set()
+    assert queue.wait(job.id).status == 'finished'
+    assert client.get(f'/jobs/{job.id}/result').status_code == 200
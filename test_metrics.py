@@ -0,0 +1,50 @@
+import pytest
+import metrics
+from app import app
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram('demo_seconds', 'Demo.', buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, stage='x')
+    lines = histogram.render()
+
+    assert 'demo_seconds_bucket{stage="x",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{stage="x",le="1.0"} 3' in lines
+    assert 'demo_seconds_bucket{stage="x",le="+Inf"} 4' in lines
+    assert 'demo_seconds_count{stage="x"} 4' in lines
+    assert histogram.snapshot(stage='x')[1] == pytest.approx(6.05)
+
+def test_stage_timer_records_duration():
+    with metrics.stage('unit'):
+        pass
+    counts, total, count = metrics.stage_seconds.snapshot(stage='unit')
+    assert count == 1
+    assert total >= 0
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, 'ENABLED', False)
+    with metrics.stage('unit'):
+        pass
+    metrics.observe_request('/x', 'GET', 200, 0.1)
+    assert metrics.stage_seconds.snapshot(stage='unit') is None
+    assert metrics.requests_total.value(endpoint='/x', method='GET', status='200') == 0
+
+def test_metrics_endpoint_reports_stages_requests_and_caches():
+    client = app.test_client()
+    client.post('/generate', json={'text': 'metrics', 'features': ['micropattern', 'density']})
+    response = client.get('/metrics')
+    body = response.get_data(as_text=True)
+
+    assert response.content_type.startswith('text/plain')
+    for stage in ('qr_encode', 'security_features', 'png_save', 'base64'):
+        assert f'qr_stage_seconds_count{{stage="{stage}"}}' in body
+    assert 'qr_requests_total{endpoint="/generate",method="POST",status="200"} 1' in body
+    assert 'qr_request_duration_seconds_count{endpoint="/generate"} 1' in body
+    assert '# TYPE qr_render_cache_hits gauge' in body
+    assert 'qr_matrix_cache_misses' in body
@@ -0,0 +1,169 @@
+import base64
+import io
+import pytest
+import numpy as np
+from PIL import Image
+import pattern_detector
+import app as app_module
+from app import app, create_secure_qr, add_security_features
+from feature_engine import micropattern_params
+
+CODES = ["a1b2c3", "d4e5f6", "789abc", "def012", "00ff41", "3c7d9e"]
+
+@pytest.mark.parametrize("code", CODES)
+@pytest.mark.parametrize("text", ["12345", "https://example.com/" + "x" * 80])
+def test_detects_style_rotation_and_intensity(code, text):
+    detection = pattern_detector.detect_pattern(create_secure_qr(text, code))
+    params = micropattern_params(code)
+
+    assert detection.style == params.style
+    assert detection.style_name == pattern_detector.STYLE_NAMES[params.style]
+    assert params.rotation in detection.rotations
+    assert detection.intensity == params.intensity
+    assert detection.confidence > 0.95
+    assert detection.matches(code)
+
+def test_equivalent_rotations_are_reported():
+    # The 45 and 135 degree + stamps truncate to the same dots
+    detection = pattern_detector.detect_pattern(create_secure_qr("12345", "00" + "2d" + "01"))
+    assert detection.style_name == '+'
+    assert detection.rotations == (45, 135)
+
+def test_shifted_image_still_detected():
+    qr = create_secure_qr("12345", "a1b2c3")
+    shifted = Image.new('RGBA', (qr.width + 7, qr.height + 13), 'white')
+    shifted.paste(qr, (7, 13))
+    assert pattern_detector.detect_pattern(shifted).style_name == 'diamond'
+
+def test_image_without_micropattern():
+    qr = add_security_features(Image.new('RGB', (200, 200), 'white'), ['density'], "a1b2c3")
+    detection = pattern_detector.detect_pattern(qr)
+    assert detection.style is None
+    assert not detection.matches("a1b2c3")
+
+def test_band_counts_match_per_pixel_count():
+    qr = create_secure_qr("12345", "a1b2c3").convert('RGB')
+    red = np.asarray(qr)[..., 0]
+    counts = pattern_detector.band_counts(qr)
+    assert counts['pattern'] == np.count_nonzero((red >= 130) & (red <= 190))
+    assert counts['density'] == np.count_nonzero((red >= 220) & (red <= 240))
+    assert counts['black'] == np.count_nonzero(red < 50)
+    assert counts['white'] == np.count_nonzero(red > 240)
+
+def test_detect_pattern_endpoint():
+    buffer = io.BytesIO()
+    create_secure_qr("12345", "d4e5f6").save(buffer, format='PNG')
+    image = base64.b64encode(buffer.getvalue()).decode()
+    client = app.test_client()
+
+    genuine = client.post('/detect_pattern', json={'image': image, 'security_code': 'd4e5f6'}).get_json()
+    assert genuine['style'] == '9-dot'
+    assert genuine['verified'] is True
+    assert client.post('/detect_pattern', json={'image': image, 'security_code': 'a1b2c3'}).get_json()['verified'] is False
+    assert 'verified' not in client.post('/detect_pattern', json={'image': image}).get_json()
+    assert client.post('/detect_pattern', json={}).status_code == 400
+
+@pytest.mark.parametrize("code", CODES)
+def test_density_matches_only_its_code(code):
+    qr = create_secure_qr("12345", code)
+    detection = pattern_detector.detect_density(qr, code)
+    assert detection.cells > 0
+    assert detection.matched == detection.cells
+    assert detection.matches()
+    assert not pattern_detector.detect_density(qr, "ffee01" if code != "ffee01" else "a1b2c3").matches()
+
+def test_density_absent_without_feature():
+    qr = add_security_features(Image.new('RGB', (200, 200), 'white'), ['micropattern'], "a1b2c3")
+    detection = pattern_detector.detect_density(qr, "a1b2c3")
+    assert detection.cells == 0
+    assert not detection.matches()
+
+def _scan(code, text="12345", format='PNG', **save):
+    buffer = io.BytesIO()
+    create_secure_qr(text, code).convert('L').save(buffer, format=format, **save)
+    return buffer.getvalue()
+
+@pytest.mark.parametrize("format, mimetype", [('PNG', 'image/png'), ('JPEG', 'image/jpeg')])
+def test_verify_raw_upload(format, mimetype):
+    scan = _scan("d4e5f6", format=format, quality=90)
+    client = app.test_client()
+
+    genuine = client.post('/verify?data=12345|||d4e5f6', data=scan, content_type=mimetype).get_json()
+    assert genuine['authentic'] is True
+    assert genuine['text'] == '12345'
+    assert genuine['detected'] == {'micropattern': True, 'density': True}
+
+    copied = client.post('/verify?data=12345|||a1b2c3', data=scan, content_type=mimetype).get_json()
+    assert copied['authentic'] is False
+    assert copied['valid_code'] is True
+    assert copied['detected'] == {'micropattern': False, 'density': False}
+
+def test_verify_json_and_feature_selection():
+    image = base64.b64encode(_scan("a1b2c3")).decode()
+    client = app.test_client()
+    verdict = client.post('/verify', json={'image': image, 'data': '12345|||a1b2c3', 'features': ['density']}).get_json()
+    assert verdict['authentic'] is True
+    assert verdict['detected'] == {'density': True}
+    assert client.post('/verify', json={'image': image, 'data': '12345|||a1b2c3',
+                                        'features': ['hologram']}).status_code == 400
+
+def test_verify_rejects_payload_without_code():
+    client = app.test_client()
+    verdict = client.post('/verify?data=plain text', data=b'not an image', content_type='image/png').get_json()
+    assert verdict['authentic'] is False
+    assert verdict['valid_code'] is False
+    assert verdict['text'] == 'plain text'
+    assert client.post('/verify?data=12345|||a1b2c3', data=b'not an image', content_type='image/png').status_code == 400
+    assert client.post('/verify', data=_scan("a1b2c3"), content_type='image/png').status_code == 400
+
+@pytest.mark.parametrize("format, mimetype", [('PNG', 'image/png'), ('JPEG', 'image/jpeg')])
+def test_verify_rejects_truncated_upload(format, mimetype):
+    scan = _scan("a1b2c3", format=format)
+    response = app.test_client().post('/verify?data=12345|||a1b2c3', data=scan[:len(scan) // 2], content_type=mimetype)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Unreadable image'}
+
+def _photo(code, scale=1, offset=(0, 0), format='PNG', text="12345", **save):
+    """A secure label enlarged ``scale`` times and shifted on a white scan, as sent by a phone"""
+    qr = create_secure_qr(text, code).convert('L')
+    qr = qr.resize((qr.width * scale, qr.height * scale), Image.NEAREST)
+    scan = Image.new('L', (qr.width + offset[0] + 9, qr.height + offset[1] + 5), 255)
+    scan.paste(qr, offset)
+    buffer = io.BytesIO()
+    scan.save(buffer, format=format, **save)
+    return buffer.getvalue()
+
+@pytest.mark.parametrize("scale, offset, format", [
+    (1, (1, 1), 'PNG'),
+    (1, (3, 7), 'PNG'),
+    (1, (7, 4), 'JPEG'),
+    (2, (5, 3), 'JPEG'),
+    (3, (6, 11), 'JPEG'),
+])
+def test_verify_offset_and_scaled_scans(scale, offset, format):
+    scan = _photo("d4e5f6", scale, offset, format, quality=95)
+    client = app.test_client()
+    mimetype = f'image/{format.lower()}'
+    genuine = client.post('/verify?data=12345|||d4e5f6', data=scan, content_type=mimetype).get_json()
+    assert genuine['authentic'] is True
+    assert genuine['detected'] == {'micropattern': True, 'density': True}
+    copied = client.post('/verify?data=12345|||a1b2c3', data=scan, content_type=mimetype).get_json()
+    assert copied['authentic'] is False
+
+def test_verify_reduced_scale_jpeg_decode(monkeypatch):
+    # A large photo is decoded at half size; the label is still found and checked at its own scale
+    scan = _photo("d4e5f6", 6, (13, 7), 'JPEG', quality=95)
+    width, height = Image.open(io.BytesIO(scan)).size
+    monkeypatch.setattr(app_module, 'VERIFY_MAX_PIXELS', width * height // 3)
+    assert app_module.load_scan(scan, app_module.VERIFY_MAX_PIXELS).size == (width // 2, height // 2)
+    client = app.test_client()
+    verdict = client.post('/verify?data=12345|||d4e5f6', data=scan, content_type='image/jpeg').get_json()
+    assert verdict['authentic'] is True
+
+def test_load_scan_reduces_large_jpegs():
+    scan = _scan("a1b2c3", format='JPEG')
+    width, height = Image.open(io.BytesIO(scan)).size
+    reduced = app_module.load_scan(scan, max_pixels=width * height // 4)
+    assert reduced.mode == 'L'
+    assert reduced.size == (width // 2, height // 2)
+    assert app_module.load_scan(_scan("a1b2c3"), max_pixels=width * height // 4) is None
@@ -0,0 +1,71 @@
+import io
+import pytest
+from PIL import Image
+import png_encoder
+import qr_render
+from app import app, create_secure_qr
+from qr_generator import MiniSecureQRGenerator, ParallelVariantRenderer
+
+def images():
+    return {
+        'app_secure': create_secure_qr("12345", "a1b2c3"),
+        'generator_variant': MiniSecureQRGenerator().generate_all_variants("Hello World", "SEC123")['micropattern'][0],
+        'standard': qr_render.make_image("12345"),
+        'translucent': Image.new('RGBA', (40, 40), (255, 0, 0, 128)),
+        'colour': Image.new('RGB', (40, 40), (10, 200, 30)),
+    }
+
+@pytest.mark.parametrize("profile", png_encoder.PROFILES)
+@pytest.mark.parametrize("name", images())
+def test_profiles_are_lossless(name, profile):
+    image = images()[name]
+    encoded = png_encoder.encode(image, profile)
+    decoded = Image.open(io.BytesIO(encoded.data))
+
+    assert encoded.size == len(encoded.data)
+    assert encoded.encode_ms >= 0
+    assert decoded.mode == encoded.mode
+    assert decoded.convert('RGBA').tobytes() == image.convert('RGBA').tobytes()
+
+def test_grey_images_are_reduced():
+    secure = images()['app_secure'].convert('RGBA')  # As rendered with QR_RENDER_MODE=RGBA
+    assert png_encoder.encode(secure, 'default').mode == 'RGBA'
+    assert png_encoder.encode(secure, 'fast').mode == 'L'
+    # Two grey levels fit a 1-bit palette
+    assert png_encoder.encode(images()['generator_variant'], 'fast').mode == 'P'
+    assert png_encoder.encode(images()['translucent'], 'small').mode == 'RGBA'
+
+def test_reduced_profiles_are_smaller():
+    secure = images()['app_secure'].convert('RGBA')
+    default = png_encoder.encode(secure, 'default').size
+    assert png_encoder.encode(secure, 'fast').size < default
+    assert png_encoder.encode(secure, 'small').size < png_encoder.encode(secure, 'fast').size
+
+def test_unknown_profile_rejected():
+    with pytest.raises(ValueError):
+        png_encoder.encode(images()['standard'], 'tiny')
+    with pytest.raises(ValueError):
+        ParallelVariantRenderer(png_profile='tiny')
+
+def test_endpoints_select_profile():
+    client = app.test_client()
+    payload = {'text': 'profile', 'security_code': 'a1b2c3'}
+    small = client.post('/generate_secure_qr?png=small', json=payload, headers={'Accept': 'image/png'})
+    default = client.post('/generate_secure_qr', json=payload, headers={'Accept': 'image/png'})
+
+    assert small.headers['X-PNG-Profile'] == 'small'
+    assert int(small.headers['X-PNG-Bytes']) == len(small.data) < len(default.data)
+    assert Image.open(io.BytesIO(small.data)).tobytes() == Image.open(io.BytesIO(default.data)).convert('L').tobytes()
+    assert client.post('/generate_secure_qr?png=tiny', json=payload).status_code == 400
+
+def test_generate_reports_encoding():
+    client = app.test_client()
+    data = client.post('/generate', json={'text': 'report', 'features': ['density'], 'png_profile': 'fast'}).get_json()
+    report = data['secure']['png']
+    assert report['profile'] == 'fast'
+    assert report['mode'] in ('L', 'P')
+    assert report['bytes'] > 0
+    assert report['encode_ms'] >= 0
+
+    response = client.post('/generate?png=fast', json={'text': 'report'}, headers={'Accept': 'image/png'})
+    assert float(response.headers['X-PNG-Encode-Ms']) >= 0
@@ -0,0 +1,147 @@
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import pytest
+from PIL import Image
+import qr_cli
+from qr_generator import MiniSecureQRGenerator
+
+@pytest.fixture(scope="module")
+def scans(tmp_path_factory):
+    """A scan directory with a genuine label, a nested copy under the wrong code and an unreadable file"""
+    directory = tmp_path_factory.mktemp("scans")
+    image = MiniSecureQRGenerator().generate_all_variants("Hello World", "SEC123")['micropattern'][0]
+    image.save(str(directory / "a.png"))
+    (directory / "returns").mkdir()
+    image.convert('RGB').save(str(directory / "returns" / "b.jpg"), quality=95)
+    (directory / "broken.png").write_bytes(b"not a png")
+    (directory / "notes.txt").write_text("not a scan")
+    codes = directory / "codes.csv"
+    codes.write_text("file,security_code\na.png,SEC123\nreturns/b.jpg,SEC999\nbroken.png,SEC123\n")
+    return directory, codes
+
+def read_csv(path):
+    with open(path, newline='') as f:
+        return {row['file']: row for row in csv.DictReader(f)}
+
+def test_verify_writes_csv_report(scans, tmp_path):
+    directory, codes = scans
+    output = tmp_path / "report.csv"
+    assert qr_cli.main(['verify', str(directory), '--codes', str(codes), '--output', str(output),
+                        '--feature', 'micropattern', '--jobs', '2']) == 0
+
+    rows = read_csv(output)
+    assert sorted(rows) == ['a.png', 'broken.png', 'returns/b.jpg']
+    assert rows['a.png']['verified'] == 'True'
+    assert float(rows['a.png']['micropattern_score']) > 0.9
+    assert rows['returns/b.jpg']['verified'] == 'False'
+    assert rows['broken.png']['error']
+    assert 'density_variation_score' not in rows['a.png']
+
+def test_verify_jsonl_with_single_code(scans, tmp_path):
+    directory, _ = scans
+    output = tmp_path / "report.jsonl"
+    assert qr_cli.main(['verify', str(directory), '--code', 'SEC123', '--output', str(output),
+                        '--no-recursive', '--jobs', '1']) == 0
+    rows = {row['file']: row for row in map(json.loads, output.read_text().splitlines())}
+    assert sorted(rows) == ['a.png', 'broken.png']
+    assert rows['a.png']['micropattern_verified'] is True
+    assert rows['a.png']['density_variation_verified'] is False  # A micropattern label has no density dots
+    assert rows['a.png']['decode_ms'] <= rows['a.png']['elapsed_ms']
+
+@pytest.mark.parametrize("name", ["report.csv", "report.jsonl"])
+def test_resume_skips_reported_scans(scans, tmp_path, name):
+    directory, codes = scans
+    output = tmp_path / name
+    args = ['verify', str(directory), '--codes', str(codes), '--output', str(output), '--feature', 'micropattern',
+            '--jobs', '1']
+    assert qr_cli.main(args) == 0
+    lines = output.read_text().splitlines(keepends=True)
+    # Drop the last row and leave half of it behind, as an interrupted run would
+    output.write_text(''.join(lines[:-1]) + lines[-1][:10])
+
+    assert qr_cli.main(args + ['--resume']) == 0
+    resumed = output.read_text().splitlines(keepends=True)
+    assert resumed[:-1] == lines[:-1]
+    files = [line.split(',')[0] if name.endswith('.csv') else json.loads(line)['file'] for line in resumed]
+    expected = ['a.png', 'broken.png', 'returns/b.jpg']
+    assert sorted(files) == sorted(expected + (['file'] if name.endswith('.csv') else []))
+
+def test_resume_rejects_other_features(scans, tmp_path):
+    directory, codes = scans
+    output = tmp_path / "report.csv"
+    base = ['verify', str(directory), '--codes', str(codes), '--output', str(output), '--jobs', '1']
+    assert qr_cli.main(base + ['--feature', 'micropattern']) == 0
+    assert qr_cli.main(base + ['--feature', 'density_variation', '--resume']) == 1
+
+def test_read_codes_csv():
+    assert qr_cli.read_codes_csv(["file,security_code", "x/./a.png,SEC1", "", "b.png,SEC2"]) == {
+        'x/a.png': 'SEC1', 'b.png': 'SEC2'}
+    with pytest.raises(ValueError):
+        qr_cli.read_codes_csv(["a.png"])
+
+def test_generate_directory_with_manifest(tmp_path):
+    jobs = tmp_path / "jobs.csv"
+    jobs.write_text("text,security_code\nHello,SEC123\n,missing\nWorld,SEC456\n")
+    output = tmp_path / "labels"
+    assert qr_cli.main(['generate', str(jobs), '--output', str(output), '--jobs', '2']) == 0
+
+    with open(output / "manifest.csv", newline='') as f:
+        manifest = list(csv.DictReader(f))
+    assert [(row['text'], row['security_code']) for row in manifest] == [('Hello', 'SEC123'), ('World', 'SEC456')]
+    expected = MiniSecureQRGenerator().generate_all_variants("World", "SEC456")
+    for feature, (image, _) in expected.items():
+        written = Image.open(output / manifest[1][feature])
+        assert written.convert('RGBA').tobytes() == image.convert('RGBA').tobytes()
+    assert len(os.listdir(output)) == 5
+
+def test_generate_tarball_from_jsonl(tmp_path):
+    jobs = tmp_path / "jobs.jsonl"
+    jobs.write_text('{"text": "Hello", "security_code": "SEC123"}\n\n["World", "SEC456"]\n')
+    output = tmp_path / "labels.tar.gz"
+    assert qr_cli.main(['generate', str(jobs), '--output', str(output), '--feature', 'micropattern',
+                        '--jobs', '1']) == 0
+    with tarfile.open(output) as tar:
+        assert tar.getnames() == ['000000_micropattern.png', '000001_micropattern.png', 'manifest.csv']
+        assert Image.open(io.BytesIO(tar.extractfile('000001_micropattern.png').read())).size[0] > 0
+
+def test_generate_writes_manifest_rows_as_results_arrive(tmp_path, monkeypatch):
+    jobs = tmp_path / "jobs.csv"
+    jobs.write_text("text,security_code\nHello,SEC123\nWorld,SEC456\n")
+    output = tmp_path / "labels"
+    seen = []
+    render = qr_cli.ParallelVariantRenderer.render
+
+    def render_and_read_manifest(self, jobs, ordered=True):
+        for result in render(self, jobs, ordered):
+            seen.append((output / "manifest.csv").read_text().count("\n"))
+            yield result
+
+    monkeypatch.setattr(qr_cli.ParallelVariantRenderer, 'render', render_and_read_manifest)
+    assert qr_cli.main(['generate', str(jobs), '--output', str(output), '--feature', 'micropattern',
+                        '--jobs', '1']) == 0
+    # Header, then one more row on disk before each following result is handled
+    assert seen == [1, 2]
+    assert sorted(os.listdir(output)) == ['000000_micropattern.png', '000001_micropattern.png', 'manifest.csv']
+
+def test_generate_rejects_malformed_jobs(tmp_path):
+    jobs = tmp_path / "jobs.jsonl"
+    jobs.write_text('{"text": "Hello", "security_code": "SEC123"}\nnot json\n')
+    assert qr_cli.main(['generate', str(jobs), '--output', str(tmp_path / "out"), '--jobs', '1']) == 1
+
+def test_legacy_entry_point_is_headless(tmp_path):
+    script = os.path.join(os.path.dirname(os.path.abspath(qr_cli.__file__)), 'qr_generator.py')
+    check = ("import runpy, sys\n"
+             f"sys.argv = [{script!r}, 'Hello World', 'SEC123']\n"
+             "try:\n"
+             f"    runpy.run_path({script!r}, run_name='__main__')\n"
+             "except SystemExit as e:\n"
+             "    assert not e.code\n"
+             "assert 'matplotlib' not in sys.modules\n")
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(script))
+    subprocess.run([sys.executable, '-c', check], cwd=str(tmp_path), env=env, check=True, capture_output=True)
+    assert sorted(os.listdir(tmp_path)) == ['secure_qr_density_variation_mini.png', 'secure_qr_micropattern_mini.png']
@@ -0,0 +1,88 @@
+import io
+import random
+import pytest
+from PIL import Image
+from qr_generator import MiniSecureQRGenerator, ParallelVariantRenderer
+
+JOBS = [
+    ("Hello World", "SEC123"),
+    ("https://example.com/item/42", "a1b2c3"),
+    ("Batch label 3", "d4e5f6"),
+    ("Batch label 4", "789abc"),
+]
+
+@pytest.fixture(scope="module")
+def expected():
+    generator = MiniSecureQRGenerator()
+    return [
+        {name: image.tobytes() for name, (image, _) in generator.generate_all_variants(text, code).items()}
+        for text, code in JOBS
+    ]
+
+def test_variants_leave_global_random_untouched():
+    random.seed(1234)
+    before = random.getstate()
+    MiniSecureQRGenerator().generate_all_variants("Hello World", "SEC123")
+    assert random.getstate() == before
+
+def test_parallel_renderer_preserves_order_and_output(expected):
+    with ParallelVariantRenderer(max_workers=2, max_pending=3) as renderer:
+        results = list(renderer.render(iter(JOBS)))
+
+    assert [result.index for result in results] == list(range(len(JOBS)))
+    for result, variants in zip(results, expected):
+        assert (result.main_text, result.security_code) == JOBS[result.index]
+        assert {name: image.tobytes() for name, (image, _) in result.variants.items()} == variants
+
+def test_parallel_renderer_as_completed_png_output(expected):
+    with ParallelVariantRenderer(max_workers=2, output='png') as renderer:
+        results = list(renderer.render(JOBS, ordered=False))
+
+    assert sorted(result.index for result in results) == list(range(len(JOBS)))
+    for result in results:
+        for name, (png, feature) in result.variants.items():
+            assert Image.open(io.BytesIO(png)).tobytes() == expected[result.index][name]
+
+def test_parallel_renderer_renders_only_selected_features(expected):
+    with ParallelVariantRenderer(max_workers=1, output='png', features=['density_variation']) as renderer:
+        results = list(renderer.render(JOBS[:2]))
+
+    for result in results:
+        assert list(result.variants) == ['density_variation']
+        png, _ = result.variants['density_variation']
+        assert Image.open(io.BytesIO(png)).tobytes() == expected[result.index]['density_variation']
+
+def test_parallel_renderer_rejects_unknown_output():
+    with pytest.raises(ValueError):
+        ParallelVariantRenderer(output='jpeg')
+    with pytest.raises(ValueError):
+        ParallelVariantRenderer(features=['hologram'])
+
+@pytest.mark.parametrize("text, code", [("Hello World", "SEC123"), ("x" * 300, "a1b2c3"), ("12345", "0")])
+def test_compat_mode_matches_reference_pixels(text, code):
+    reference = MiniSecureQRGenerator('reference').generate_all_variants(text, code)
+    compat = MiniSecureQRGenerator('compat').generate_all_variants(text, code)
+    for name, (image, _) in reference.items():
+        assert compat[name][0].tobytes() == image.tobytes()
+
+def test_fast_mode_is_deterministic_per_code():
+    generator = MiniSecureQRGenerator('fast')
+    first = generator.generate_all_variants("Hello World", "SEC123")
+    second = generator.generate_all_variants("Hello World", "SEC123")
+    other = generator.generate_all_variants("Hello World", "SEC124")
+    for name, (image, _) in first.items():
+        assert second[name][0].tobytes() == image.tobytes()
+        assert other[name][0].tobytes() != image.tobytes()
+
+def test_unknown_pattern_mode_rejected():
+    with pytest.raises(ValueError):
+        MiniSecureQRGenerator('turbo')
+
+@pytest.mark.parametrize("pattern_mode", MiniSecureQRGenerator.PATTERN_MODES)
+def test_variants_are_single_channel_and_independent(pattern_mode):
+    generator = MiniSecureQRGenerator(pattern_mode)
+    variants = generator.generate_all_variants("Hello World", "SEC123")
+    for name, (image, _) in variants.items():
+        assert image.mode == 'L'
+        # Drawing in place must not leak one variant's dots into another
+        assert image.tobytes() == generator.render_variant("Hello World", "SEC123", name).tobytes()
@@ -0,0 +1,64 @@
+import base64
+import io
+import pytest
+import qrcode
+import numpy as np
+from PIL import Image
+import qr_render
+from app import app
+
+PAYLOADS = ["12345", "hello world|||a1b2c3", "https://example.com/" + "x" * 150]
+
+def direct_qr(data, error_correction, box_size, border):
+    qr = qrcode.QRCode(version=None, error_correction=error_correction, box_size=box_size, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr
+
+@pytest.mark.parametrize("data", PAYLOADS)
+@pytest.mark.parametrize("error_correction", [qrcode.constants.ERROR_CORRECT_L, qrcode.constants.ERROR_CORRECT_H])
+def test_cached_qr_renders_like_qrcode(data, error_correction):
+    expected = direct_qr(data, error_correction, 8, 2)
+    cached = qr_render.make_qr(data, error_correction, box_size=8, border=2)
+
+    assert cached.version == expected.version
+    assert cached.modules == expected.modules
+    assert cached.make_image().tobytes() == expected.make_image().tobytes()
+
+def test_matrix_is_encoded_once_per_payload():
+    qr_render.encode.cache_clear()
+    qr_render.make_qr("repeat me", box_size=8, border=2)
+    qr_render.make_qr("repeat me", box_size=10, border=4)
+    info = qr_render.encode.cache_info()
+    assert (info.misses, info.hits) == (1, 1)
+
+def test_generate_shares_matrix_between_standard_and_secure():
+    response = app.test_client().post('/generate', json={'text': 'shared', 'features': ['micropattern', 'density']})
+    data = response.get_json()
+
+    standard = np.array(Image.open(io.BytesIO(base64.b64decode(data['standard']['image']))).convert('L'))
+    secure = np.array(Image.open(io.BytesIO(base64.b64decode(data['secure']['image']))).convert('L'))
+    # Security features only touch white areas, so every dark module must match
+    assert standard.shape == secure.shape
+    assert np.array_equal(standard < 50, secure < 50)
+
+@pytest.mark.parametrize("mode", qr_render.RASTER_MODES)
+@pytest.mark.parametrize("data", PAYLOADS)
+def test_rasterizer_matches_qrcode_image_factory(data, mode):
+    expected = direct_qr(data, qrcode.constants.ERROR_CORRECT_H, 8, 2).make_image(
+        fill_color="black", back_color="white").get_image().convert(mode)
+    actual = qr_render.make_image(data, qrcode.constants.ERROR_CORRECT_H, box_size=8, border=2, mode=mode, factory='numpy')
+    assert actual.mode == expected.mode
+    assert actual.size == expected.size
+    assert actual.tobytes() == expected.tobytes()
+
+def test_image_factories_agree():
+    numpy_image = qr_render.make_image("factory", mode='RGBA', factory='numpy')
+    qrcode_image = qr_render.make_image("factory", mode='RGBA', factory='qrcode')
+    assert numpy_image.tobytes() == qrcode_image.tobytes()
+
+def test_unknown_factory_and_mode_rejected():
+    with pytest.raises(ValueError):
+        qr_render.make_image("factory", factory='svg')
+    with pytest.raises(ValueError):
+        qr_render.make_image("factory", mode='CMYK', factory='numpy')
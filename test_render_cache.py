@@ -0,0 +1,67 @@
+import pytest
+from render_cache import RenderCache, make_key
+from app import app, render_cache
+
+def test_lru_eviction_is_byte_bounded():
+    cache = RenderCache(max_bytes=10)
+    cache.put('a', b'1234')
+    cache.put('b', b'1234')
+    assert cache.get('a') == b'1234'  # 'a' becomes most recently used
+    cache.put('c', b'1234')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == b'1234'
+    assert cache.get('c') == b'1234'
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['bytes'] == 8
+    assert (stats['hits'], stats['misses']) == (3, 1)
+
+def test_oversized_values_are_not_kept_in_memory():
+    cache = RenderCache(max_bytes=4)
+    cache.put('big', b'12345')
+    assert cache.get('big') is None
+    assert cache.stats()['entries'] == 0
+
+def test_disk_tier_survives_restart(tmp_path):
+    RenderCache(disk_dir=str(tmp_path)).put('key', b'png-bytes')
+
+    restarted = RenderCache(disk_dir=str(tmp_path))
+    assert restarted.get('key') == b'png-bytes'
+    assert restarted.stats()['disk_hits'] == 1
+    assert restarted.get('key') == b'png-bytes'
+    assert restarted.stats()['hits'] == 1
+
+def test_disk_tier_is_bounded(tmp_path):
+    cache = RenderCache(disk_dir=str(tmp_path), disk_max_bytes=25)
+    for i in range(5):
+        cache.put(f'key{i}', b'0123456789')
+    assert cache.stats()['disk_bytes'] <= 25
+    assert cache.stats()['disk_evictions'] > 0
+
+def test_sizeof_bounds_non_bytes_values(tmp_path):
+    cache = RenderCache(max_bytes=100, sizeof=lambda value: value['size'])
+    for i in range(3):
+        cache.put(f'key{i}', {'size': 40})
+    assert cache.get('key0') is None
+    assert cache.get('key2') == {'size': 40}
+    assert cache.stats()['bytes'] == 80
+    with pytest.raises(ValueError):
+        RenderCache(disk_dir=str(tmp_path), sizeof=lambda value: 1)
+
+def test_make_key_depends_on_every_part():
+    assert make_key('a', 'b') == make_key('a', 'b')
+    assert make_key('a', 'b') != make_key('a', 'c')
+    assert make_key('ab', '') != make_key('a', 'b')
+
+def test_generate_secure_qr_served_from_cache():
+    client = app.test_client()
+    render_cache.clear()
+    payload = {'text': 'cache me', 'security_code': 'a1b2c3'}
+
+    first = client.post('/generate_secure_qr', json=payload).get_json()
+    hits_before = client.get('/cache_stats').get_json()['hits']
+    second = client.post('/generate_secure_qr', json=payload).get_json()
+
+    assert first == second
+    assert client.get('/cache_stats').get_json()['hits'] == hits_before + 1
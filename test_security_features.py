@@ -1,5 +1,6 @@
 import pytest
 from app import create_secure_qr, add_security_features
+from pattern_detector import band_counts, detect_pattern
 from PIL import Image
 import io
 import os
@@ -46,32 +47,8 @@ def test_output_dir():
 
 def analyze_qr_image(image):
     """Analyze QR code image for security features"""
-    if image.mode != 'RGB':
-        image = image.convert('RGB')
-    
     width, height = image.size
-    pixels = image.load()
-    
-    # Initialize counters
-    pixel_ranges = {
-        'black': 0,  # < 50
-        'pattern': 0,  # 130-190
-        'density': 0,  # 220-240
-        'white': 0  # > 240
-    }
-    
-    # Count pixels in each range
-    for y in range(height):
-        for x in range(width):
-            r, g, b = pixels[x, y]
-            if r < 50:
-                pixel_ranges['black'] += 1
-            elif 130 <= r <= 190:
-                pixel_ranges['pattern'] += 1
-            elif 220 <= r <= 240:
-                pixel_ranges['density'] += 1
-            elif r > 240:
-                pixel_ranges['white'] += 1
+    pixel_ranges = band_counts(image)
     
     total_pixels = width * height
     return {
@@ -82,47 +59,10 @@ def analyze_qr_image(image):
 
 def detect_pattern_type(image, expected_intensity):
     """Detect the type of security pattern in the image"""
-    if image.mode != 'RGB':
-        image = image.convert('RGB')
-    
-    width, height = image.size
-    pixels = image.load()
-    
-    # Define pattern templates
-    patterns = {
-        'X': [(0,0), (0,4), (1,1), (1,3), (2,2), (3,1), (3,3), (4,0), (4,4)],
-        '+': [(0,2), (1,2), (2,0), (2,1), (2,2), (2,3), (2,4), (3,2), (4,2)],
-        '9-dot': [(0,0), (0,2), (0,4), (2,0), (2,2), (2,4), (4,0), (4,2), (4,4)],
-        'diamond': [(0,1), (0,3), (1,0), (1,4), (2,2), (3,0), (3,4), (4,1), (4,3)]
-    }
-    
-    pattern_matches = {k: 0 for k in patterns.keys()}
-    pattern_size = 5
-    pattern_spacing = 20
-    
-    # Scan for patterns
-    for base_y in range(pattern_size, height - pattern_size, pattern_spacing):
-        for base_x in range(pattern_size, width - pattern_size, pattern_spacing):
-            # Check each pattern template
-            for pattern_name, template in patterns.items():
-                matches = 0
-                total_points = len(template)
-                
-                for px, py in template:
-                    x = base_x + px
-                    y = base_y + py
-                    if 0 <= x < width and 0 <= y < height:
-                        r, g, b = pixels[x, y]
-                        if abs(r - expected_intensity) <= 15:  # Allow some variation
-                            matches += 1
-                
-                if matches/total_points > 0.7:  # 70% match threshold
-                    pattern_matches[pattern_name] += 1
-    
-    # Return the most frequently detected pattern
-    if any(pattern_matches.values()):
-        return max(pattern_matches.items(), key=lambda x: x[1])[0]
-    return None
+    detection = detect_pattern(image)
+    if detection.style_name is None or abs(detection.intensity - expected_intensity) > 15:  # Allow some variation
+        return None
+    return detection.style_name
 
 @pytest.mark.parametrize("test_case", TEST_CASES)
 def test_qr_generation(test_case, test_output_dir):
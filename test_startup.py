@@ -0,0 +1,52 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+import app
+import feature_engine
+
+# Imported by every worker anyway; budgets cover what the modules add on top
+FRAMEWORK = ['flask', 'flask_cors', 'numpy', 'qrcode', 'PIL.Image']
+
+# Own import time per module, several times the measured cost to absorb CI noise
+IMPORT_BUDGET_SECONDS = {'app': 0.1, 'qr_generator': 0.1}
+
+# Modules only needed by rarely used endpoints, methods or flags
+DEFERRED = {
+    'app': ['job_queue', 'sqlite3', 'pattern_detector', 'vector_render', 'verifier', 'PIL.ImageDraw', 'matplotlib'],
+    'qr_generator': ['verifier', 'vector_render', 'PIL.ImageDraw', 'PIL.ImageFilter', 'matplotlib'],
+}
+
+MEASURE = """
+import importlib, json, sys, time
+for name in {framework!r}:
+    importlib.import_module(name)
+started = time.perf_counter()
+importlib.import_module({module!r})
+print(json.dumps({{'seconds': time.perf_counter() - started, 'modules': sorted(sys.modules)}}))
+"""
+
+def measure_import(module):
+    """Import ``module`` in a fresh interpreter and return (seconds, loaded module names)"""
+    env = {name: value for name, value in os.environ.items() if name != 'PYTHONDONTWRITEBYTECODE'}
+    code = MEASURE.format(framework=FRAMEWORK, module=module)
+    output = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                            check=True, capture_output=True, text=True).stdout
+    result = json.loads(output.splitlines()[-1])
+    return result['seconds'], set(result['modules'])
+
+@pytest.mark.parametrize("module", sorted(IMPORT_BUDGET_SECONDS))
+def test_import_time_budget(module):
+    # The first run may compile bytecode; the fastest of three is the steady state
+    runs = [measure_import(module) for _ in range(3)]
+    seconds = min(seconds for seconds, _ in runs)
+    assert seconds < IMPORT_BUDGET_SECONDS[module], f"import {module} took {seconds * 1000:.0f}ms"
+    loaded = runs[-1][1]
+    assert [name for name in DEFERRED[module] if name in loaded] == []
+
+def test_warm_up_builds_lazy_tables():
+    feature_engine.clear_tables()
+    app.warm_up()
+    assert feature_engine.micropattern_layout.cache_info().currsize == 1
+    assert feature_engine.density_modulation.cache_info().currsize == 1
@@ -0,0 +1,85 @@
+import re
+import zlib
+import xml.etree.ElementTree as ET
+import numpy as np
+import pytest
+import vector_render
+from app import VECTOR_FORMATS, app, create_secure_qr
+from media_types import PDF_MIMETYPE, SVG_MIMETYPE
+from qr_generator import MiniSecureQRGenerator
+
+def rasterize(label, background=255):
+    grey = np.full((label.height, label.width), background, dtype=np.uint8)
+    for level, rects in label.layers:
+        for x, y, w, h in rects:
+            grey[y:y + h, x:x + w] = level
+    return grey
+
+def images():
+    return {
+        'app': create_secure_qr("12345", "a1b2c3"),
+        'generator': MiniSecureQRGenerator().generate_all_variants("Hello World", "SEC123")['density_variation'][0],
+    }
+
+@pytest.mark.parametrize("name", images())
+def test_vectorize_is_pixel_exact(name):
+    image = images()[name]
+    label = vector_render.vectorize(image)
+    assert np.array_equal(rasterize(label), np.asarray(image.convert('L')))
+    # Runs are merged, so there are far fewer rectangles than dark pixels
+    dark = np.count_nonzero(np.asarray(image.convert('L')) != 255)
+    assert sum(len(rects) for _, rects in label.layers) < dark / 4
+
+def test_svg_document():
+    label = vector_render.vectorize(images()['app'])
+    root = ET.fromstring(vector_render.to_svg(label, 20))
+    assert root.get('width') == '20mm'
+    assert root.get('viewBox') == f'0 0 {label.width} {label.height}'
+    paths = root.findall('{http://www.w3.org/2000/svg}path')
+    assert len(paths) == len(label.layers)
+    assert sum(path.get('d').count('z') for path in paths) == sum(len(rects) for _, rects in label.layers)
+
+def test_pdf_document_structure():
+    label = vector_render.vectorize(images()['app'])
+    pdf = vector_render.to_pdf(label, 20)
+    assert pdf.startswith(b'%PDF-1.4')
+    assert pdf.rstrip().endswith(b'%%EOF')
+
+    startxref = int(re.search(rb'startxref\n(\d+)', pdf).group(1))
+    assert pdf[startxref:].startswith(b'xref')
+    offsets = [int(entry) for entry in re.findall(rb'(\d{10}) 00000 n', pdf[startxref:])]
+    for number, offset in enumerate(offsets, start=1):
+        assert pdf[offset:].startswith(f'{number} 0 obj'.encode())
+
+    media_box = re.search(rb'/MediaBox \[0 0 ([\d.]+) ([\d.]+)\]', pdf)
+    assert float(media_box.group(1)) == pytest.approx(20 * 72 / 25.4, abs=0.01)
+    stream = re.search(rb'stream\n(.*?)\nendstream', pdf, re.S).group(1)
+    content = zlib.decompress(stream)
+    assert content.count(b' re') == sum(len(rects) for _, rects in label.layers)
+
+def test_vector_output_is_deterministic_per_code():
+    generator = MiniSecureQRGenerator()
+    first = generator.render_vector("Hello World", "SEC123", 'micropattern', 'pdf')
+    assert generator.render_vector("Hello World", "SEC123", 'micropattern', 'pdf') == first
+    assert generator.render_vector("Hello World", "SEC124", 'micropattern', 'pdf') != first
+    svg = generator.render_vector("Hello World", "SEC123", 'density_variation')
+    assert ET.fromstring(svg).get('width') == '20mm'
+    with pytest.raises(ValueError):
+        generator.render_vector("Hello World", "SEC123", 'hologram')
+
+def test_parse_size_mm():
+    assert vector_render.parse_size_mm("20mm x 20mm") == (20.0, 20.0)
+    assert vector_render.parse_size_mm("25.5 x 30 mm") == (25.5, 30.0)
+    assert vector_render.parse_size_mm("18mm") == (18.0, 18.0)
+    with pytest.raises(ValueError):
+        vector_render.parse_size_mm("small")
+
+@pytest.mark.parametrize("mimetype, signature", [('image/svg+xml', b'<svg'), ('application/pdf', b'%PDF')])
+def test_generate_secure_qr_vector_negotiation(mimetype, signature):
+    response = app.test_client().post('/generate_secure_qr', json={'text': 'vector', 'security_code': 'a1b2c3'},
+                                      headers={'Accept': mimetype})
+    assert response.mimetype == mimetype
+    assert response.data.startswith(signature)
+
+def test_app_vector_formats_match_media_types():
+    assert VECTOR_FORMATS == {SVG_MIMETYPE: 'svg', PDF_MIMETYPE: 'pdf'}
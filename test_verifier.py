@@ -0,0 +1,71 @@
+import pytest
+from PIL import Image
+import verifier
+from qr_generator import MiniSecureQRGenerator
+
+@pytest.fixture(scope="module")
+def variants():
+    return MiniSecureQRGenerator().generate_all_variants("Hello World", "SEC123")
+
+@pytest.mark.parametrize("feature_type", verifier.FEATURE_TYPES)
+def test_genuine_scan_verifies(variants, feature_type):
+    result = verifier.verify_image(variants[feature_type][0], feature_type, "SEC123")
+    assert result.verified
+    assert result.score > 0.9
+
+@pytest.mark.parametrize("feature_type", verifier.FEATURE_TYPES)
+def test_wrong_code_rejected(variants, feature_type):
+    result = verifier.verify_image(variants[feature_type][0], feature_type, "SEC999")
+    assert not result.verified
+
+@pytest.mark.parametrize("angle", [90, 180, 270])
+@pytest.mark.parametrize("feature_type", verifier.FEATURE_TYPES)
+def test_rotated_and_scaled_scans_verify(variants, feature_type, angle):
+    image = variants[feature_type][0].rotate(angle, expand=True)
+    image = image.resize((image.width * 2, image.height * 2), Image.NEAREST)
+    padded = Image.new('RGB', (image.width + 40, image.height + 25), 'white')
+    padded.paste(image, (13, 21))
+    assert verifier.verify_image(padded, feature_type, "SEC123").verified
+
+@pytest.mark.parametrize("feature_type", verifier.FEATURE_TYPES)
+def test_large_scan_verifies_quickly(variants, feature_type):
+    # A 20mm label scanned at about 3000 DPI
+    image = variants[feature_type][0]
+    image = image.resize((image.width * 7, image.height * 7), Image.NEAREST)
+    scan = Image.new('L', (image.width + 40, image.height + 30), 255)
+    scan.paste(image, (17, 11))
+    results = [verifier.verify_image(scan, feature_type, "SEC123") for _ in range(3)]
+    assert all(result.verified for result in results)
+    assert min(result.elapsed_ms for result in results) < 50
+
+def test_large_versions_are_located():
+    image = MiniSecureQRGenerator().generate_all_variants("x" * 200, "SEC123")['micropattern'][0]
+    scan = image.resize((image.width * 3, image.height * 3), Image.NEAREST)
+    location = verifier.locate_symbol(scan)
+    assert (location.x0, location.y0, location.width, location.modules) == (48, 48, 81 * 24, 81)
+    assert verifier.verify_image(scan, 'micropattern', "SEC123").verified
+
+def test_plain_qr_and_blank_image_rejected():
+    generator = MiniSecureQRGenerator()
+    plain = generator._create_base_qr({"main_text": "Hello World", "security_code": "SEC123"})
+    assert not verifier.verify_image(plain, 'micropattern', "SEC123").verified
+    blank = verifier.verify_image(Image.new('L', (200, 200), 255), 'micropattern', "SEC123")
+    assert (blank.verified, blank.message) == (False, "No QR code found")
+
+def test_verify_security_feature_uses_verifier(tmp_path, variants):
+    path = str(tmp_path / "scan.png")
+    variants['density_variation'][0].save(path)
+    assert MiniSecureQRGenerator.verify_security_feature(path, 'density_variation', "SEC123") == (
+        True, "Density variation verified")
+    assert not MiniSecureQRGenerator.verify_security_feature(path, 'density_variation', "SEC999")[0]
+    assert MiniSecureQRGenerator.verify_security_feature(path, 'hologram', "SEC123") == (
+        False, "Unknown security feature type")
+
+def test_verify_directory(tmp_path, variants):
+    variants['micropattern'][0].save(str(tmp_path / "a.png"))
+    variants['micropattern'][0].save(str(tmp_path / "b.png"))
+    (tmp_path / "notes.txt").write_text("not a scan")
+
+    results = list(verifier.verify_directory(str(tmp_path), {"a.png": "SEC123", "b.png": "SEC999"}, 'micropattern'))
+    assert [(r.path.endswith("a.png"), r.verified) for r in results] == [(True, True), (False, False)]
+    assert all(r.elapsed_ms < 1000 for r in results)
@@ -0,0 +1,174 @@
+"""Vector (SVG/PDF) output for secure QR codes at any print resolution.
+
+A rendered secure code is a grid of flat grey pixels: QR modules, stamp dots
+and density cells. ``vectorize`` merges equal-grey pixels into horizontal
+runs, then merges runs with the same extent on consecutive rows into
+rectangles. Each grey level becomes one path. The document is a
+pixel-exact copy of the raster path, deterministic from the security code,
+and printers scale it to any DPI without resampling.
+
+``PDFWriter`` writes pages as they are added and keeps only object offsets,
+so multi-page sheets stream in bounded memory.
+"""
+import io
+import re
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+MM_PER_INCH = 25.4
+POINTS_PER_INCH = 72
+PRINT_SIZE_MM = 20.0  # Default label size from the print instructions
+
+# ``layers`` holds one (grey level, rects) pair per level, rects as rows of x, y, width, height
+VectorLabel = namedtuple('VectorLabel', 'width height layers')
+
+
+def mm_to_points(mm):
+    return mm * POINTS_PER_INCH / MM_PER_INCH
+
+
+def parse_size_mm(size):
+    """Parse a size such as SecurityFeature.recommended_size ("20mm x 20mm") into millimetres"""
+    numbers = re.findall(r'\d+(?:\.\d+)?', size)
+    if len(numbers) == 1:
+        numbers *= 2
+    if len(numbers) != 2:
+        raise ValueError(f"Unrecognized size: {size}")
+    return float(numbers[0]), float(numbers[1])
+
+
+def vectorize(image, background=255):
+    """Merge the image's grey pixels into rectangles, skipping the background level"""
+    grey = np.asarray(image.convert('L') if image.mode != 'L' else image)
+    height, width = grey.shape
+
+    # Horizontal runs: a run starts at column 0 and wherever the level changes
+    starts = np.ones((height, width), dtype=bool)
+    starts[:, 1:] = grey[:, 1:] != grey[:, :-1]
+    flat_starts = np.flatnonzero(starts)
+    flat_ends = np.append(flat_starts[1:], height * width)
+    ys, x0s = np.divmod(flat_starts, width)
+    end_ys, end_xs = np.divmod(flat_ends, width)
+    x1s = np.where(end_ys == ys, end_xs, width)
+    levels = grey[ys, x0s]
+    keep = levels != background
+    ys, x0s, x1s, levels = ys[keep], x0s[keep], x1s[keep], levels[keep]
+
+    # Vertical merge: identical runs on consecutive rows form one rectangle
+    order = np.lexsort((ys, x1s, x0s, levels))
+    ys, x0s, x1s, levels = ys[order], x0s[order], x1s[order], levels[order]
+    new_rect = np.ones(len(ys), dtype=bool)
+    new_rect[1:] = ((levels[1:] != levels[:-1]) | (x0s[1:] != x0s[:-1]) | (x1s[1:] != x1s[:-1])
+                    | (ys[1:] != ys[:-1] + 1))
+    first = np.flatnonzero(new_rect)
+    heights = np.diff(np.append(first, len(ys)))
+    rects = np.column_stack((x0s[first], ys[first], x1s[first] - x0s[first], heights))
+    rect_levels = levels[first]
+
+    layers = []
+    for level in np.unique(rect_levels):
+        layers.append((int(level), rects[rect_levels == level]))
+    return VectorLabel(width, height, tuple(layers))
+
+
+def _grey_hex(level):
+    return f'#{level:02x}{level:02x}{level:02x}'
+
+
+def _svg_path(rects):
+    """Path data with each rectangle placed by a relative move from the previous one"""
+    rects = rects[np.lexsort((rects[:, 0], rects[:, 1]))]
+    moves = rects[:, :2].copy()
+    moves[1:] -= rects[:-1, :2]
+    commands = [f'M{moves[0, 0]} {moves[0, 1]}'] if len(rects) else []
+    commands.extend(f'm{dx} {dy}' for dx, dy in moves[1:].tolist())
+    return ''.join(f'{move}h{w}v{h}h-{w}z' for move, (w, h) in zip(commands, rects[:, 2:].tolist()))
+
+
+def to_svg(label, width_mm=PRINT_SIZE_MM, height_mm=None):
+    """Render a vectorized label as a standalone SVG document"""
+    height_mm = width_mm * label.height / label.width if height_mm is None else height_mm
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width_mm:g}mm" height="{height_mm:g}mm" '
+        f'viewBox="0 0 {label.width} {label.height}" shape-rendering="crispEdges">',
+        f'<rect width="{label.width}" height="{label.height}" fill="#fff"/>',
+    ]
+    for level, rects in label.layers:
+        parts.append(f'<path fill="{_grey_hex(level)}" d="{_svg_path(rects)}"/>')
+    parts.append('</svg>')
+    return '\n'.join(parts).encode()
+
+
+def pdf_label_content(label, x_pt, y_pt, width_pt, height_pt):
+    """PDF content stream operators drawing a label with its top-left corner at (x_pt, y_pt).
+
+    ``y_pt`` is measured from the top of the page's coordinate space after the
+    caller's own transform; page coordinates in PDF grow upwards.
+    """
+    scale_x = width_pt / label.width
+    scale_y = height_pt / label.height
+    lines = [f'q {scale_x:.6f} 0 0 {-scale_y:.6f} {x_pt:.3f} {y_pt:.3f} cm']
+    for level, rects in label.layers:
+        lines.append(f'{level / 255:.4f} g')
+        lines.extend(f'{x} {y} {w} {h} re' for x, y, w, h in rects.tolist())
+        lines.append('f')
+    lines.append('Q')
+    return '\n'.join(lines).encode() + b'\n'
+
+
+class PDFWriter:
+    """Minimal PDF writer that streams each page to ``stream`` as it is added"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._position = 0
+        self._offsets = {}
+        self._pages = []
+        self._next_object = 3  # 1 is the catalog, 2 the page tree; both written on close
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _write(self, data):
+        self._stream.write(data)
+        self._position += len(data)
+
+    def _object(self, body, number=None):
+        if number is None:
+            number = self._next_object
+            self._next_object += 1
+        self._offsets[number] = self._position
+        self._write(f'{number} 0 obj\n'.encode() + body + b'\nendobj\n')
+        return number
+
+    def add_page(self, width_pt, height_pt, content):
+        """Write one page whose content stream draws in points from the bottom left"""
+        compressed = zlib.compress(content)
+        stream = self._object(f'<< /Length {len(compressed)} /Filter /FlateDecode >>\nstream\n'.encode()
+                              + compressed + b'\nendstream')
+        page = self._object(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt:.3f} {height_pt:.3f}] '
+                            f'/Contents {stream} 0 R /Resources << >> >>'.encode())
+        self._pages.append(page)
+
+    def close(self):
+        """Write the page tree, catalog, cross-reference table and trailer"""
+        kids = ' '.join(f'{page} 0 R' for page in self._pages)
+        self._object(f'<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>'.encode(), 2)
+        self._object(b'<< /Type /Catalog /Pages 2 0 R >>', 1)
+        xref = self._position
+        count = self._next_object
+        entries = [b'0000000000 65535 f \n']
+        entries.extend(f'{self._offsets[number]:010d} 00000 n \n'.encode() for number in range(1, count))
+        self._write(f'xref\n0 {count}\n'.encode() + b''.join(entries))
+        self._write(f'trailer\n<< /Size {count} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode())
+
+
+def to_pdf(label, width_mm=PRINT_SIZE_MM, height_mm=None):
+    """Render a vectorized label as a single-page PDF sized to the label"""
+    height_mm = width_mm * label.height / label.width if height_mm is None else height_mm
+    width_pt, height_pt = mm_to_points(width_mm), mm_to_points(height_mm)
+    buffered = io.BytesIO()
+    writer = PDFWriter(buffered)
+    writer.add_page(width_pt, height_pt, pdf_label_content(label, 0, height_pt, width_pt, height_pt))
+    writer.close()
+    return buffered.getvalue()
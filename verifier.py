@@ -0,0 +1,443 @@
+"""Server-side verification of MiniSecureQRGenerator security features.
+
+A scan is thresholded, the QR symbol is located from its finder patterns and
+timing pattern, rotated upright and resampled onto the canonical grid the
+generator renders (box size 8, border 2). The dot mask the security code
+predicts for that grid is then compared with the dark pixels found on light
+modules: a genuine print shows dark pixels exactly where the code places dots
+and nowhere else, while copies and forgeries lose or scramble them.
+
+The symbol is located on a reduced copy of the scan and only its edges and the
+canonical grid are read at full resolution, so large scans cost little more
+than small ones. Scans are expected to be square to the symbol: quarter turns
+are detected, but skew is not corrected. Dots are a single canonical pixel, so
+even a fraction of a degree of skew moves the far side of a large symbol off
+its dots; deskew photos before verifying them.
+"""
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+# Geometry used by MiniSecureQRGenerator._create_base_qr
+CANONICAL_BOX_SIZE = 8
+CANONICAL_BORDER = 2
+
+DARK_LEVEL = 128  # Grey levels below this count as dark
+SCORE_THRESHOLD = 0.6  # Minimum hit rate minus background rate to pass
+MIN_MODULE_PIXELS = 1.5  # Smaller modules cannot carry the dot patterns
+LOCATE_SIZE = 256  # Scans are reduced to about this many pixels across to locate the symbol
+MIN_LOCATE_MODULE = 3  # Reduce less when modules come out smaller than this
+LOCATE_CONFIDENCE = 0.9  # ... or when the best grid found matches finders and timing worse than this
+
+FEATURE_TYPES = ('micropattern', 'density_variation')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.webp')
+
+# 7x7 finder pattern: dark ring, light ring, dark 3x3 centre
+FINDER = np.zeros((7, 7), dtype=bool)
+FINDER[[0, 6], :] = True
+FINDER[:, [0, 6]] = True
+FINDER[2:5, 2:5] = True
+
+# Rotations (np.rot90 counter-clockwise turns) that move the corner without a
+# finder pattern to the bottom right
+_UPRIGHT_TURNS = {'br': 0, 'bl': 1, 'tl': 2, 'tr': 3}
+# The same counter-clockwise turns applied to a PIL image
+_TRANSPOSES = {1: Image.Transpose.ROTATE_90, 2: Image.Transpose.ROTATE_180, 3: Image.Transpose.ROTATE_270}
+
+
+@dataclass
+class SymbolLocation:
+    x0: int
+    y0: int
+    width: int
+    height: int
+    modules: int
+    turns: int
+    confidence: float
+    kernel: int
+
+
+@dataclass
+class VerificationResult:
+    feature_type: str
+    verified: bool
+    score: float
+    hit_rate: float
+    background_rate: float
+    elapsed_ms: float
+    message: str
+    path: Optional[str] = None
+
+
+@dataclass
+class ScanReport:
+    """Results of every requested feature for one scan, decoded once"""
+    path: str
+    security_code: str
+    results: Tuple[VerificationResult, ...]
+    decode_ms: float
+    elapsed_ms: float
+    error: Optional[str] = None
+
+    @property
+    def verified(self) -> bool:
+        return self.error is None and all(result.verified for result in self.results)
+
+
+def _grey_image(image: Union[str, Image.Image]) -> Image.Image:
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    if image.mode == 'RGBA' and image.getchannel('A').getextrema()[0] == 255:
+        return image.convert('L')
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # Flatten transparency onto white so transparent areas read as light
+        rgba = image.convert('RGBA')
+        background = Image.new('RGBA', rgba.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, rgba)
+    return image if image.mode == 'L' else image.convert('L')
+
+
+def _majority(dark: np.ndarray, size: int = 3) -> np.ndarray:
+    """Keep pixels whose size x size neighbourhood is mostly dark, removing isolated dots"""
+    # A box blur of the 0/255 map is the neighbourhood vote, computed in C
+    votes = Image.fromarray(dark.view(np.uint8) * np.uint8(255), 'L').filter(ImageFilter.BoxBlur(size // 2))
+    return np.asarray(votes) >= 128
+
+
+def _cleaning_kernel(module_pixels: float) -> int:
+    """Odd majority window of about half a module: wider than any dot, narrower than a module"""
+    return max(3, int(module_pixels / 2) // 2 * 2 + 1)
+
+
+def _bounds(solid: np.ndarray, min_count: Optional[float] = None) -> Optional[Tuple[int, int, int, int]]:
+    """Bounding box of rows and columns carrying at least ``min_count`` dark pixels"""
+    height, width = solid.shape
+    columns = np.flatnonzero(solid.sum(axis=0) >= (min_count or max(3, 0.02 * height)))
+    rows = np.flatnonzero(solid.sum(axis=1) >= (min_count or max(3, 0.02 * width)))
+    if not len(columns) or not len(rows):
+        return None
+    return columns[0], rows[0], columns[-1] + 1 - columns[0], rows[-1] + 1 - rows[0]
+
+
+def _finder_runs(solid: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Row, centre and module size of every dark-light-dark-light-dark run in 1:1:3:1:1 proportion along the rows"""
+    width = solid.shape[1] + 2
+    padded = np.zeros((solid.shape[0], width), dtype=bool)
+    padded[:, 1:-1] = solid
+    flat = padded.ravel()
+    # Rows are padded with light pixels, so dark runs never wrap onto the next row
+    starts = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    lengths = np.diff(starts)
+    first = np.flatnonzero(flat[starts[:-5]])
+    runs = lengths[first[:, None] + np.arange(5)]
+    unit = runs.sum(axis=1) / 7
+    proportions = np.array([1, 1, 3, 1, 1])
+    fits = (np.abs(runs - proportions * unit[:, None]) < proportions * unit[:, None] / 2).all(axis=1)
+    first, runs, unit = first[fits], runs[fits], unit[fits]
+    centres = starts[first] % width - 1 + runs[:, :2].sum(axis=1) + runs[:, 2] / 2
+    return starts[first] // width, centres, unit
+
+
+def _module_size(solid: np.ndarray) -> Optional[float]:
+    """Estimate the module size from the run lengths across the finder patterns.
+
+    Data modules also form 1:1:3:1:1 runs now and then, so only row runs
+    whose centre is crossed by a matching column run near the same point count.
+    """
+    rows, row_centres, units = _finder_runs(solid)
+    columns, column_centres, _ = _finder_runs(solid.T)
+    # Look up column runs by (column, centre row) and count those within reach of each row run's centre
+    stride = solid.shape[0] + 1
+    keys = np.sort(columns * stride + column_centres.astype(np.int64))
+    centres = row_centres.astype(np.int64) * stride + rows
+    reach = np.ceil(1.5 * units).astype(np.int64)
+    crossed = np.searchsorted(keys, centres + reach, 'right') > np.searchsorted(keys, centres - reach, 'left')
+    if crossed.sum() < 3:
+        return None
+    return float(np.median(units[crossed]))
+
+
+def _sample_modules(solid, x0, y0, width, height, modules):
+    """Read the module grid by sampling the centre of every module"""
+    centres_x = np.minimum((x0 + (np.arange(modules) + 0.5) * width / modules).astype(np.int64), solid.shape[1] - 1)
+    centres_y = np.minimum((y0 + (np.arange(modules) + 0.5) * height / modules).astype(np.int64), solid.shape[0] - 1)
+    return solid[centres_y[:, None], centres_x[None, :]]
+
+
+def _grid_score(grid: np.ndarray) -> Tuple[float, str]:
+    """Score how QR-like a module grid is and report the corner missing a finder"""
+    n = len(grid)
+    corners = {
+        'tl': grid[:7, :7],
+        'tr': grid[:7, n - 7:],
+        'bl': grid[n - 7:, :7],
+        'br': grid[n - 7:, n - 7:],
+    }
+    matches = {name: float(np.mean(block == FINDER)) for name, block in corners.items()}
+    missing = min(matches, key=matches.get)
+    finder_score = (sum(matches.values()) - matches[missing]) / 3
+
+    # Timing patterns run between the finders along row/column 6 of the upright symbol
+    upright = np.rot90(grid, _UPRIGHT_TURNS[missing])
+    expected = np.arange(8, n - 8) % 2 == 0
+    if len(expected):
+        timing_score = (np.mean(upright[6, 8:n - 8] == expected) + np.mean(upright[8:n - 8, 6] == expected)) / 2
+    else:
+        timing_score = 1.0
+    return (finder_score * 2 + timing_score) / 3, missing
+
+
+def _refine_edges(solid, x0, y0, width, height):
+    """Step each edge inwards past thin lines much weaker than their inner neighbour"""
+    columns = solid.sum(axis=0)
+    rows = solid.sum(axis=1)
+    left, right = x0, x0 + width - 1
+    top, bottom = y0, y0 + height - 1
+    while left < right and columns[left] < 0.5 * columns[left + 1]:
+        left += 1
+    while right > left and columns[right] < 0.5 * columns[right - 1]:
+        right -= 1
+    while top < bottom and rows[top] < 0.5 * rows[top + 1]:
+        top += 1
+    while bottom > top and rows[bottom] < 0.5 * rows[bottom - 1]:
+        bottom -= 1
+    return left, top, right + 1 - left, bottom + 1 - top
+
+
+def _reduce(grey: Image.Image, factor: int) -> np.ndarray:
+    """Dark map of the scan box-averaged by ``factor``; averaging also fades the dots"""
+    return np.asarray(grey.reduce(factor) if factor > 1 else grey) < DARK_LEVEL
+
+
+def locate_symbol(grey: Image.Image) -> Optional[SymbolLocation]:
+    """Find the QR symbol, its module count and the rotation that makes it upright.
+
+    The symbol is searched on a copy reduced to about LOCATE_SIZE pixels. The
+    finder patterns' run lengths give the module size, which sets the cleaning
+    window and leaves only a few candidate versions to score. The edges are
+    then placed on the full-resolution scan.
+    """
+    factor = max(1, min(grey.size) // LOCATE_SIZE)
+    best = None
+    while True:
+        location = _locate_reduced(_reduce(grey, factor), MIN_MODULE_PIXELS if factor == 1 else MIN_LOCATE_MODULE)
+        if location is not None and (best is None or location.confidence > best[0].confidence):
+            best = (location, factor)
+        # Modules too small to measure at this reduction, or merged into a poor grid: look again closer
+        if factor == 1 or (location is not None and location.confidence >= LOCATE_CONFIDENCE):
+            break
+        factor = max(1, factor // 2)
+    if best is None:
+        return None
+    location, factor = best
+    if factor > 1:
+        location = _refine_full(grey, location, factor)
+    return location
+
+
+def _locate_reduced(dark: np.ndarray, min_module: float) -> Optional[SymbolLocation]:
+    module = _module_size(_majority(dark))
+    if module is None or module < min_module:
+        return None
+    kernel = _cleaning_kernel(module)
+    solid = _majority(dark, kernel)
+    bounds = _bounds(solid)
+    if bounds is None:
+        return None
+    x0, y0, width, height = bounds
+
+    estimate = round((max(width, height) / module - 17) / 4)
+    best = None
+    for version in range(max(1, estimate - 3), min(40, estimate + 3) + 1):
+        modules = 17 + 4 * version
+        score, missing = _grid_score(_sample_modules(solid, x0, y0, width, height, modules))
+        if best is None or score > best[0]:
+            best = (score, modules, missing)
+    if best is None:
+        return None
+    score, modules, missing = best
+
+    # Dots touching the symbol can leave a few dark pixels just outside it.
+    # Every outer row and column of the symbol crosses two finder patterns, so
+    # tighten the box to lines holding at least half a finder edge.
+    refined = _bounds(solid, 3.5 * min(width, height) / modules)
+    if refined is not None:
+        x0, y0, width, height = _refine_edges(solid, *refined)
+    return SymbolLocation(int(x0), int(y0), int(width), int(height), modules, _UPRIGHT_TURNS[missing], score, kernel)
+
+
+def _refine_full(grey: Image.Image, location: SymbolLocation, factor: int) -> SymbolLocation:
+    """Scale a location found on a reduced scan and re-measure each edge at full resolution.
+
+    Each edge is put on the largest step in dark pixels per line within a band
+    a few reduced pixels wide, so the cost does not grow with the scan's area.
+    """
+    x0, y0 = location.x0 * factor, location.y0 * factor
+    x1, y1 = x0 + location.width * factor, y0 + location.height * factor
+    min_step = 3.5 * location.width * factor / location.modules  # Half a finder edge, as in _locate_reduced
+    margin = 2 * factor
+    width, height = grey.size
+
+    def edge(box, axis, rising, default):
+        left, top, right, bottom = max(0, box[0]), max(0, box[1]), min(width, box[2]), min(height, box[3])
+        counts = _majority(np.asarray(grey.crop((left, top, right, bottom))) < DARK_LEVEL).sum(axis=axis)
+        steps = np.diff(counts.astype(np.int64))
+        if not len(steps):
+            return default
+        line = int(np.argmax(steps) if rising else np.argmin(steps))
+        if abs(steps[line]) < min_step:
+            return default
+        return (left, top)[axis] + line + 1
+
+    left = edge((x0 - margin, y0, x0 + margin, y1), 0, True, x0)
+    right = edge((x1 - margin, y0, x1 + margin, y1), 0, False, x1)
+    top = edge((x0, y0 - margin, x1, y0 + margin), 1, True, y0)
+    bottom = edge((x0, y1 - margin, x1, y1 + margin), 1, False, y1)
+    return SymbolLocation(int(left), int(top), int(right - left), int(bottom - top), location.modules,
+                          location.turns, location.confidence, location.kernel)
+
+
+def _grid(location: SymbolLocation, box_size: int, border: int) -> Tuple[int, int, float, float]:
+    """Size, symbol offset and scan pixels per grid pixel of a resampling grid"""
+    return ((location.modules + 2 * border) * box_size, border * box_size,
+            location.width / (location.modules * box_size), location.height / (location.modules * box_size))
+
+
+def resample(grey: Image.Image, location: SymbolLocation, box_size: int = CANONICAL_BOX_SIZE,
+             border: int = CANONICAL_BORDER) -> Image.Image:
+    """Resample a located symbol upright onto a grid of ``box_size`` pixels per module and ``border`` modules.
+
+    Every grid pixel takes the scan pixel under its centre, done by PIL so only
+    the grid is read from the full scan. Pixels beyond the scan read as white.
+    """
+    size, offset, scale_x, scale_y = _grid(location, box_size, border)
+    sampled = grey.transform((size, size), Image.AFFINE,
+                             (scale_x, 0, location.x0 - offset * scale_x, 0, scale_y, location.y0 - offset * scale_y),
+                             resample=Image.NEAREST, fillcolor=255)
+    return sampled.transpose(_TRANSPOSES[location.turns]) if location.turns else sampled
+
+
+def normalize(grey: Image.Image, location: SymbolLocation) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Resample a located symbol onto the canonical grid.
+
+    Returns the upright dark map, a mask of pixels that lie inside the scan and
+    the canonical module matrix.
+    """
+    size, offset, scale_x, scale_y = _grid(location, CANONICAL_BOX_SIZE, CANONICAL_BORDER)
+    canonical = np.asarray(resample(grey, location)) < DARK_LEVEL
+    centres = np.arange(size) + 0.5 - offset
+    src_x = np.floor(location.x0 + centres * scale_x)
+    src_y = np.floor(location.y0 + centres * scale_y)
+    inside_x = (src_x >= 0) & (src_x < grey.width)
+    inside_y = (src_y >= 0) & (src_y < grey.height)
+    inside = np.rot90(inside_y[:, None] & inside_x[None, :], location.turns)
+
+    solid = _majority(canonical)
+    start = offset + CANONICAL_BOX_SIZE // 2
+    centres = np.arange(location.modules) * CANONICAL_BOX_SIZE + start
+    modules = solid[centres[:, None], centres[None, :]]
+    return canonical, inside, modules
+
+
+def _expected_mask(feature_type: str, size: int, security_code: str, pattern_mode: str) -> np.ndarray:
+    from qr_generator import MiniSecureQRGenerator
+    generator = MiniSecureQRGenerator(pattern_mode)
+    if feature_type == 'micropattern':
+        return generator._micropattern_mask(size, size, security_code)
+    return generator._density_mask(size, size, security_code)
+
+
+def verify_image(image: Union[str, Image.Image], feature_type: str, security_code: str,
+                 pattern_mode: str = 'compat') -> VerificationResult:
+    """Score one scan against the dot pattern predicted by the security code"""
+    started = time.perf_counter()
+    path = image if isinstance(image, str) else None
+
+    def result(verified, score, hit_rate, background_rate, message):
+        elapsed = (time.perf_counter() - started) * 1000
+        return VerificationResult(feature_type, verified, score, hit_rate, background_rate, elapsed, message, path)
+
+    if feature_type not in FEATURE_TYPES:
+        return result(False, 0.0, 0.0, 0.0, "Unknown security feature type")
+
+    grey = _grey_image(image)
+    location = locate_symbol(grey)
+    if location is None:
+        return result(False, 0.0, 0.0, 0.0, "No QR code found")
+    canonical, inside, modules = normalize(grey, location)
+
+    # Dots are only visible on light modules (including the quiet zone)
+    light = np.pad(~modules, CANONICAL_BORDER, constant_values=True)
+    light = light.repeat(CANONICAL_BOX_SIZE, axis=0).repeat(CANONICAL_BOX_SIZE, axis=1) & inside
+    expected = _expected_mask(feature_type, canonical.shape[0], security_code, pattern_mode)
+
+    expected_light = expected & light
+    background = ~expected & light
+    if not expected_light.any() or not background.any():
+        return result(False, 0.0, 0.0, 0.0, "Not enough light area to verify")
+    hit_rate = float(canonical[expected_light].mean())
+    background_rate = float(canonical[background].mean())
+    score = hit_rate - background_rate
+    name = "Micropattern" if feature_type == 'micropattern' else "Density variation"
+    if score >= SCORE_THRESHOLD:
+        return result(True, score, hit_rate, background_rate, f"{name} verified")
+    return result(False, score, hit_rate, background_rate, f"{name} does not match security code")
+
+
+def verify_directory(directory: str, security_code: Union[str, Dict[str, str]], feature_type: str,
+                     pattern_mode: str = 'compat') -> Iterator[VerificationResult]:
+    """Verify every image in a directory.
+
+    ``security_code`` is either one code for all scans or a mapping from file
+    name to code; files without a code in the mapping are skipped.
+    """
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        code = security_code.get(name) if isinstance(security_code, dict) else security_code
+        if code is None:
+            continue
+        path = os.path.join(directory, name)
+        try:
+            yield verify_image(path, feature_type, code, pattern_mode)
+        except Exception as e:
+            yield VerificationResult(feature_type, False, 0.0, 0.0, 0.0, 0.0, str(e), path)
+
+
+def iter_scans(directory: str, recursive: bool = True) -> Iterator[str]:
+    """Yield image paths under a directory, relative to it, in a stable order"""
+    for root, directories, names in os.walk(directory):
+        directories.sort()
+        if not recursive:
+            directories.clear()
+        for name in sorted(names):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.relpath(os.path.join(root, name), directory)
+
+
+def decode_scan(path: str) -> Image.Image:
+    """Decode a scan file to greyscale; JPEGs decode straight to one channel"""
+    image = Image.open(path)
+    if image.format == 'JPEG':
+        image.draft('L', image.size)
+    image = _grey_image(image)
+    image.load()
+    return image
+
+
+def verify_scan(path: str, security_code: str, feature_types: Iterable[str] = FEATURE_TYPES,
+                pattern_mode: str = 'compat') -> ScanReport:
+    """Decode a scan once and verify each feature type on it"""
+    started = time.perf_counter()
+    try:
+        image = decode_scan(path)
+    except Exception as e:
+        elapsed = (time.perf_counter() - started) * 1000
+        return ScanReport(path, security_code, (), elapsed, elapsed, str(e))
+    decode_ms = (time.perf_counter() - started) * 1000
+    results = tuple(verify_image(image, feature_type, security_code, pattern_mode) for feature_type in feature_types)
+    return ScanReport(path, security_code, results, decode_ms, (time.perf_counter() - started) * 1000)